@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# ajuste_concurrencia.py implementa el modo de concurrencia "auto" de servidor.py y del pool persistente:
+#   - elegir_configuracion() mira el lote (tareas en que se puede repartir y bytes) y los núcleos y elige modo y
+#     workers: secuencial si no hay nada que repartir (un núcleo, o un solo archivo que no se segmenta), thread si el lote es
+#     tan pequeño que arrancar y alimentar procesos cuesta más de lo que se gana, y process en el resto de casos;
+#   - AjustadorWorkers sigue ajustando durante la ejecución cuántas tareas trabajan a la vez: mide las filas/s de cada
+#     ventana y prueba un worker más o menos (hill climbing), quedándose con el cambio solo si mejora la tasa.
+# Las extracciones son CPU-bound (las regex retienen el GIL), así que el techo de workers es el número de núcleos.
+import asyncio, math, os, time
+
+MODO_AUTO = "auto"
+MODOS_CONCURRENCIA = ("thread", "process", "sequential_visual", MODO_AUTO)
+BYTES_MINIMOS_PROCESOS = 4 * 1024 * 1024  # Con menos bytes en el lote no compensa repartir entre procesos.
+VENTANA_AJUSTE_S = 1.0  # Duración mínima de cada medición de filas/s.
+FILAS_MINIMAS_VENTANA = 4  # Una ventana con menos filas no se evalúa (tasa demasiado ruidosa).
+MEJORA_MINIMA = 0.05  # Un cambio de workers se conserva solo si la tasa mejora al menos un 5%.
+VENTANAS_EN_PAUSA = 3  # Tras una prueba fallida, ventanas sin probar otro cambio.
+MAX_AJUSTES_EN_RESUMEN = 50
+
+
+#estimar_tareas() cuenta las tareas en que se puede repartir el lote si los archivos grandes se dividen en segmentos
+#(ver servidor.planificar_segmentos()).
+def estimar_tareas(tamanos: list, umbral_segmentacion_bytes: int, tamano_segmento_bytes: int) -> int:
+    tareas = 0
+    for tamano in tamanos:
+        if tamano_segmento_bytes > 0 and tamano > umbral_segmentacion_bytes:
+            tareas += math.ceil(tamano / tamano_segmento_bytes)
+        else:
+            tareas += 1
+    return tareas
+
+
+#elegir_configuracion() retorna {"modo", "workers", "motivo"} para un lote de num_tareas tareas (ver estimar_tareas())
+#y bytes_totales bytes; max_workers acota los workers (None: tantos como núcleos).
+def elegir_configuracion(num_tareas: int, bytes_totales: int, nucleos: int = None, max_workers: int = None) -> dict:
+    nucleos = nucleos or os.cpu_count() or 1
+    tope = min(nucleos, max_workers) if max_workers else nucleos
+    if tope <= 1:
+        return {"modo": "sequential_visual", "workers": 1, "motivo": "un solo núcleo (o worker) disponible"}
+    if num_tareas <= 1:
+        return {"modo": "sequential_visual", "workers": 1, "motivo": "una sola tarea, nada que repartir"}
+    if bytes_totales < BYTES_MINIMOS_PROCESOS:
+        return {"modo": "thread", "workers": min(tope, num_tareas),
+                "motivo": f"lote pequeño ({bytes_totales} bytes): procesos no compensan"}
+    return {"modo": "process", "workers": min(tope, num_tareas),
+            "motivo": f"{num_tareas} tareas y {bytes_totales} bytes repartidos en {min(tope, num_tareas)} núcleos"}
+
+
+class AjustadorWorkers:
+    """
+    Ajuste de paralelismo por hill climbing sobre filas/s. limite es cuántas tareas deben estar en curso a la vez;
+    quien reparte el trabajo lo consulta antes de lanzar cada tarea y llama a registrar() con cada fila terminada.
+    Empieza en el máximo (lo habitual para trabajo CPU-bound) y prueba a bajar; si una prueba no mejora la tasa
+    vuelve al valor anterior, invierte la dirección y espera unas ventanas antes de probar de nuevo.
+    """
+
+    def __init__(self, maximo: int, minimo: int = 1, inicial: int = None, ventana_s: float = VENTANA_AJUSTE_S):
+        self.maximo = max(1, maximo)
+        self.minimo = max(1, min(minimo, self.maximo))
+        self.limite = min(self.maximo, max(self.minimo, inicial or self.maximo))
+        self.inicial = self.limite
+        self.ventana_s = ventana_s
+        self.ajustes = []  # Cada cambio de limite: {"seconds", "workers", "rows_per_second"}.
+        self._t0 = time.perf_counter()
+        self._inicio_ventana = self._t0
+        self._filas_ventana = 0
+        self._direccion = -1
+        self._base = None  # (limite, filas/s) medidos antes de la prueba en curso; None si no hay prueba.
+        self._pausa = 1  # La primera ventana incluye el arranque de los workers: no sirve de referencia.
+        self._usados = {self.limite}
+
+    def registrar(self, filas: int = 1):
+        self._filas_ventana += filas
+        ahora = time.perf_counter()
+        duracion = ahora - self._inicio_ventana
+        if duracion < self.ventana_s or self._filas_ventana < FILAS_MINIMAS_VENTANA:
+            return
+        tasa = self._filas_ventana / duracion
+        self._inicio_ventana, self._filas_ventana = ahora, 0
+        self._evaluar(tasa, ahora)
+
+    def _evaluar(self, tasa: float, ahora: float):
+        if self._base is not None:
+            limite_base, tasa_base = self._base
+            self._base = None
+            if tasa > tasa_base * (1 + MEJORA_MINIMA):
+                self._probar(tasa, ahora)  # La prueba ganó: seguir en la misma dirección.
+                return
+            self._direccion = -self._direccion
+            self._pausa = VENTANAS_EN_PAUSA
+            self._cambiar(limite_base, tasa, ahora)
+            return
+        if self._pausa > 0:
+            self._pausa -= 1
+            return
+        self._probar(tasa, ahora)
+
+    def _probar(self, tasa: float, ahora: float):
+        candidato = self.limite + self._direccion
+        if not self.minimo <= candidato <= self.maximo:
+            self._direccion = -self._direccion
+            candidato = self.limite + self._direccion
+            if not self.minimo <= candidato <= self.maximo:
+                return  # minimo == maximo: nada que ajustar.
+        self._base = (self.limite, tasa)
+        self._cambiar(candidato, tasa, ahora)
+
+    def _cambiar(self, limite: int, tasa: float, ahora: float):
+        self.limite = limite
+        self._usados.add(limite)
+        self.ajustes.append({"seconds": round(ahora - self._t0, 3), "workers": limite, "rows_per_second": round(tasa, 2)})
+
+    def resumen(self) -> dict:
+        return {
+            "workers_initial": self.inicial,
+            "workers_final": self.limite,
+            "workers_min_used": min(self._usados),
+            "workers_max_used": max(self._usados),
+            "adjustments": self.ajustes[-MAX_AJUSTES_EN_RESUMEN:],
+        }
+
+
+class SemaforoAjustable:
+    """asyncio: como asyncio.Semaphore (y en el mismo orden de llegada), pero el cupo es ajustador.limite en cada momento."""
+
+    def __init__(self, ajustador: AjustadorWorkers):
+        self.ajustador = ajustador
+        self.en_uso = 0
+        self._condicion = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condicion:
+            await self._condicion.wait_for(lambda: self.en_uso < self.ajustador.limite)
+            self.en_uso += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condicion:
+            self.en_uso -= 1
+            self._condicion.notify_all()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# almacen_resultados.py guarda las filas extraídas en una base SQLite local (modo WAL) para poder consultarlas
+# después sin volver a extraer el corpus: las filas de un trabajo ya no se pierden cuando el cliente se desconecta.
+#   - filas: una por archivo (la última extracción de ese archivo gana), con la fila completa en JSON. Un archivo se
+#     identifica por su clave (ruta absoluta, o hash del contenido y nombre si llegó por el WebSocket): dos archivos
+#     con el mismo "Processed File Name" en directorios distintos son filas distintas; el nombre solo se muestra.
+#   - valores: un registro por cada valor ('; '-separado) de COLUMNAS_INDEXADAS, en minúsculas, con índice
+#     (columna, valor, fila_id); "los entrevistados de Sweden que fueron farmer" es la intersección de dos rangos
+#     de ese índice.
+# Las filas se insertan desde un thread escritor en transacciones por lotes, así que agregar() nunca bloquea al que
+# emite la fila. Varios procesos (el servidor y un servidor.py --store) pueden escribir a la vez: WAL + busy_timeout.
+import json, logging, os, queue, sqlite3, threading, time
+
+RUTA_ALMACEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados.sqlite3")
+COLUMNAS_INDEXADAS = ["Name", "Country of Origin", "Date of Immigration", "Occupation"]
+COLUMNA_NOMBRE_ARCHIVO = "Processed File Name"
+VALORES_SIN_DATO = ("Not Mention", "ERROR", "")
+MAX_FILAS_TRANSACCION = 500
+INTERVALO_TRANSACCION_SEGUNDOS = 1.0
+TAMANO_PAGINA_POR_DEFECTO = 50
+MAX_TAMANO_PAGINA = 500
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS filas (
+    id INTEGER PRIMARY KEY,
+    clave TEXT NOT NULL UNIQUE,
+    archivo TEXT NOT NULL,
+    guardada_en REAL NOT NULL,
+    fila TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS valores (
+    fila_id INTEGER NOT NULL,
+    columna TEXT NOT NULL,
+    valor TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_filas_archivo ON filas (archivo);
+CREATE INDEX IF NOT EXISTS idx_valores_columna_valor ON valores (columna, valor, fila_id);
+CREATE INDEX IF NOT EXISTS idx_valores_fila ON valores (fila_id);
+"""
+
+#conectar_almacen() abre la base (creándola si hace falta) con WAL y espera ante bloqueos de otro escritor.
+def conectar_almacen(ruta: str) -> sqlite3.Connection:
+    conexion = sqlite3.connect(ruta, timeout=10, check_same_thread=False)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")  # En WAL solo arriesga la última transacción ante un corte de luz.
+    agregar_columna_clave(conexion)
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+#agregar_columna_clave() migra una base creada cuando las filas iban por nombre de archivo (archivo UNIQUE): sus
+# filas quedan con clave = nombre y se sustituyen al extraer de nuevo un archivo con ese nombre (ver _insertar_lote).
+def agregar_columna_clave(conexion: sqlite3.Connection):
+    if not conexion.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'filas'").fetchone():
+        return
+    if "clave" in {columna[1] for columna in conexion.execute("PRAGMA table_info(filas)")}:
+        return
+    conexion.execute("BEGIN IMMEDIATE")  # Otro proceso puede estar migrando la misma base: se vuelve a mirar dentro.
+    try:
+        if "clave" not in {columna[1] for columna in conexion.execute("PRAGMA table_info(filas)")}:
+            conexion.execute("ALTER TABLE filas RENAME TO filas_por_nombre")
+            conexion.execute(
+                "CREATE TABLE filas (id INTEGER PRIMARY KEY, clave TEXT NOT NULL UNIQUE, archivo TEXT NOT NULL, "
+                "guardada_en REAL NOT NULL, fila TEXT NOT NULL)"
+            )
+            conexion.execute(
+                "INSERT INTO filas (id, clave, archivo, guardada_en, fila) "
+                "SELECT id, archivo, archivo, guardada_en, fila FROM filas_por_nombre"
+            )
+            conexion.execute("DROP TABLE filas_por_nombre")
+        conexion.commit()
+    except sqlite3.Error:
+        conexion.rollback()
+        raise
+
+#valores_indexables() separa los valores de una celda ('a; b; c') y los normaliza como se guardan en la tabla valores.
+def valores_indexables(celda) -> set:
+    if not isinstance(celda, str) or celda in VALORES_SIN_DATO:
+        return set()
+    return {valor.strip().lower() for valor in celda.split(";") if valor.strip()}
+
+
+class AlmacenResultados:
+    """
+    Almacén persistente de filas, una por clave de archivo. agregar() encola la fila (seguro desde cualquier thread); un thread escritor la
+    inserta junto con las demás pendientes en una sola transacción. consultar() usa su propia conexión de lectura
+    (WAL: los lectores no esperan al escritor), así que puede llamarse vía run_in_executor mientras se inserta.
+    """
+
+    def __init__(self, ruta=RUTA_ALMACEN, max_filas_transaccion=MAX_FILAS_TRANSACCION,
+                 intervalo_segundos=INTERVALO_TRANSACCION_SEGUNDOS):
+        self.ruta = ruta
+        self.max_filas_transaccion = max(1, max_filas_transaccion)
+        self.intervalo = intervalo_segundos
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lectura = None  # Conexión de consultar(), creada al primer uso y protegida por _lock_lectura.
+        self._lock_lectura = threading.Lock()
+        self.estadisticas = {"filas_guardadas": 0, "transacciones": 0, "errores": 0}
+        conectar_almacen(self.ruta).close()  # Crea el esquema ya: un error de ruta se ve al arrancar.
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._escribir, name="almacen_resultados", daemon=True)
+            self._hilo.start()
+
+    def agregar(self, fila: dict, clave: str = None):
+        """clave identifica el archivo de la fila (ver el comentario del módulo); sin ella, su "Processed File Name"."""
+        self._cola.put((clave or fila.get(COLUMNA_NOMBRE_ARCHIVO, ""), dict(fila)))
+
+    def cerrar(self):
+        """Inserta lo pendiente y detiene el escritor."""
+        if self._hilo is not None:
+            self._cola.put(None)
+            self._hilo.join()
+            self._hilo = None
+        with self._lock_lectura:
+            if self._lectura is not None:
+                self._lectura.close()
+                self._lectura = None
+
+    def _escribir(self):
+        # Un lote se cierra al llegar a max_filas_transaccion filas o cuando pasa el intervalo desde su primera fila.
+        conexion = conectar_almacen(self.ruta)
+        terminar = False
+        while not terminar:
+            primera = self._cola.get()
+            if primera is None:
+                break
+            lote = [primera]
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.max_filas_transaccion:
+                try:
+                    fila = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if fila is None:
+                    terminar = True
+                    break
+                lote.append(fila)
+            self._insertar_lote(conexion, lote)
+        conexion.close()
+
+    def _insertar_lote(self, conexion, filas):
+        ahora = time.time()
+        try:
+            with conexion:  # Una transacción por lote.
+                for clave, fila in filas:
+                    archivo = fila.get(COLUMNA_NOMBRE_ARCHIVO, "")
+                    # clave = archivo es una fila guardada sin clave (base migrada): la sustituye cualquier archivo
+                    # con ese nombre.
+                    conexion.execute("DELETE FROM valores WHERE fila_id IN (SELECT id FROM filas WHERE clave IN (?, ?))", (clave, archivo))
+                    conexion.execute("DELETE FROM filas WHERE clave IN (?, ?)", (clave, archivo))
+                    fila_id = conexion.execute(
+                        "INSERT INTO filas (clave, archivo, guardada_en, fila) VALUES (?, ?, ?, ?)",
+                        (clave, archivo, ahora, json.dumps(fila, ensure_ascii=False)),
+                    ).lastrowid
+                    conexion.executemany(
+                        "INSERT INTO valores (fila_id, columna, valor) VALUES (?, ?, ?)",
+                        [(fila_id, col, valor) for col in COLUMNAS_INDEXADAS for valor in valores_indexables(fila.get(col))],
+                    )
+        except sqlite3.Error as e:
+            self.estadisticas["errores"] += 1
+            logging.error(f"No se pudieron guardar {len(filas)} fila(s) en '{self.ruta}': {e}")
+            return
+        self.estadisticas["filas_guardadas"] += len(filas)
+        self.estadisticas["transacciones"] += 1
+
+    def iterar_filas(self):
+        """Recorre todas las filas guardadas como (clave, fila), en orden de inserción, con una conexión propia (bloqueante)."""
+        conexion = conectar_almacen(self.ruta)
+        try:
+            for clave, fila in conexion.execute("SELECT clave, fila FROM filas ORDER BY id"):
+                yield clave, json.loads(fila)
+        finally:
+            conexion.close()
+
+    def consultar(self, filtros: dict, pagina: int = 1, tamano_pagina: int = TAMANO_PAGINA_POR_DEFECTO) -> dict:
+        """
+        filtros: {columna indexada: valor o lista de valores alternativos}; una fila coincide si para cada columna
+        tiene alguno de los valores (sin distinguir mayúsculas). Sin filtros retorna todas las filas.
+        Retorna {"total", "pagina", "tamano_pagina", "filas"} con las filas ordenadas por nombre de archivo.
+        Lanza ValueError si los filtros o la paginación no son válidos.
+        """
+        if not isinstance(filtros, dict):
+            raise ValueError("'filtros' debe ser un objeto {columna: valor}.")
+        if not isinstance(pagina, int) or isinstance(pagina, bool) or pagina < 1:
+            raise ValueError("'pagina' debe ser un entero >= 1.")
+        if not isinstance(tamano_pagina, int) or isinstance(tamano_pagina, bool) or not 1 <= tamano_pagina <= MAX_TAMANO_PAGINA:
+            raise ValueError(f"'tamano_pagina' debe ser un entero entre 1 y {MAX_TAMANO_PAGINA}.")
+        condiciones, parametros = [], []
+        for columna, valores in filtros.items():
+            if columna not in COLUMNAS_INDEXADAS:
+                raise ValueError(f"La columna '{columna}' no se puede filtrar (indexadas: {', '.join(COLUMNAS_INDEXADAS)}).")
+            valores = valores if isinstance(valores, list) else [valores]
+            valores = [v.strip().lower() for v in valores if isinstance(v, str) and v.strip()]
+            if not valores:
+                raise ValueError(f"Filtro vacío para la columna '{columna}'.")
+            condiciones.append(
+                f"id IN (SELECT fila_id FROM valores WHERE columna = ? AND valor IN ({', '.join('?' * len(valores))}))"
+            )
+            parametros += [columna] + valores
+        donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._lock_lectura:
+            if self._lectura is None:
+                self._lectura = conectar_almacen(self.ruta)
+            total = self._lectura.execute(f"SELECT COUNT(*) FROM filas {donde}", parametros).fetchone()[0]
+            filas = self._lectura.execute(
+                f"SELECT fila FROM filas {donde} ORDER BY archivo, id LIMIT ? OFFSET ?",
+                parametros + [tamano_pagina, (pagina - 1) * tamano_pagina],
+            ).fetchall()
+        return {
+            "total": total,
+            "pagina": pagina,
+            "tamano_pagina": tamano_pagina,
+            "filas": [json.loads(fila) for fila, in filas],
+        }
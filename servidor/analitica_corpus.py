@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# analitica_corpus.py mantiene en el servidor agregados de todo el corpus extraído, para que un panel vea la
+# distribución de países, las ocupaciones por década de inmigración o qué razones van con qué destinos sin recibir
+# ni recorrer cada fila:
+#   - Cada agregado es una matriz de conteos (filas: valores de una columna; columnas: valores de otra, o una sola
+#     columna para una distribución). Cada documento suma 1 en cada combinación de valores distintos que contiene.
+#   - agregar_fila() solo traduce los valores de la fila a índices y los apunta en búferes; los búferes se aplican
+#     a la matriz de golpe (numpy.add.at) al pedir una instantánea, así el coste por fila no depende del tamaño de
+#     la matriz y una instantánea por segundo resume miles de filas nuevas en una sola operación.
+#   - Si un archivo se extrae de nuevo, su aportación anterior se resta (como en indice_nombres.py). Los archivos
+#     se distinguen por su clave (ruta absoluta), no por su nombre.
+# NumPy es opcional: sin él los conteos se guardan en un diccionario (mismas instantáneas, más lento con corpus
+# grandes). No es thread-safe: usarlo desde el bucle de eventos de servidor_websockets.py.
+import re
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Dependencia opcional: sin ella los conteos van en un diccionario.
+    np = None
+
+COLUMNA_NOMBRE_ARCHIVO = "Processed File Name"
+VALORES_SIN_DATO = ("Not Mention", "ERROR", "")
+# nombre del agregado -> (columna de las filas de la matriz, columna de sus columnas o None para una distribución).
+AGREGADOS = {
+    "paises": ("Country of Origin", None),
+    "ocupaciones_por_decada": ("Occupation", "Date of Immigration"),
+    "razones_por_destino": ("Reason for Immigration", "Destinations"),
+}
+COLUMNAS_POR_DECADA = ("Date of Immigration",)  # Sus valores (fechas) se cuentan por década: "1880s".
+REGEX_AÑO = re.compile(r"\b(1[5-9]\d\d|20\d\d)\b")
+MAX_ETIQUETAS_INSTANTANEA = 20  # Filas (y columnas) de cada agregado en una instantánea: las de más documentos.
+INTERVALO_INSTANTANEAS_MS = 1000  # Cada cuánto servidor_websockets.py envía instantáneas a los suscriptores.
+CAPACIDAD_INICIAL = 16
+
+#valores_de_celda() retorna los valores distintos de una celda ("a; b"), o sus décadas si decadas.
+def valores_de_celda(celda, decadas: bool = False) -> list:
+    if not isinstance(celda, str) or celda in VALORES_SIN_DATO:
+        return []
+    if decadas:
+        return sorted({f"{int(año) // 10 * 10}s" for año in REGEX_AÑO.findall(celda)})
+    return [valor for valor in dict.fromkeys(pieza.strip() for pieza in celda.split(";")) if valor and valor not in VALORES_SIN_DATO]
+
+
+class Vocabulario:
+    """Valores de una dimensión -> índice; variantes de mayúsculas cuentan juntas y se muestran como la primera vista."""
+
+    def __init__(self):
+        self._indices = {}
+        self.etiquetas = []
+
+    def __len__(self):
+        return len(self.etiquetas)
+
+    def indice(self, valor: str) -> int:
+        clave = valor.casefold()
+        indice = self._indices.get(clave)
+        if indice is None:
+            indice = self._indices[clave] = len(self.etiquetas)
+            self.etiquetas.append(valor)
+        return indice
+
+
+class MatrizConteos:
+    """Conteos de un agregado; las sumas se acumulan en búferes y se aplican en aplicar_pendientes()."""
+
+    def __init__(self, columna_filas: str, columna_columnas: str = None):
+        self.columna_filas = columna_filas
+        self.columna_columnas = columna_columnas
+        self.filas = Vocabulario()
+        self.columnas = Vocabulario()
+        if columna_columnas is None:
+            self.columnas.indice("")  # Distribución: una sola columna.
+        self._conteos = np.zeros((CAPACIDAD_INICIAL, CAPACIDAD_INICIAL), dtype=np.int64) if np is not None else {}
+        self._pendientes = (array("l"), array("l"), array("l"))  # filas, columnas, incrementos
+
+    def celdas(self, fila: dict) -> array:
+        """Índices (fila, columna, fila, columna...) de las combinaciones de valores de una fila del corpus."""
+        # dict.fromkeys: "SWEDEN; Sweden" es un solo valor (mismo índice) y el documento cuenta una vez.
+        indices_filas = dict.fromkeys(
+            self.filas.indice(v) for v in valores_de_celda(fila.get(self.columna_filas), self.columna_filas in COLUMNAS_POR_DECADA)
+        )
+        if self.columna_columnas is None:
+            indices_columnas = (0,)
+        else:
+            indices_columnas = dict.fromkeys(
+                self.columnas.indice(v)
+                for v in valores_de_celda(fila.get(self.columna_columnas), self.columna_columnas in COLUMNAS_POR_DECADA)
+            )
+        return array("l", [x for i_fila in indices_filas for i_columna in indices_columnas for x in (i_fila, i_columna)])
+
+    def sumar(self, celdas: array, incremento: int):
+        filas, columnas, incrementos = self._pendientes
+        filas.extend(celdas[0::2])
+        columnas.extend(celdas[1::2])
+        incrementos.extend([incremento] * (len(celdas) // 2))
+
+    def aplicar_pendientes(self):
+        filas, columnas, incrementos = self._pendientes
+        if not incrementos:
+            return
+        if np is None:
+            for i_fila, i_columna, incremento in zip(filas, columnas, incrementos):
+                self._conteos[i_fila, i_columna] = self._conteos.get((i_fila, i_columna), 0) + incremento
+        else:
+            alto, ancho = self._conteos.shape
+            if len(self.filas) > alto or len(self.columnas) > ancho:
+                # Se dobla la capacidad para que crecer cueste O(1) amortizado por valor nuevo.
+                nuevos = np.zeros((max(alto, 1 << (len(self.filas) - 1).bit_length()),
+                                   max(ancho, 1 << (len(self.columnas) - 1).bit_length())), dtype=np.int64)
+                nuevos[:alto, :ancho] = self._conteos
+                self._conteos = nuevos
+            np.add.at(self._conteos, (np.asarray(filas), np.asarray(columnas)), np.asarray(incrementos))
+        self._pendientes = (array("l"), array("l"), array("l"))
+
+    def instantanea(self, max_etiquetas: int) -> dict:
+        """Las max_etiquetas filas (y columnas) con más documentos; las columnas de décadas van en orden cronológico."""
+        self.aplicar_pendientes()
+        num_filas, num_columnas = len(self.filas), len(self.columnas)
+        if np is not None:
+            conteos = self._conteos[:num_filas, :num_columnas]
+            por_fila, por_columna = conteos.sum(axis=1), conteos.sum(axis=0)
+        else:
+            por_fila, por_columna = [0] * num_filas, [0] * num_columnas
+            for (i_fila, i_columna), n in self._conteos.items():
+                por_fila[i_fila] += n
+                por_columna[i_columna] += n
+        filas = self._mayores(por_fila, max_etiquetas)
+        columnas = self._mayores(por_columna, max_etiquetas)
+        if self.columna_columnas in COLUMNAS_POR_DECADA:
+            columnas.sort(key=lambda i: self.columnas.etiquetas[i])
+        if np is not None:
+            matriz = conteos[np.ix_(filas, columnas)].tolist() if filas and columnas else []
+        else:
+            matriz = [[self._conteos.get((i_fila, i_columna), 0) for i_columna in columnas] for i_fila in filas]
+        if self.columna_columnas is None:
+            return {
+                "columna": self.columna_filas,
+                "etiquetas": [self.filas.etiquetas[i] for i in filas],
+                "conteos": [fila[0] for fila in matriz],
+                "valores_distintos": sum(1 for n in por_fila if n > 0),
+            }
+        return {
+            "columna_filas": self.columna_filas,
+            "columna_columnas": self.columna_columnas + (" (década)" if self.columna_columnas in COLUMNAS_POR_DECADA else ""),
+            "etiquetas_filas": [self.filas.etiquetas[i] for i in filas],
+            "etiquetas_columnas": [self.columnas.etiquetas[i] for i in columnas],
+            "conteos": matriz,
+        }
+
+    @staticmethod
+    def _mayores(totales, cuantos: int) -> list:
+        """Índices de los cuantos totales mayores (>0), de mayor a menor (a igualdad, el primero visto)."""
+        if np is not None:
+            orden = np.argsort(-np.asarray(totales), kind="stable")[:cuantos]
+            return [int(i) for i in orden if totales[i] > 0]
+        return [i for i in sorted(range(len(totales)), key=lambda i: -totales[i])[:cuantos] if totales[i] > 0]
+
+
+class AnaliticaCorpus:
+    """Agregados (ver AGREGADOS) de todas las filas extraídas; version cambia con cada fila agregada."""
+
+    def __init__(self, agregados: dict = None):
+        self.matrices = {nombre: MatrizConteos(*columnas) for nombre, columnas in (agregados or AGREGADOS).items()}
+        self._por_archivo = {}  # clave del archivo -> {nombre del agregado: celdas}, para restar su aportación si se reextrae.
+        self.version = 0
+
+    def num_documentos(self) -> int:
+        return len(self._por_archivo)
+
+    def agregar_fila(self, fila: dict, clave: str = None):
+        """Suma una fila a los agregados; si el archivo (clave, o su nombre sin ella) ya estaba, su aportación se sustituye."""
+        archivo = clave or fila.get(COLUMNA_NOMBRE_ARCHIVO, "")
+        anteriores = self._por_archivo.pop(archivo, None)
+        if anteriores is not None:
+            for nombre, celdas in anteriores.items():
+                self.matrices[nombre].sumar(celdas, -1)
+        aportacion = {}
+        for nombre, matriz in self.matrices.items():
+            celdas = matriz.celdas(fila)
+            if celdas:
+                matriz.sumar(celdas, 1)
+                aportacion[nombre] = celdas
+        self._por_archivo[archivo] = aportacion
+        self.version += 1
+
+    def instantanea(self, max_etiquetas: int = MAX_ETIQUETAS_INSTANTANEA) -> dict:
+        return {
+            "version": self.version,
+            "documentos": self.num_documentos(),
+            "agregados": {nombre: matriz.instantanea(max_etiquetas) for nombre, matriz in self.matrices.items()},
+        }
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# benchmark_extraccion.py mide el rendimiento real de la extracción (en lugar de simular carga con
+# --simulate-delay-ms) y lo guarda en JSON para compararlo con una línea base antes de desplegar:
+#   - corpus: english_text_files (1x) y corpus sintéticos de 10x y 100x, hechos replicando sus archivos
+#     (enlaces duros cuando se puede, así el 100x no ocupa disco) en un directorio temporal.
+#   - corridas: servidor.py como subprocess (igual que lo lanza servidor_websockets.py) en los modos thread y
+#     process con un número creciente de workers, y sequential_visual una vez por corpus (sus workers son solo
+#     visuales, así que es la referencia de un solo núcleo). Por corrida: archivos/s, MB/s, pico de memoria y
+#     una huella de las filas emitidas, que debe coincidir entre modos y con la línea base.
+#   - patrones: coste de cada regex de PATRONES por separado y del MOTOR completo sobre el corpus 1x.
+# Uso:
+#   python benchmark_extraccion.py --output bench.json
+#   python benchmark_extraccion.py --output bench.json --baseline baseline.json   (exit 1 si hay regresión)
+#   python benchmark_extraccion.py --verify   (solo comprueba que los resultados coincidan con la referencia, ver comprobaciones.py)
+import argparse, glob, hashlib, json, os, platform, shutil, subprocess, sys, tempfile, time
+
+import servidor as extractor  # Compila PATRONES/MOTOR: es lo que se mide en la sección de patrones.
+import comprobaciones
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_SERVIDOR_PY = os.path.join(BASE_DIR, "servidor.py")
+TEXT_FILES_DIR = os.path.join(os.path.dirname(BASE_DIR), "english_text_files")
+VERSION_FORMATO = 1  # Se incrementa si cambia la estructura del JSON de resultados.
+ESCALAS_POR_DEFECTO = "1,10,100"
+WORKERS_POR_DEFECTO = "1,2,4,8"
+MODOS_POR_DEFECTO = "sequential_visual,thread,process"
+TOLERANCIA_POR_DEFECTO = 0.20  # Una medida es regresión si empeora más de este porcentaje respecto a la base.
+MINIMO_SEGUNDOS_COMPARABLE = 0.05  # Por debajo de esto el ruido domina y no se compara el tiempo de un patrón.
+MODULO_HUELLA = 2 ** 256
+
+#preparar_corpus() retorna el directorio con el corpus a la escala pedida: el original para 1x, o una réplica
+#con `escala` copias de cada archivo (prefijo copiaNNN_) dentro de directorio_trabajo.
+def preparar_corpus(directorio_origen: str, escala: int, directorio_trabajo: str) -> str:
+    if escala == 1:
+        return directorio_origen
+    destino = os.path.join(directorio_trabajo, f"corpus_{escala}x")
+    os.makedirs(destino, exist_ok=True)
+    for ruta in sorted(glob.glob(os.path.join(directorio_origen, "*.txt"))):
+        nombre = os.path.basename(ruta)
+        for copia in range(escala):
+            ruta_copia = os.path.join(destino, f"copia{copia:03d}_{nombre}")
+            if os.path.exists(ruta_copia):
+                continue
+            try:
+                os.link(ruta, ruta_copia)
+            except OSError:
+                shutil.copyfile(ruta, ruta_copia)  # Otro volumen o sistema de archivos sin enlaces duros.
+    return destino
+
+#describir_corpus() retorna número de archivos y bytes totales de los .txt de un directorio.
+def describir_corpus(directorio: str) -> dict:
+    rutas = glob.glob(os.path.join(directorio, "*.txt"))
+    return {"files": len(rutas), "bytes": sum(os.path.getsize(r) for r in rutas)}
+
+#huella_fila() es el hash de una fila sin el nombre del archivo (las copias de un corpus sintético dan la misma
+#fila que su original). La huella de una corrida es la suma módulo 2^256 de las de sus filas: no depende del
+#orden en que llegan, que varía entre modos.
+def huella_fila(fila: dict) -> int:
+    datos = {col: valor for col, valor in fila.items() if col != "Processed File Name"}
+    return int(hashlib.sha256(json.dumps(datos, sort_keys=True).encode("utf-8")).hexdigest(), 16)
+
+#pico_memoria_mb() convierte ru_maxrss a MB (Linux lo da en KB y macOS en bytes).
+def pico_memoria_mb(ru_maxrss: int) -> float:
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(ru_maxrss / divisor, 1)
+
+#ejecutar_corrida() lanza servidor.py sobre un directorio y mide la corrida completa (arranque incluido, como
+#en servidor_websockets.py). El pico de memoria viene de os.wait4: en Linux es el mayor RSS entre el proceso
+#y sus workers ya terminados; en plataformas sin wait4 (Windows) queda en None.
+def ejecutar_corrida(directorio: str, modo: str, workers: int, corpus: dict) -> dict:
+    comando = [sys.executable, SCRIPT_SERVIDOR_PY, "--client-id", "benchmark", "--default-input-dir", directorio,
+               "--concurrency-mode", modo, "--workers", str(workers)]
+    filas, huella, resumen = 0, 0, {}
+    t0 = time.perf_counter()
+    proceso = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                               encoding="utf-8", cwd=BASE_DIR)
+    for linea in proceso.stdout:
+        try:
+            mensaje = json.loads(linea)
+        except ValueError:
+            continue
+        if mensaje.get("type") == "csv_data_row":
+            filas += 1
+            huella = (huella + huella_fila(mensaje["data"])) % MODULO_HUELLA
+        elif mensaje.get("type") == "processing_complete":
+            resumen = mensaje.get("summary", {})
+    proceso.stdout.close()
+    pico_mb = None
+    if hasattr(os, "wait4"):
+        _, estado, uso = os.wait4(proceso.pid, 0)
+        proceso.returncode = os.waitstatus_to_exitcode(estado) if hasattr(os, "waitstatus_to_exitcode") else estado
+        pico_mb = pico_memoria_mb(uso.ru_maxrss)
+    else:
+        proceso.wait()
+    segundos = time.perf_counter() - t0
+    return {
+        "mode": modo,
+        "workers": workers,
+        "seconds": round(segundos, 3),
+        "script_seconds": resumen.get("duration_seconds"),
+        "files_per_second": round(corpus["files"] / segundos, 2),
+        "mb_per_second": round(corpus["bytes"] / (1024 * 1024) / segundos, 3),
+        "peak_rss_mb": pico_mb,
+        "rows": filas,
+        "rows_fingerprint": format(huella, "064x")[:16],
+        "status": resumen.get("status", f"exit_code_{proceso.returncode}"),
+    }
+
+#mejor_de() repite una corrida y se queda con la más rápida (la menos afectada por ruido del sistema).
+def mejor_de(repeticiones: int, medir):
+    return min((medir() for _ in range(max(1, repeticiones))), key=lambda r: r["seconds"])
+
+#leer_textos() carga el corpus igual que extraer_fila_de_archivo() (utf-8 ignorando errores).
+def leer_textos(directorio: str) -> list:
+    textos = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, "*.txt"))):
+        with open(ruta, encoding="utf-8", errors="ignore") as fh:
+            textos.append(fh.read())
+    return textos
+
+#medir_patrones() mide cada regex de PATRONES por separado sobre todos los textos (lo que costaría sin el
+#motor) y el MOTOR completo. tipo indica cómo la resuelve el motor: literal (trie), ventana o estructural.
+def medir_patrones(textos: list) -> dict:
+    motor = extractor.MOTOR
+    tipos = {idx: "literal" for idx, *_ in motor.literales}
+    tipos.update((idx, "ventana") for idx, *_ in motor.ventanas)
+    tipos.update((idx, "estructural") for idx, *_ in motor.estructurales)
+    patrones = []
+    for idx, (col, regex_compilada, _grp) in enumerate(motor.patrones):
+        matches, errores = 0, 0
+        t0 = time.perf_counter()
+        for txt in textos:
+            try:
+                matches += sum(1 for _ in regex_compilada.finditer(txt))
+            except Exception:
+                errores += 1
+        patrones.append({
+            "column": col,
+            "kind": tipos.get(idx, "estructural"),
+            "seconds": round(time.perf_counter() - t0, 4),
+            "matches": matches,
+            "exceptions": errores,
+        })
+    t0 = time.perf_counter()
+    for txt in textos:
+        motor.extraer(txt)
+    segundos_motor = time.perf_counter() - t0
+    megabytes = sum(len(txt.encode("utf-8")) for txt in textos) / (1024 * 1024)
+    return {
+        "patterns": patrones,
+        "engine": {
+            "seconds": round(segundos_motor, 4),
+            "mb_per_second": round(megabytes / segundos_motor, 3) if segundos_motor else None,
+            "sum_of_pattern_seconds": round(sum(p["seconds"] for p in patrones), 4),
+        },
+    }
+
+#comparar_con_base() retorna la lista de regresiones (texto) de `resultados` respecto a `base`.
+#Una corrida empeora si su MB/s baja más de `tolerancia`; un patrón o el motor, si su tiempo sube más de
+#`tolerancia` (y supera MINIMO_SEGUNDOS_COMPARABLE). Un cambio en las filas emitidas también es regresión:
+#si el cambio de PATRONES es intencionado, hay que regenerar la línea base.
+def comparar_con_base(resultados: dict, base: dict, tolerancia: float) -> list:
+    regresiones = []
+    if base.get("meta", {}).get("patterns_fingerprint") != resultados["meta"]["patterns_fingerprint"]:
+        regresiones.append("Aviso: la huella de PATRONES cambió desde la línea base.")
+    corridas_base = {(c["corpus"], c["mode"], c["workers"]): c for c in base.get("runs", [])}
+    for corrida in resultados["runs"]:
+        clave = (corrida["corpus"], corrida["mode"], corrida["workers"])
+        anterior = corridas_base.get(clave)
+        if anterior is None:
+            continue
+        etiqueta = f"{corrida['corpus']} {corrida['mode']} x{corrida['workers']}"
+        if corrida["rows_fingerprint"] != anterior["rows_fingerprint"] or corrida["rows"] != anterior["rows"]:
+            regresiones.append(
+                f"{etiqueta}: las filas emitidas cambiaron ({anterior['rows']} filas, huella {anterior['rows_fingerprint']} -> "
+                f"{corrida['rows']} filas, huella {corrida['rows_fingerprint']})."
+            )
+        if corrida["mb_per_second"] < anterior["mb_per_second"] * (1 - tolerancia):
+            regresiones.append(f"{etiqueta}: {anterior['mb_per_second']} -> {corrida['mb_per_second']} MB/s.")
+    patrones_base = {p["column"]: p for p in base.get("patterns", [])}
+    medidas = [(p["column"], p["seconds"], patrones_base.get(p["column"], {}).get("seconds")) for p in resultados.get("patterns", [])]
+    if "engine" in resultados:
+        medidas.append(("MOTOR completo", resultados["engine"]["seconds"], base.get("engine", {}).get("seconds")))
+    for nombre, segundos, anteriores in medidas:
+        if anteriores is None or max(segundos, anteriores) < MINIMO_SEGUNDOS_COMPARABLE:
+            continue
+        if segundos > anteriores * (1 + tolerancia):
+            regresiones.append(f"'{nombre}': {round(anteriores, 4)}s -> {segundos}s.")
+    return regresiones
+
+#comprobar_consistencia() retorna los corpus en que no todos los modos emitieron las mismas filas.
+def comprobar_consistencia(corridas: list) -> list:
+    huellas = {}
+    for corrida in corridas:
+        huellas.setdefault(corrida["corpus"], set()).add((corrida["rows"], corrida["rows_fingerprint"]))
+    return [f"{corpus}: los modos emitieron filas distintas." for corpus, vistas in huellas.items() if len(vistas) > 1]
+
+def lista_enteros(texto: str) -> list:
+    return [int(v) for v in texto.split(",") if v.strip()]
+
+# main() ejecuta el benchmark completo, escribe el JSON y, si se pide, lo compara con la línea base
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción: curvas de escalado por modo y workers, coste por patrón y comparación con línea base.")
+    parser.add_argument("--input-dir", default=TEXT_FILES_DIR, help="Corpus base (1x).")
+    parser.add_argument("--scales", default=ESCALAS_POR_DEFECTO, help="Escalas del corpus separadas por coma (1 = original).")
+    parser.add_argument("--modes", default=MODOS_POR_DEFECTO, help="Modos de concurrencia separados por coma.")
+    parser.add_argument("--workers", default=WORKERS_POR_DEFECTO, help="Número de workers a probar en thread/process, separados por coma.")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeticiones por corrida; se guarda la más rápida.")
+    parser.add_argument("--work-dir", help="Directorio para los corpus sintéticos (por defecto uno temporal que se borra al final).")
+    parser.add_argument("--skip-patterns", action="store_true", help="No medir el coste por patrón.")
+    parser.add_argument("--output", default="benchmark_extraccion.json", help="Archivo JSON de resultados.")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior con el que comparar; exit 1 si hay regresiones.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCIA_POR_DEFECTO, help="Empeoramiento relativo tolerado (0.2 = 20%%).")
+    parser.add_argument("--verify", action="store_true",
+                        help="En lugar de medir, comprobar que el motor y el resto de piezas den lo mismo que su referencia (exit 1 si no).")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(1 if comprobaciones.ejecutar_comprobaciones(args.input_dir) else 0)
+
+    modos = [m.strip() for m in args.modes.split(",") if m.strip()]
+    directorio_trabajo = args.work_dir or tempfile.mkdtemp(prefix="benchmark_extraccion_")
+    resultados = {
+        "meta": {
+            "format_version": VERSION_FORMATO,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "patterns_fingerprint": extractor.HUELLA_PATRONES,
+        },
+        "corpora": {},
+        "runs": [],
+    }
+    try:
+        for escala in lista_enteros(args.scales):
+            nombre_corpus = f"{escala}x"
+            directorio = preparar_corpus(args.input_dir, escala, directorio_trabajo)
+            corpus = describir_corpus(directorio)
+            resultados["corpora"][nombre_corpus] = corpus
+            print(f"Corpus {nombre_corpus}: {corpus['files']} archivos, {corpus['bytes'] / (1024 * 1024):.1f} MB", flush=True)
+            for modo in modos:
+                # sequential_visual procesa siempre en un solo hilo: sus workers son solo para la GUI.
+                for workers in ([1] if modo == "sequential_visual" else lista_enteros(args.workers)):
+                    corrida = mejor_de(args.repeat, lambda: ejecutar_corrida(directorio, modo, workers, corpus))
+                    corrida["corpus"] = nombre_corpus
+                    resultados["runs"].append(corrida)
+                    print(f"  {modo:<17} x{workers:<3} {corrida['seconds']:>8.2f}s {corrida['files_per_second']:>9.1f} archivos/s "
+                          f"{corrida['mb_per_second']:>8.2f} MB/s  pico {corrida['peak_rss_mb']} MB  [{corrida['status']}]", flush=True)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(directorio_trabajo, ignore_errors=True)
+
+    if not args.skip_patterns:
+        resultados.update(medir_patrones(leer_textos(args.input_dir)))
+        print(f"Motor: {resultados['engine']['seconds']}s ({resultados['engine']['mb_per_second']} MB/s); "
+              f"patrones por separado: {resultados['engine']['sum_of_pattern_seconds']}s", flush=True)
+        for patron in sorted(resultados["patterns"], key=lambda p: -p["seconds"])[:5]:
+            print(f"  {patron['column']:<25} {patron['kind']:<12} {patron['seconds']:>8.4f}s {patron['matches']:>8} matches", flush=True)
+
+    problemas = comprobar_consistencia(resultados["runs"])
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            base = json.load(fh)
+        problemas += comparar_con_base(resultados, base, args.tolerance)
+    resultados["regressions"] = problemas
+
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(resultados, fh, indent=2, ensure_ascii=False)
+    print(f"Resultados escritos en {args.output}", flush=True)
+    for problema in problemas:
+        print(problema if problema.startswith("Aviso:") else f"REGRESIÓN: {problema}", flush=True)
+    # El aviso de huella de PATRONES por sí solo no hace fallar la comparación.
+    if any(not p.startswith("Aviso:") for p in problemas):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
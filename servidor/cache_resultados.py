@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# cache_resultados.py guarda las filas extraídas indexadas por contenido: la clave es el hash del archivo más
+# la huella de los patrones (HUELLA_PATRONES de servidor.py), así que un cambio en PATRONES_DATA invalida
+# todo sin tener que borrar nada a mano. Tiene dos niveles:
+#   - memoria: LRU acotado por número de entradas.
+#   - disco: un .json por entrada bajo DIRECTORIO_CACHE, sobrevive a reinicios y se expulsa por tamaño total.
+import hashlib, json, logging, os, threading
+from collections import OrderedDict
+
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_resultados")
+MAX_ENTRADAS_MEMORIA = 2048
+MAX_BYTES_DISCO = 64 * 1024 * 1024
+TAMANO_BLOQUE_HASH = 1024 * 1024
+COLUMNA_NOMBRE_ARCHIVO = "Processed File Name"
+
+#hash_archivo() calcula el sha256 del contenido de un archivo leyéndolo por bloques.
+def hash_archivo(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as fh:
+        for bloque in iter(lambda: fh.read(TAMANO_BLOQUE_HASH), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class CacheResultados:
+    """
+    Caché de filas por contenido con un nivel LRU en memoria y un nivel en disco.
+    Los métodos son seguros para llamarse desde varios threads (el pool los usa vía run_in_executor).
+    """
+
+    def __init__(self, huella_patrones, directorio=DIRECTORIO_CACHE,
+                 max_entradas_memoria=MAX_ENTRADAS_MEMORIA, max_bytes_disco=MAX_BYTES_DISCO):
+        self.huella = huella_patrones
+        self.directorio = directorio
+        self.max_entradas_memoria = max_entradas_memoria
+        self.max_bytes_disco = max_bytes_disco
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes_disco = None  # Se calcula perezosamente la primera vez que se escribe.
+        self.estadisticas = {"hits_memoria": 0, "hits_disco": 0, "misses": 0, "expulsiones_disco": 0}
+
+    def clave_para_archivo(self, ruta: str, huella_patrones: str = None) -> str:
+        """Clave del archivo para unos patrones: los de la caché o, si se da, la huella de la versión de un trabajo."""
+        return hashlib.sha256(f"{huella_patrones or self.huella}:{hash_archivo(ruta)}".encode("ascii")).hexdigest()
+
+    def _ruta_entrada(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave[:2], clave + ".json")
+
+    def obtener(self, clave: str):
+        """Retorna la entrada {"fila": ..., "error": ...} o None si no está en ningún nivel."""
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                self._memoria.move_to_end(clave)
+                self.estadisticas["hits_memoria"] += 1
+                return entrada
+        ruta = self._ruta_entrada(clave)
+        try:
+            with open(ruta, encoding="utf-8") as fh:
+                entrada = json.load(fh)
+            os.utime(ruta)  # El mtime hace de "último uso" para la expulsión en disco.
+        except (OSError, ValueError):
+            with self._lock:
+                self.estadisticas["misses"] += 1
+            return None
+        with self._lock:
+            self.estadisticas["hits_disco"] += 1
+            self._guardar_en_memoria(clave, entrada)
+        return entrada
+
+    def guardar(self, clave: str, fila: dict, mensaje_error: str):
+        """Guarda la fila (sin el nombre de archivo, que depende de la ruta y no del contenido)."""
+        entrada = {
+            "fila": {col: val for col, val in fila.items() if col != COLUMNA_NOMBRE_ARCHIVO},
+            "error": mensaje_error,
+        }
+        with self._lock:
+            self._guardar_en_memoria(clave, entrada)
+        self._guardar_en_disco(clave, entrada)
+
+    def fila_desde_entrada(self, entrada: dict, nombre_archivo: str) -> dict:
+        fila = dict(entrada["fila"])
+        fila[COLUMNA_NOMBRE_ARCHIVO] = nombre_archivo
+        return fila
+
+    def _guardar_en_memoria(self, clave, entrada):
+        self._memoria[clave] = entrada
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas_memoria:
+            self._memoria.popitem(last=False)
+
+    def _guardar_en_disco(self, clave, entrada):
+        ruta = self._ruta_entrada(clave)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            datos = json.dumps(entrada, ensure_ascii=False).encode("utf-8")
+            ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(ruta_tmp, "wb") as fh:
+                fh.write(datos)
+            os.replace(ruta_tmp, ruta)  # Escritura atómica: un lector nunca ve un .json a medias.
+        except OSError as e:
+            logging.warning(f"No se pudo escribir la entrada de caché {clave[:12]}: {e}")
+            return
+        with self._lock:
+            if self._bytes_disco is None:
+                self._bytes_disco = sum(tam for _, tam, _ in self._listar_disco())
+            else:
+                self._bytes_disco += len(datos)
+            if self._bytes_disco > self.max_bytes_disco:
+                self._expulsar_disco()
+
+    def _listar_disco(self):
+        """Retorna [(ruta, tamaño, mtime)] de todas las entradas en disco."""
+        entradas = []
+        for raiz, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if nombre.endswith(".json"):
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        st = os.stat(ruta)
+                    except OSError:
+                        continue
+                    entradas.append((ruta, st.st_size, st.st_mtime))
+        return entradas
+
+    def _expulsar_disco(self):
+        """Borra las entradas menos usadas hasta quedar en el 90% del límite (llamar con el lock tomado)."""
+        entradas = sorted(self._listar_disco(), key=lambda e: e[2])
+        total = sum(tam for _, tam, _ in entradas)
+        objetivo = int(self.max_bytes_disco * 0.9)
+        for ruta, tam, _ in entradas:
+            if total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                total -= tam
+                self.estadisticas["expulsiones_disco"] += 1
+            except OSError:
+                pass
+        self._bytes_disco = total
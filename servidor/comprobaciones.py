@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# comprobaciones.py verifica que las piezas optimizadas del servidor den lo mismo que su versión de referencia, sin
+# depender de pytest ni del servidor WebSocket:
+#   - motor: MotorExtraccion.extraer() (trie de literales + índice de disparadores) y extraer_por_bloques() (en
+#     bloques pequeños, para que cada archivo pase por varias ventanas) contra el bucle simple de re.finditer por
+#     patrón que hacía servidor.py antes del motor, sobre todos los .txt del corpus.
+#   - resultado: la fila de ResultadoExtraccion (a_fila(), a_compacta() expandida, valores_de() y tras pickle) contra
+#     la fila dict-de-cadenas que se construía antes, con la lógica "quitar" aplicada sobre las cadenas 'a; b'.
+#   - protocolo: codificar_mensaje()/decodificar_mensaje() de protocolo_ws.py ida y vuelta con cada codificación y
+#     compresión disponibles, y el rechazo de frames inválidos o que descomprimidos superan MAX_BYTES_DESCOMPRIMIDOS.
+#   - almacen: AlmacenResultados en una base temporal (migración de una base por nombre de archivo, filas por ruta
+#     absoluta aunque se repita el nombre, sustitución al reextraer, persistencia, filtros y páginas de consultar()) y
+#     el índice de nombres y la analítica con las mismas claves.
+# Uso:
+#   python comprobaciones.py                                 (todas; exit 1 si alguna falla)
+#   python comprobaciones.py --only motor --max-files 50
+#   python benchmark_extraccion.py --verify                  (lo mismo desde el benchmark)
+import argparse, glob, json, os, pickle, sqlite3, sys, tempfile, time, zlib
+from collections import Counter
+
+import servidor as extractor  # Compila los patrones activos: son los que se comprueban.
+from almacen_resultados import AlmacenResultados, COLUMNA_NOMBRE_ARCHIVO, valores_indexables
+from analitica_corpus import AnaliticaCorpus, valores_de_celda
+from entrega_filas import VALOR_POR_DEFECTO, expandir_fila
+from indice_nombres import IndiceNombres, normalizar_nombre
+from protocolo_ws import (BIT_MSGPACK, BIT_ZLIB, CODIFICACIONES, COMPRESIONES, MAX_BYTES_DESCOMPRIMIDOS, PROTOCOLO_POR_DEFECTO,
+                          UMBRAL_COMPRESION_BYTES, MensajeInvalido, codificar_mensaje, decodificar_mensaje, validar_protocolo)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEXT_FILES_DIR = os.path.join(os.path.dirname(BASE_DIR), "english_text_files")
+BLOQUE_STREAMING = 1000  # Caracteres por bloque en la comprobación de extraer_por_bloques().
+MARGEN_STREAMING = 4096  # Margen de ventana menor que un archivo del corpus, para que haya bordes entre ventanas.
+MAX_FILAS_ALMACEN = 100  # Archivos del corpus que se guardan (dos veces, en dos directorios) en la comprobación del almacén.
+
+#leer_corpus() retorna [(nombre, texto)] de los .txt del directorio, leídos igual que extraer_fila_de_archivo().
+def leer_corpus(directorio: str, max_archivos: int = None) -> list:
+    corpus = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, "*.txt")))[:max_archivos]:
+        with open(ruta, encoding="utf-8", errors="ignore") as fh:
+            corpus.append((os.path.basename(ruta), fh.read()))
+    return corpus
+
+#valores_con_regex() es la referencia: cada patrón aplicado por separado con finditer sobre el texto completo; si una
+#regex lanza una excepción su columna queda vacía.
+def valores_con_regex(motor, txt: str) -> list:
+    valores = []
+    for _col, regex_compilada, grp in motor.patrones:
+        encontrados = set()
+        try:
+            for m in regex_compilada.finditer(txt):
+                valor_crudo = m.group(grp) if (m.lastindex is not None and grp <= m.lastindex) else m.group(0)
+                if valor_crudo and valor_crudo.strip():
+                    encontrados.add(valor_crudo.strip())
+        except Exception:
+            encontrados = set()
+        valores.append(encontrados)
+    return valores
+
+#columnas_distintas() retorna los nombres de las columnas en que dos listas de valores por columna no coinciden.
+def columnas_distintas(motor, esperados: list, obtenidos: list) -> list:
+    return [col for col, a, b in zip(motor.columnas, esperados, obtenidos) if a != b]
+
+#comprobar_motor() compara extraer() y extraer_por_bloques() con la referencia en cada archivo del corpus.
+def comprobar_motor(corpus: list) -> list:
+    motor = extractor.MOTOR
+    if not corpus:
+        return ["motor: el corpus no tiene archivos .txt"]
+    problemas = []
+    for nombre, txt in corpus:
+        esperados = valores_con_regex(motor, txt)
+        distintas = columnas_distintas(motor, esperados, motor.extraer(txt))
+        if distintas:
+            problemas.append(f"motor: extraer() difiere de la referencia en '{nombre}': {', '.join(distintas)}")
+        bloques = (txt[i:i + BLOQUE_STREAMING] for i in range(0, len(txt), BLOQUE_STREAMING))
+        valores, hubo_texto = motor.extraer_por_bloques(bloques, margen=MARGEN_STREAMING)
+        distintas = columnas_distintas(motor, esperados, valores)
+        if distintas:
+            problemas.append(f"motor: extraer_por_bloques() difiere de la referencia en '{nombre}': {', '.join(distintas)}")
+        if hubo_texto != bool(txt.strip()):
+            problemas.append(f"motor: extraer_por_bloques() da hubo_texto={hubo_texto} en '{nombre}'")
+    return problemas
+
+#fila_de_referencia() construye la fila como antes de ResultadoExtraccion: un dict de cadenas ('Not Mention' o
+#'a; b; c') sobre el que la lógica "quitar" parte, filtra y vuelve a unir.
+def fila_de_referencia(valores_por_columna: list, nombre_archivo: str) -> dict:
+    fila = {col: VALOR_POR_DEFECTO for col in extractor.COLUMNAS_ORDENADAS}
+    fila["Processed File Name"] = nombre_archivo
+    for col, encontrados in zip(extractor.MOTOR.columnas, valores_por_columna):
+        if encontrados:
+            fila[col] = '; '.join(sorted(encontrados))
+    for src_col, dst_col in extractor.REGLAS_QUITAR:
+        if fila[src_col] != VALOR_POR_DEFECTO and fila[dst_col] != VALOR_POR_DEFECTO:
+            set_src = set(s.strip().lower() for s in fila[src_col].split(';'))
+            nuevos_val = [v.strip() for v in fila[dst_col].split(';') if v.strip().lower() not in set_src]
+            fila[dst_col] = '; '.join(sorted(nuevos_val)) if nuevos_val else VALOR_POR_DEFECTO
+    if fila["Occupation"].lower() == fila["Job Title"].lower() and fila["Occupation"] != VALOR_POR_DEFECTO:
+        fila["Job Title"] = VALOR_POR_DEFECTO
+    return fila
+
+#comprobar_resultado() compara las conversiones de ResultadoExtraccion con la fila de referencia en cada archivo.
+def comprobar_resultado(corpus: list) -> list:
+    columnas = extractor.COLUMNAS_ORDENADAS
+    problemas = []
+    for nombre, txt in corpus:
+        valores = extractor.MOTOR.extraer(txt)
+        esperada = fila_de_referencia(valores, nombre)
+        resultado = extractor.completar_resultado(valores, nombre)
+        obtenidas = {
+            "a_fila()": resultado.a_fila(columnas),
+            "a_compacta()": expandir_fila(resultado.a_compacta(columnas), columnas),
+            "pickle": pickle.loads(pickle.dumps(resultado)).a_fila(columnas),
+            "valores_de()": {**{col: '; '.join(resultado.valores_de(i)) or VALOR_POR_DEFECTO for i, col in enumerate(columnas[:-1])},
+                             columnas[-1]: resultado.archivo},
+        }
+        for conversion, fila in obtenidas.items():
+            distintas = [col for col in columnas if fila.get(col) != esperada[col]]
+            if distintas:
+                problemas.append(f"resultado: {conversion} difiere de la fila de referencia en '{nombre}': {', '.join(distintas)}")
+    return problemas
+
+#comprobar_protocolo() codifica y decodifica mensajes reales (un lote de filas del corpus, uno pequeño y, con
+#MessagePack, uno con bytes) con cada protocolo, y comprueba que los frames inválidos se rechacen con MensajeInvalido.
+def comprobar_protocolo(corpus: list) -> list:
+    columnas = extractor.COLUMNAS_ORDENADAS
+    filas = [extractor.do_actual_processing_for_file(txt, nombre).a_compacta(columnas) for nombre, txt in corpus[:50]]
+    lote = {"tipo": "csv_lote_filas", "filas": filas, "columnas": columnas}
+    pequeno = {"tipo": "posicion_cola", "posicion": 2, "eta_inicio_segundos": None, "mensaje": "Año, niño: ½ ✓"}
+    problemas = []
+    if "msgpack" not in CODIFICACIONES:
+        print("  (MessagePack no está instalado: el protocolo solo se comprueba con JSON)", flush=True)
+    for codificacion in CODIFICACIONES:
+        for compresion in COMPRESIONES:
+            protocolo = validar_protocolo(codificacion, compresion)
+            payloads = [lote, pequeno]
+            if codificacion == "msgpack":
+                payloads.append({"tipo": "enviar_archivo_bloque", "id_envio": "a1", "datos": bytes(range(256)) * 8})
+            for payload in payloads:
+                etiqueta = f"{codificacion}+{compresion} '{payload['tipo']}'"
+                mensaje = codificar_mensaje(payload, protocolo)
+                if isinstance(mensaje, str) != (protocolo == PROTOCOLO_POR_DEFECTO):
+                    problemas.append(f"protocolo: {etiqueta} no va en el tipo de frame esperado")
+                comprimido = isinstance(mensaje, bytes) and bool(mensaje[0] & BIT_ZLIB)
+                if compresion == "ninguna" and comprimido:
+                    problemas.append(f"protocolo: {etiqueta} se comprimió sin pedirlo")
+                if compresion == "zlib" and payload is lote and not comprimido:
+                    problemas.append(f"protocolo: {etiqueta} no se comprimió (más de {UMBRAL_COMPRESION_BYTES} bytes)")
+                try:
+                    if decodificar_mensaje(mensaje) != payload:
+                        problemas.append(f"protocolo: {etiqueta} no vuelve igual tras codificar y decodificar")
+                except MensajeInvalido as e:
+                    problemas.append(f"protocolo: {etiqueta} se rechaza al decodificarlo: {e}")
+
+    invalidos = {
+        "JSON de texto inválido": "{no es json",
+        "frame binario vacío": b"",
+        "cabecera desconocida": bytes((0x80,)) + b"{}",
+        "zlib corrupto": bytes((BIT_ZLIB,)) + b"no es zlib",
+        "JSON binario inválido": bytes((0,)) + b"\xff{",
+        f"zlib de más de {MAX_BYTES_DESCOMPRIMIDOS} bytes descomprimido": bytes((BIT_ZLIB,)) + zlib.compress(
+            b'{"tipo": "x", "relleno": "' + b"a" * MAX_BYTES_DESCOMPRIMIDOS + b'"}'
+        ),
+    }
+    if "msgpack" in CODIFICACIONES:
+        invalidos["MessagePack inválido"] = bytes((BIT_MSGPACK,)) + b"\xc1"
+    for descripcion, mensaje in invalidos.items():
+        try:
+            decodificar_mensaje(mensaje)
+        except MensajeInvalido:
+            continue
+        except Exception as e:
+            problemas.append(f"protocolo: {descripcion} lanza {type(e).__name__} en lugar de MensajeInvalido")
+            continue
+        problemas.append(f"protocolo: {descripcion} no se rechaza")
+    return problemas
+
+#comprobar_almacen() guarda filas del corpus con la misma clave que el servidor (la ruta absoluta) y comprueba lo que
+#se lee de vuelta del almacén, del índice de nombres y de la analítica.
+def comprobar_almacen(corpus: list) -> list:
+    columnas = extractor.COLUMNAS_ORDENADAS
+    filas = [extractor.do_actual_processing_for_file(txt, nombre).a_fila(columnas) for nombre, txt in corpus[:MAX_FILAS_ALMACEN]]
+    if not filas:
+        return ["almacen: el corpus no tiene archivos .txt"]
+    problemas = []
+    with tempfile.TemporaryDirectory(prefix="comprobaciones_") as directorio:
+        ruta = os.path.join(directorio, "resultados.sqlite3")
+        # Una base de antes de las claves (archivo UNIQUE) con la primera fila: debe migrar y sustituirse al reextraer.
+        conexion = sqlite3.connect(ruta)
+        conexion.executescript(
+            "CREATE TABLE filas (id INTEGER PRIMARY KEY, archivo TEXT NOT NULL UNIQUE, guardada_en REAL NOT NULL, fila TEXT NOT NULL);"
+            "CREATE TABLE valores (fila_id INTEGER NOT NULL, columna TEXT NOT NULL, valor TEXT NOT NULL);"
+        )
+        conexion.execute("INSERT INTO filas (archivo, guardada_en, fila) VALUES (?, 0, ?)", (filas[0][COLUMNA_NOMBRE_ARCHIVO], json.dumps(filas[0])))
+        conexion.commit()
+        conexion.close()
+        almacen = AlmacenResultados(ruta, intervalo_segundos=0.01)
+        if [clave for clave, _ in almacen.iterar_filas()] != [filas[0][COLUMNA_NOMBRE_ARCHIVO]]:
+            problemas.append("almacen: la base por nombre de archivo no se migró con clave = nombre")
+
+        # Cada archivo en dos directorios (mismo nombre, dos filas); luego se reextrae uno con otro resultado.
+        esperadas = {}
+        almacen.iniciar()
+        for copia in ("a", "b"):
+            for fila in filas:
+                clave = os.path.join(directorio, copia, fila[COLUMNA_NOMBRE_ARCHIVO])
+                almacen.agregar(fila, clave)
+                esperadas[clave] = fila
+        clave_reextraida = next(iter(esperadas))
+        esperadas[clave_reextraida] = {**esperadas[clave_reextraida], "Country of Origin": "Atlantis"}
+        almacen.agregar(esperadas[clave_reextraida], clave_reextraida)
+        almacen.cerrar()
+        if almacen.estadisticas["errores"]:
+            problemas.append(f"almacen: {almacen.estadisticas['errores']} transacción(es) fallida(s)")
+
+        almacen = AlmacenResultados(ruta)  # Otra instancia: lo leído viene de la base, no de memoria.
+        guardadas = dict(almacen.iterar_filas())
+        if guardadas != esperadas:
+            sobrantes, faltan = set(guardadas) - set(esperadas), set(esperadas) - set(guardadas)
+            distintas = [clave for clave in set(guardadas) & set(esperadas) if guardadas[clave] != esperadas[clave]]
+            problemas.append(f"almacen: filas guardadas distintas de las esperadas ({len(sobrantes)} de más, {len(faltan)} "
+                             f"de menos, {len(distintas)} con otro contenido)")
+
+        paises = Counter(valor for fila in esperadas.values() for valor in valores_indexables(fila["Country of Origin"]))
+        for pais, documentos in paises.most_common(3) + [("atlantis", 1)]:
+            total = almacen.consultar({"Country of Origin": pais.upper()})["total"]
+            if total != documentos:
+                problemas.append(f"almacen: consultar() por país '{pais}' da {total} fila(s) en lugar de {documentos}")
+        paginadas, pagina = [], 1
+        while True:
+            filas_pagina = almacen.consultar({}, pagina, 7)["filas"]
+            if not filas_pagina:
+                break
+            paginadas += filas_pagina
+            pagina += 1
+        clave_json = lambda fila: json.dumps(fila, sort_keys=True)
+        if sorted(map(clave_json, paginadas)) != sorted(map(clave_json, esperadas.values())):
+            problemas.append(f"almacen: las páginas de consultar() dan {len(paginadas)} fila(s) que no son las {len(esperadas)} guardadas")
+        almacen.cerrar()
+
+    indice, analitica = IndiceNombres(), AnaliticaCorpus()
+    for clave, fila in list(esperadas.items()) + [(clave_reextraida, esperadas[clave_reextraida])]:  # Reindexar no duplica.
+        indice.agregar_fila(fila, clave)
+        analitica.agregar_fila(fila, clave)
+    # Una aparición por archivo y columna (el índice guarda (archivo, columna, clave)).
+    nombres = Counter(
+        nombre for fila in esperadas.values() for columna in indice.columnas
+        for nombre in {normalizar_nombre(n) for n in valores_indexables(fila.get(columna))} if nombre
+    )
+    for nombre, apariciones in nombres.most_common(3):
+        encontrados = [r for r in indice.buscar(nombre, 5, 0.99) if normalizar_nombre(r["nombre"]) == nombre]
+        total = encontrados[0]["total_apariciones"] if encontrados else 0
+        if total != apariciones:
+            problemas.append(f"almacen: el índice de nombres da {total} aparición(es) de '{nombre}' en lugar de {apariciones}")
+    if analitica.num_documentos() != len(esperadas):
+        problemas.append(f"almacen: la analítica cuenta {analitica.num_documentos()} documento(s) en lugar de {len(esperadas)}")
+    distribucion = analitica.instantanea(1000)["agregados"]["paises"]
+    obtenida = {etiqueta.casefold(): n for etiqueta, n in zip(distribucion["etiquetas"], distribucion["conteos"]) if n}
+    esperada = Counter(v for fila in esperadas.values() for v in {v.casefold() for v in valores_de_celda(fila["Country of Origin"])})
+    if obtenida != dict(esperada):
+        problemas.append("almacen: la distribución de países de la analítica no coincide con las filas guardadas")
+    return problemas
+
+# COMPROBACIONES son las comprobaciones disponibles, en el orden en que se ejecutan; cada una recibe el corpus.
+COMPROBACIONES = {
+    "motor": comprobar_motor,
+    "resultado": comprobar_resultado,
+    "protocolo": comprobar_protocolo,
+    "almacen": comprobar_almacen,
+}
+
+#ejecutar_comprobaciones() ejecuta las comprobaciones pedidas (None: todas), imprime una línea por cada una y retorna
+#la lista de problemas encontrados (vacía si todo coincide).
+def ejecutar_comprobaciones(directorio: str = TEXT_FILES_DIR, nombres: list = None, max_archivos: int = None) -> list:
+    corpus = leer_corpus(directorio, max_archivos)
+    print(f"Comprobaciones sobre {len(corpus)} archivo(s) de {directorio} (patrones {extractor.HUELLA_PATRONES}).", flush=True)
+    problemas = []
+    for nombre in nombres or list(COMPROBACIONES):
+        t0 = time.perf_counter()
+        encontrados = COMPROBACIONES[nombre](corpus)
+        estado = "OK" if not encontrados else f"{len(encontrados)} fallo(s)"
+        print(f"  {nombre:<10} {estado:<12} {time.perf_counter() - t0:>7.2f}s", flush=True)
+        problemas += encontrados
+    for problema in problemas:
+        print(f"FALLO: {problema}", flush=True)
+    return problemas
+
+#main() ejecuta las comprobaciones pedidas por línea de comandos; exit 1 si alguna falla.
+def main():
+    parser = argparse.ArgumentParser(description="Comprueba que las piezas optimizadas del servidor den lo mismo que su referencia.")
+    parser.add_argument("--input-dir", default=TEXT_FILES_DIR, help="Corpus de .txt sobre el que comprobar el motor.")
+    parser.add_argument("--only", help=f"Comprobaciones separadas por coma ({', '.join(COMPROBACIONES)}); por defecto, todas.")
+    parser.add_argument("--max-files", type=int, help="Usar solo los primeros N archivos del corpus (más rápido).")
+    args = parser.parse_args()
+    nombres = [n.strip() for n in args.only.split(",") if n.strip()] if args.only else None
+    desconocidas = [n for n in nombres or [] if n not in COMPROBACIONES]
+    if desconocidas:
+        parser.error(f"comprobaciones desconocidas: {', '.join(desconocidas)}")
+    if ejecutar_comprobaciones(args.input_dir, nombres, args.max_files):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# conjuntos_patrones.py carga los patrones de extracción (PATRONES_DATA y sus vocabularios) desde archivos de
+# configuración versionados en lugar de tenerlos escritos en servidor.py:
+#   patrones/v1.json, patrones/v2.json, ...  (la versión es el nombre del archivo)
+# Cada archivo define:
+#   - "vocabularios": listas con nombre (NOMBRES_PERSONA, OCUPACIONES...);
+#   - "fragmentos": trozos de regex con nombre (AÑO, FECHA...) que pueden usar otros fragmentos;
+#   - "columnas": en orden, {"columna", "vocabularios": [...], "plural"} (alternativa de palabras enteras, grupo 0)
+#     o {"columna", "regex", "grupo"}. En "regex" y en los fragmentos, ${NOMBRE} se sustituye por el fragmento o por
+#     la alternativa (?:a|b|...) del vocabulario de ese nombre.
+# Un ConjuntoPatrones se compila una sola vez (MotorExtraccion) y se identifica por su clave (versión, huella).
+# RegistroPatrones guarda los conjuntos compilados de un proceso: el servidor recarga el directorio y cambia el activo
+# en caliente (comando 'patterns'), y los workers compilan la versión que les pide cada tarea la primera vez que la ven.
+# Las versiones son inmutables: para cambiar un vocabulario se crea un archivo nuevo (v2.json) y se activa.
+import hashlib, json, os, re, threading
+from collections import OrderedDict
+
+from motor_extraccion import MotorExtraccion, FLAGS_PATRONES
+
+DIRECTORIO_PATRONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "patrones")
+EXTENSION_PATRONES = ".json"
+COLUMNA_NOMBRE_ARCHIVO = "Processed File Name"
+MAX_CONJUNTOS_COMPILADOS = 8  # Conjuntos compilados que un proceso mantiene en memoria (el activo nunca se expulsa).
+REGEX_MARCADOR = re.compile(r"\$\{(\w+)\}")
+REGEX_VERSION = re.compile(r"^[\w.-]+$")
+
+
+class ErrorConjuntoPatrones(ValueError):
+    """Un archivo de patrones no existe, es inválido o no coincide con la huella esperada."""
+
+
+# Aqui con build_pattern() se construyen los patrones regex para los nombres, ocupaciones, etc.
+def build_pattern(words, *, plural=False, boundaries=True):
+    esc = [re.escape(w) for w in words]
+    pat = r"(?:%s)" % "|".join(esc)
+    if plural: pat = f"{pat}s?"
+    return rf"\b{pat}\b" if boundaries else pat
+
+#orden_natural() es la clave de orden de las versiones: "v10" va después de "v9".
+def orden_natural(version: str):
+    return [(0, int(pieza), "") if pieza.isdigit() else (1, 0, pieza) for pieza in re.split(r"(\d+)", version) if pieza]
+
+#ruta_version() retorna la ruta del archivo de una versión dentro de directorio.
+def ruta_version(directorio: str, version: str) -> str:
+    if not isinstance(version, str) or not REGEX_VERSION.match(version):
+        raise ErrorConjuntoPatrones(f"Nombre de versión de patrones inválido: {version!r}")
+    return os.path.join(directorio, version + EXTENSION_PATRONES)
+
+#leer_definicion() lee el archivo de una versión; lanza ErrorConjuntoPatrones si no existe o no es JSON.
+def leer_definicion(directorio: str, version: str) -> dict:
+    ruta = ruta_version(directorio, version)
+    try:
+        with open(ruta, encoding="utf-8") as fh:
+            definicion = json.load(fh)
+    except FileNotFoundError:
+        raise ErrorConjuntoPatrones(f"No existe la versión de patrones '{version}' ({ruta}).") from None
+    except (OSError, ValueError) as e:
+        raise ErrorConjuntoPatrones(f"No se pudo leer '{ruta}': {e}") from None
+    if not isinstance(definicion, dict):
+        raise ErrorConjuntoPatrones(f"'{ruta}' debe contener un objeto JSON.")
+    return definicion
+
+#expandir_marcadores() sustituye los ${NOMBRE} de una regex por sus fragmentos (recursivamente) o vocabularios.
+def expandir_marcadores(regex: str, fragmentos: dict, vocabularios: dict, en_curso: tuple = ()) -> str:
+    def sustituir(m):
+        nombre = m.group(1)
+        if nombre in fragmentos:
+            if nombre in en_curso:
+                raise ErrorConjuntoPatrones(f"Fragmento circular: {' -> '.join(en_curso + (nombre,))}")
+            return expandir_marcadores(fragmentos[nombre], fragmentos, vocabularios, en_curso + (nombre,))
+        if nombre in vocabularios:
+            return build_pattern(vocabularios[nombre], boundaries=False)
+        raise ErrorConjuntoPatrones(f"Marcador desconocido: ${{{nombre}}}")
+    return REGEX_MARCADOR.sub(sustituir, regex)
+
+#construir_patrones_data() convierte una definición en la lista PATRONES_DATA [(columna, regex, grupo)], validando
+#cada regex; lanza ErrorConjuntoPatrones con la columna culpable.
+def construir_patrones_data(definicion: dict) -> list:
+    vocabularios = definicion.get("vocabularios", {})
+    fragmentos = definicion.get("fragmentos", {})
+    columnas = definicion.get("columnas")
+    if not isinstance(vocabularios, dict) or not isinstance(fragmentos, dict):
+        raise ErrorConjuntoPatrones("'vocabularios' y 'fragmentos' deben ser objetos.")
+    for nombre, palabras in vocabularios.items():
+        if not isinstance(palabras, list) or not palabras or not all(isinstance(p, str) and p for p in palabras):
+            raise ErrorConjuntoPatrones(f"El vocabulario '{nombre}' debe ser una lista no vacía de textos.")
+    if not all(isinstance(regex, str) for regex in fragmentos.values()):
+        raise ErrorConjuntoPatrones("Los fragmentos deben ser textos.")
+    if not isinstance(columnas, list) or not columnas:
+        raise ErrorConjuntoPatrones("'columnas' debe ser una lista no vacía.")
+
+    patrones_data, vistas = [], set()
+    for espec in columnas:
+        columna = espec.get("columna") if isinstance(espec, dict) else None
+        if not isinstance(columna, str) or not columna or columna == COLUMNA_NOMBRE_ARCHIVO or columna in vistas:
+            raise ErrorConjuntoPatrones(f"Columna inválida o repetida: {espec!r}")
+        vistas.add(columna)
+        if "vocabularios" in espec:
+            nombres = espec["vocabularios"]
+            if not isinstance(nombres, list) or not nombres or any(nombre not in vocabularios for nombre in nombres):
+                raise ErrorConjuntoPatrones(f"Columna '{columna}': 'vocabularios' debe nombrar vocabularios definidos.")
+            palabras = [palabra for nombre in nombres for palabra in vocabularios[nombre]]
+            regex, grupo = build_pattern(palabras, plural=espec.get("plural") is True), 0
+        else:
+            regex, grupo = espec.get("regex"), espec.get("grupo", 0)
+            if not isinstance(regex, str) or not isinstance(grupo, int) or isinstance(grupo, bool) or grupo < 0:
+                raise ErrorConjuntoPatrones(f"Columna '{columna}': hace falta 'regex' (texto) y 'grupo' (entero >= 0).")
+            regex = expandir_marcadores(regex, fragmentos, vocabularios)
+        try:
+            compilada = re.compile(regex, FLAGS_PATRONES)
+        except re.error as e:
+            raise ErrorConjuntoPatrones(f"Columna '{columna}': regex inválida: {e}") from None
+        if grupo > compilada.groups:
+            raise ErrorConjuntoPatrones(f"Columna '{columna}': la regex no tiene grupo {grupo}.")
+        patrones_data.append((columna, regex, grupo))
+    return patrones_data
+
+#calcular_huella() identifica unos patrones (y la lógica de extracción); la usan la caché de filas y el manifiesto.
+def calcular_huella(version_extraccion: int, patrones_data: list, columnas_ordenadas: list) -> str:
+    return hashlib.sha256(json.dumps([version_extraccion, patrones_data, columnas_ordenadas]).encode("utf-8")).hexdigest()[:16]
+
+
+class ConjuntoPatrones:
+    """Una versión de los patrones ya compilada; clave = (versión, huella) la identifica entre procesos."""
+
+    def __init__(self, version: str, definicion: dict, version_extraccion: int):
+        self.version = version
+        self.definicion = definicion
+        self.patrones_data = construir_patrones_data(definicion)
+        self.columnas_ordenadas = [col for col, _, _ in self.patrones_data] + [COLUMNA_NOMBRE_ARCHIVO]
+        self.huella = calcular_huella(version_extraccion, self.patrones_data, self.columnas_ordenadas)
+        # MOTOR resuelve todas las columnas literales en una sola pasada y solo ejecuta como regex las estructurales.
+        self.motor = MotorExtraccion(self.patrones_data)
+
+    @property
+    def clave(self) -> tuple:
+        return self.version, self.huella
+
+    def describir(self) -> dict:
+        return {
+            "version": self.version,
+            "fingerprint": self.huella,
+            "description": self.definicion.get("descripcion", ""),
+            "columns": len(self.patrones_data),
+            "vocabularies": {nombre: len(palabras) for nombre, palabras in self.definicion.get("vocabularios", {}).items()},
+        }
+
+
+class RegistroPatrones:
+    """
+    Conjuntos de patrones de un proceso. En el servidor, recargar() incorpora las versiones nuevas del directorio y
+    activar() elige la que usan los trabajos nuevos; obtener(clave) retorna el conjunto de una tarea (compilándolo
+    la primera vez, desde la definición recibida o desde el directorio). Todas las versiones deben tener las mismas
+    columnas en el mismo orden (son el esquema de las filas). Seguro para llamarse desde varios threads.
+    """
+
+    def __init__(self, version_extraccion: int, directorio: str = DIRECTORIO_PATRONES):
+        self.version_extraccion = version_extraccion
+        self.directorio = directorio
+        self.columnas = None  # Las del primer conjunto compilado; las demás versiones deben coincidir.
+        self.activo = None
+        self._compilados = OrderedDict()  # clave -> ConjuntoPatrones, del menos al más usado.
+        self._versiones = {}  # versión -> clave de las versiones cargadas (las que se pueden fijar en un trabajo).
+        self._lock = threading.Lock()
+
+    def versiones_en_disco(self) -> list:
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return []
+        versiones = [n[:-len(EXTENSION_PATRONES)] for n in nombres if n.endswith(EXTENSION_PATRONES)]
+        return sorted((v for v in versiones if REGEX_VERSION.match(v)), key=orden_natural)
+
+    def versiones_cargadas(self) -> list:
+        with self._lock:
+            return sorted(self._versiones, key=orden_natural)
+
+    def _compilar(self, version: str, definicion: dict = None) -> ConjuntoPatrones:
+        conjunto = ConjuntoPatrones(version, definicion if definicion is not None else leer_definicion(self.directorio, version),
+                                    self.version_extraccion)
+        with self._lock:
+            if self.columnas is None:
+                self.columnas = conjunto.columnas_ordenadas
+            elif conjunto.columnas_ordenadas != self.columnas:
+                raise ErrorConjuntoPatrones(f"La versión '{version}' no define las mismas columnas (en el mismo orden) que las demás.")
+            self._compilados[conjunto.clave] = conjunto
+            self._expulsar()
+        return conjunto
+
+    def _expulsar(self):
+        """Descarta los conjuntos menos usados por encima de MAX_CONJUNTOS_COMPILADOS (llamar con el lock tomado)."""
+        for clave in list(self._compilados):
+            if len(self._compilados) <= MAX_CONJUNTOS_COMPILADOS:
+                break
+            if self.activo is None or clave != self.activo.clave:
+                del self._compilados[clave]
+
+    def cargar(self, version: str) -> ConjuntoPatrones:
+        """Compila una versión del directorio y la deja disponible; una versión ya cargada no puede cambiar."""
+        definicion = leer_definicion(self.directorio, version)
+        with self._lock:
+            clave = self._versiones.get(version)
+        if clave is not None:
+            patrones_data = construir_patrones_data(definicion)
+            huella = calcular_huella(self.version_extraccion, patrones_data, [col for col, _, _ in patrones_data] + [COLUMNA_NOMBRE_ARCHIVO])
+            if huella != clave[1]:
+                raise ErrorConjuntoPatrones(f"La versión '{version}' cambió en disco; las versiones son inmutables (crea una nueva).")
+            return self.obtener(clave)
+        conjunto = self._compilar(version, definicion)
+        with self._lock:
+            self._versiones[version] = conjunto.clave
+        return conjunto
+
+    def recargar(self) -> dict:
+        """Carga las versiones nuevas del directorio. Retorna {"nuevas": [...], "sin_cambios": [...], "errores": {versión: mensaje}}."""
+        informe = {"nuevas": [], "sin_cambios": [], "errores": {}}
+        for version in self.versiones_en_disco():
+            ya_cargada = version in self._versiones
+            try:
+                self.cargar(version)
+            except ErrorConjuntoPatrones as e:
+                informe["errores"][version] = str(e)
+                continue
+            informe["sin_cambios" if ya_cargada else "nuevas"].append(version)
+        return informe
+
+    def activar(self, version: str = None) -> ConjuntoPatrones:
+        """
+        Activa una versión (cargándola si hace falta). Sin versión activa la más reciente del directorio que se pueda
+        compilar; lanza ErrorConjuntoPatrones con el error de la última si ninguna se puede.
+        """
+        candidatas = [version] if version is not None else list(reversed(self.versiones_en_disco()))
+        if not candidatas:
+            raise ErrorConjuntoPatrones(f"No hay archivos de patrones en '{self.directorio}'.")
+        error = None
+        for candidata in candidatas:
+            try:
+                conjunto = self.cargar(candidata)
+            except ErrorConjuntoPatrones as e:
+                error = e
+                continue
+            with self._lock:
+                self.activo = conjunto
+            return conjunto
+        raise error
+
+    def obtener(self, clave: tuple = None, definicion: dict = None) -> ConjuntoPatrones:
+        """
+        Conjunto de una clave (versión, huella); None es el activo y huella None acepta la versión tal como esté.
+        Si no está compilado se compila desde definicion (la que envía el coordinador a un nodo remoto) o desde el
+        directorio; lanza ErrorConjuntoPatrones si su huella no es la pedida.
+        """
+        if clave is None:
+            if self.activo is None:
+                return self.activar()
+            return self.activo
+        version, huella = clave
+        if huella is None:
+            with self._lock:
+                cargada = self._versiones.get(version)
+            if cargada is None:
+                return self.cargar(version)
+            huella = cargada[1]
+        with self._lock:
+            conjunto = self._compilados.get((version, huella))
+            if conjunto is not None:
+                self._compilados.move_to_end(conjunto.clave)
+                return conjunto
+        conjunto = self._compilar(version, definicion)
+        if huella is not None and conjunto.huella != huella:
+            with self._lock:
+                self._compilados.pop(conjunto.clave, None)
+            raise ErrorConjuntoPatrones(f"La versión de patrones '{version}' no coincide con la huella pedida ({huella}).")
+        return conjunto
+
+    def describir(self) -> list:
+        """Las versiones cargadas, de la más antigua a la más reciente, marcando la activa."""
+        descripciones = []
+        for version in self.versiones_cargadas():
+            descripcion = self.obtener(self._versiones[version]).describir()
+            descripcion["active"] = self.activo is not None and self.activo.version == version
+            descripciones.append(descripcion)
+        return descripciones
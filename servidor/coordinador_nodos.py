@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+# coordinador_nodos.py reparte la extracción de un lote entre varios nodos: el pool local del servidor y los nodos
+# remotos (nodo_extraccion.py) que se conectan al WebSocket del servidor y registran su capacidad (workers).
+#   - Reparto: cada archivo se asigna a la cola del nodo con menos bytes pendientes por worker (shards por bytes).
+#   - Robo de trabajo: un nodo con workers libres y su cola vacía toma el último archivo de la cola más cargada.
+#   - Rezagados: sin colas que robar, un nodo libre lanza una copia de respaldo de un archivo que lleva en curso
+#     mucho más de lo esperado para su tamaño; gana el primer resultado que llega.
+#   - Caída de un nodo: sus archivos en cola y en curso vuelven a repartirse entre los nodos que quedan.
+# El modo de concurrencia "distributed" (o "auto" con nodos remotos conectados) usa este reparto en el pool.
+import asyncio, base64, collections, itertools, logging, os, time
+
+import servidor as extractor
+from resultado_extraccion import ResultadoExtraccion, compartir_tupla
+
+MODO_DISTRIBUIDO = "distributed"
+FACTOR_REZAGADO = 3.0  # Un archivo es rezagado si lleva más de FACTOR_REZAGADO veces lo esperado para su tamaño...
+MIN_SEGUNDOS_REZAGADO = 1.0  # ...y al menos este tiempo.
+PESO_MEDIA_VELOCIDAD = 0.2  # Peso de cada archivo terminado en la media móvil de segundos por byte.
+
+
+class NodoCaido(Exception):
+    """El nodo se desconectó con el archivo en curso; el coordinador lo vuelve a repartir."""
+
+
+class TareaNodo:
+    """Un archivo a extraer en algún nodo; futuro se resuelve con (ResultadoExtraccion, mensaje_error)."""
+
+    def __init__(self, ruta: str, tamano: int, por_nodo: dict = None, patrones: tuple = None):
+        self.ruta = ruta
+        self.tamano = tamano
+        self.patrones = patrones  # Clave (versión, huella) de los patrones del trabajo (None: los activos).
+        self.futuro = asyncio.get_running_loop().create_future()
+        self.intentos = {}  # id_nodo -> time.perf_counter() de inicio, de los intentos en curso.
+        self.por_nodo = por_nodo  # Contador id_nodo -> archivos del trabajo al que pertenece (o None).
+
+
+class NodoExtraccion:
+    """Base de un nodo: capacidad (workers), cola de tareas asignadas, tareas en curso y estadísticas."""
+
+    def __init__(self, id_nodo: str, capacidad: int, nombre: str = None):
+        self.id_nodo = id_nodo
+        self.nombre = nombre or id_nodo
+        self.capacidad = max(1, capacidad)
+        self.cola = collections.deque()
+        self.en_curso = set()
+        self.vivo = True
+        self.registrado_en = time.time()
+        self.estadisticas = {"archivos": 0, "bytes": 0, "segundos": 0.0, "robados": 0, "respaldos": 0, "fallidos": 0}
+
+    def bytes_pendientes(self) -> int:
+        return sum(tarea.tamano for tarea in self.cola) + sum(tarea.tamano for tarea in self.en_curso)
+
+    async def ejecutar(self, tarea: TareaNodo):
+        """Extrae el archivo de la tarea y retorna (ResultadoExtraccion, mensaje_error)."""
+        raise NotImplementedError
+
+    def cerrar(self):
+        self.vivo = False
+
+    def describir(self) -> dict:
+        return {
+            "node": self.id_nodo,
+            "name": self.nombre,
+            "remote": isinstance(self, NodoRemoto),
+            "capacity": self.capacidad,
+            "queued": len(self.cola),
+            "running": len(self.en_curso),
+            "files": self.estadisticas["archivos"],
+            "bytes": self.estadisticas["bytes"],
+            "busy_seconds": round(self.estadisticas["segundos"], 3),
+            "stolen": self.estadisticas["robados"],
+            "backups": self.estadisticas["respaldos"],
+            "failed": self.estadisticas["fallidos"],
+        }
+
+
+class NodoLocal(NodoExtraccion):
+    """El pool del propio servidor; extraer(ruta, patrones) es una corutina que retorna (ResultadoExtraccion, mensaje_error)."""
+
+    def __init__(self, capacidad: int, extraer, id_nodo: str = "local"):
+        super().__init__(id_nodo, capacidad)
+        self.extraer = extraer
+
+    async def ejecutar(self, tarea: TareaNodo):
+        return await self.extraer(tarea.ruta, tarea.patrones)
+
+
+#leer_bytes() lee un archivo entero en binario (para enviarlo a un nodo remoto).
+def leer_bytes(ruta: str) -> bytes:
+    with open(ruta, "rb") as fh:
+        return fh.read()
+
+
+class NodoRemoto(NodoExtraccion):
+    """
+    Un nodo_extraccion.py conectado por WebSocket. enviar es la corutina enviar(tipo_mensaje, data) hacia el nodo y
+    acepta_bytes() indica si su protocolo (MessagePack) admite bytes; si no, el contenido viaja en base64. Con
+    comparte_disco el nodo ve las mismas rutas que el servidor y solo se le envía la ruta. La definición de cada
+    versión de los patrones viaja con la primera tarea que la usa; las siguientes solo llevan su clave.
+    """
+
+    _ids_tarea = itertools.count(1)
+
+    def __init__(self, id_nodo: str, capacidad: int, enviar, acepta_bytes=lambda: False, comparte_disco: bool = False,
+                 nombre: str = None):
+        super().__init__(id_nodo, capacidad, nombre)
+        self.enviar = enviar
+        self.acepta_bytes = acepta_bytes
+        self.comparte_disco = comparte_disco
+        self._pendientes = {}  # id_tarea -> Future del resultado que enviará el nodo.
+        self._patrones_enviados = set()  # Claves (versión, huella) cuya definición ya tiene el nodo.
+
+    async def ejecutar(self, tarea: TareaNodo):
+        loop = asyncio.get_running_loop()
+        nombre = os.path.basename(tarea.ruta)
+        payload = {"id_tarea": str(next(self._ids_tarea)), "nombre": nombre}
+        conjunto = extractor.conjunto_patrones(tarea.patrones)
+        payload["patrones"] = list(conjunto.clave)
+        if conjunto.clave not in self._patrones_enviados:
+            payload["definicion_patrones"] = conjunto.definicion
+        if self.comparte_disco:
+            payload["ruta"] = tarea.ruta
+        else:
+            try:
+                datos = await loop.run_in_executor(None, leer_bytes, tarea.ruta)
+            except OSError as e_lectura:
+                return ResultadoExtraccion(nombre), extractor.mensaje_error_lectura(tarea.ruta, e_lectura)
+            payload["datos"] = datos if self.acepta_bytes() else base64.b64encode(datos).decode("ascii")
+        if not self.vivo:
+            raise NodoCaido(self.id_nodo)
+        futuro = loop.create_future()
+        self._pendientes[payload["id_tarea"]] = futuro
+        try:
+            await self.enviar("tarea_extraccion", payload)
+            self._patrones_enviados.add(conjunto.clave)
+            resultado, mensaje_error = await futuro
+        finally:
+            self._pendientes.pop(payload["id_tarea"], None)
+        resultado.archivo = nombre
+        return resultado, mensaje_error
+
+    def recibir_resultado(self, data: dict):
+        """Resuelve la tarea de un mensaje resultado_tarea del nodo (las que ya no se esperan se ignoran)."""
+        futuro = self._pendientes.get(data.get("id_tarea"))
+        if futuro is None or futuro.done():
+            return
+        if data.get("error_nodo"):
+            futuro.set_exception(RuntimeError(f"Nodo {self.nombre}: {data['error_nodo']}"))
+            return
+        valores = tuple(compartir_tupla(tuple(valores_columna)) for valores_columna in data.get("valores", []))
+        futuro.set_result((ResultadoExtraccion(data.get("archivo", ""), int(data.get("encontradas", 0)), valores), data.get("error", "None")))
+
+    def cerrar(self):
+        super().cerrar()
+        for futuro in self._pendientes.values():
+            if not futuro.done():
+                futuro.set_exception(NodoCaido(self.id_nodo))
+
+
+class CoordinadorNodos:
+    """Registro de nodos y reparto de archivos entre ellos (ver cabecera del módulo). Todo corre en el bucle de eventos."""
+
+    def __init__(self):
+        self.nodos = {}  # id_nodo -> NodoExtraccion
+        self.segundos_por_byte = None  # Media móvil de lo que tarda un byte (para detectar rezagados).
+        self.estadisticas = {"redespachados": 0, "respaldos_ganadores": 0}
+        self.sin_nodo = collections.deque()  # Tareas que llegaron sin ningún nodo vivo; esperan al próximo que se registre.
+        self._ejecuciones = set()  # Referencias a las ejecuciones en curso (asyncio solo guarda referencias débiles).
+
+    @property
+    def limite(self) -> int:
+        """Workers de todos los nodos vivos (cupo de tareas en curso; ver ajuste_concurrencia.SemaforoAjustable)."""
+        return max(1, sum(nodo.capacidad for nodo in self.nodos.values() if nodo.vivo))
+
+    def hay_nodos_remotos(self) -> bool:
+        return any(isinstance(nodo, NodoRemoto) and nodo.vivo for nodo in self.nodos.values())
+
+    def registrar(self, nodo: NodoExtraccion):
+        self.nodos[nodo.id_nodo] = nodo
+        logging.info(f"Nodo de extracción '{nodo.nombre}' registrado con {nodo.capacidad} worker(s). Capacidad total: {self.limite}.")
+        self._despachar()
+
+    def quitar(self, id_nodo: str):
+        """Da de baja un nodo (desconectado): sus tareas en cola se reparten y las en curso fallan con NodoCaido."""
+        nodo = self.nodos.pop(id_nodo, None)
+        if nodo is None:
+            return
+        nodo.cerrar()
+        pendientes = list(nodo.cola)
+        nodo.cola.clear()
+        logging.warning(
+            f"Nodo de extracción '{nodo.nombre}' dado de baja con {len(pendientes)} archivo(s) en cola y "
+            f"{len(nodo.en_curso)} en curso; se vuelven a repartir."
+        )
+        for tarea in pendientes:
+            self.estadisticas["redespachados"] += 1
+            self._asignar(tarea)
+        self._despachar()
+
+    def recibir_resultado(self, id_nodo: str, data: dict):
+        nodo = self.nodos.get(id_nodo)
+        if isinstance(nodo, NodoRemoto):
+            nodo.recibir_resultado(data)
+
+    async def extraer(self, ruta: str, tamano: int, por_nodo: dict = None, patrones: tuple = None):
+        """Extrae un archivo en algún nodo con los patrones de la clave patrones y retorna (ResultadoExtraccion, mensaje_error)."""
+        tarea = TareaNodo(ruta, tamano, por_nodo, patrones)
+        self._asignar(tarea)
+        self._despachar()
+        return await tarea.futuro
+
+    def _asignar(self, tarea: TareaNodo):
+        vivos = [nodo for nodo in self.nodos.values() if nodo.vivo]
+        if not vivos:
+            self.sin_nodo.append(tarea)
+            return
+        nodo = min(vivos, key=lambda n: (n.bytes_pendientes() + tarea.tamano) / n.capacidad)
+        nodo.cola.append(tarea)
+
+    def _despachar(self):
+        """Llena los workers libres de cada nodo: su cola, luego robo de trabajo y luego respaldos de rezagados."""
+        while self.sin_nodo and any(nodo.vivo for nodo in self.nodos.values()):
+            self._asignar(self.sin_nodo.popleft())
+        asignado = True
+        while asignado:
+            asignado = False
+            for nodo in list(self.nodos.values()):
+                if nodo.vivo and len(nodo.en_curso) < nodo.capacidad:
+                    tarea = self._siguiente_para(nodo)
+                    if tarea is not None:
+                        ejecucion = asyncio.ensure_future(self._ejecutar(nodo, tarea))
+                        self._ejecuciones.add(ejecucion)
+                        ejecucion.add_done_callback(self._ejecuciones.discard)
+                        asignado = True
+
+    def _siguiente_para(self, nodo: NodoExtraccion):
+        while nodo.cola:
+            tarea = nodo.cola.popleft()
+            if not tarea.futuro.done():
+                return tarea
+        candidatos = [otro for otro in self.nodos.values() if otro is not nodo and otro.cola]
+        while candidatos:
+            victima = max(candidatos, key=lambda n: sum(t.tamano for t in n.cola) / n.capacidad)
+            tarea = victima.cola.pop()
+            if not victima.cola:
+                candidatos.remove(victima)
+            if not tarea.futuro.done():  # Las tareas de un trabajo cancelado se descartan.
+                nodo.estadisticas["robados"] += 1
+                return tarea
+        if self.segundos_por_byte is None:
+            return None
+        ahora = time.perf_counter()
+        for otro in self.nodos.values():
+            for tarea in otro.en_curso:
+                if nodo.id_nodo in tarea.intentos or len(tarea.intentos) > 1 or tarea.futuro.done():
+                    continue
+                transcurrido = ahora - min(tarea.intentos.values())
+                esperado = tarea.tamano * self.segundos_por_byte
+                if transcurrido > max(MIN_SEGUNDOS_REZAGADO, FACTOR_REZAGADO * esperado):
+                    nodo.estadisticas["respaldos"] += 1
+                    return tarea
+        return None
+
+    async def _ejecutar(self, nodo: NodoExtraccion, tarea: TareaNodo):
+        respaldo = bool(tarea.intentos)
+        tarea.intentos[nodo.id_nodo] = t0 = time.perf_counter()
+        nodo.en_curso.add(tarea)
+        try:
+            salida = await nodo.ejecutar(tarea)
+        except NodoCaido:
+            if not tarea.futuro.done() and len(tarea.intentos) == 1:
+                self.estadisticas["redespachados"] += 1
+                tarea.intentos.pop(nodo.id_nodo, None)
+                self._asignar(tarea)
+        except Exception as exc:
+            nodo.estadisticas["fallidos"] += 1
+            if not tarea.futuro.done():
+                tarea.futuro.set_exception(exc)
+        else:
+            duracion = time.perf_counter() - t0
+            nodo.estadisticas["archivos"] += 1
+            nodo.estadisticas["bytes"] += tarea.tamano
+            nodo.estadisticas["segundos"] += duracion
+            if tarea.tamano > 0:
+                muestra = duracion / tarea.tamano
+                self.segundos_por_byte = muestra if self.segundos_por_byte is None else (
+                    (1 - PESO_MEDIA_VELOCIDAD) * self.segundos_por_byte + PESO_MEDIA_VELOCIDAD * muestra
+                )
+            if not tarea.futuro.done():
+                if respaldo:
+                    self.estadisticas["respaldos_ganadores"] += 1
+                if tarea.por_nodo is not None:
+                    tarea.por_nodo[nodo.id_nodo] = tarea.por_nodo.get(nodo.id_nodo, 0) + 1
+                tarea.futuro.set_result(salida)
+        finally:
+            nodo.en_curso.discard(tarea)
+            tarea.intentos.pop(nodo.id_nodo, None)
+            self._despachar()
+
+    def resumen(self) -> dict:
+        return {
+            "nodes": [nodo.describir() for nodo in self.nodos.values()],
+            "capacity": self.limite,
+            "redispatched": self.estadisticas["redespachados"],
+            "winning_backups": self.estadisticas["respaldos_ganadores"],
+        }
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# entrega_filas.py implementa el modo de entrega "por lotes" de las filas extraídas.
+# En lugar de enviar cada fila como un dict completo de 33 claves (la mayoría 'Not Mention'), se envía
+# una vez por trabajo el esquema de columnas (COLUMNAS_ORDENADAS) y luego lotes de filas compactas:
+# cada fila compacta es un dict {"<índice de columna>": valor} con solo las columnas encontradas.
+# Un lote se envía al llegar a max_filas o cuando pasan intervalo_ms desde la primera fila pendiente.
+import asyncio, json, threading, time
+
+VALOR_POR_DEFECTO = 'Not Mention'
+MAX_FILAS_LOTE = 50
+INTERVALO_LOTE_MS = 250
+
+#compactar_fila() convierte una fila completa en su forma compacta según el orden de columnas del esquema.
+def compactar_fila(fila: dict, columnas: list, valor_por_defecto: str = VALOR_POR_DEFECTO) -> dict:
+    return {
+        str(i): fila[col]
+        for i, col in enumerate(columnas)
+        if fila.get(col, valor_por_defecto) != valor_por_defecto
+    }
+
+#expandir_fila() es la operación inversa de compactar_fila() (la que debe hacer el cliente).
+def expandir_fila(fila_compacta: dict, columnas: list, valor_por_defecto: str = VALOR_POR_DEFECTO) -> dict:
+    return {col: fila_compacta.get(str(i), valor_por_defecto) for i, col in enumerate(columnas)}
+
+
+class LoteadorFilasStdout:
+    """
+    Versión para servidor.py: acumula filas de varios threads y las imprime por stdout como
+    {"type": "csv_rows_batch", "rows": [...], "paths": [...]} (paths: la ruta de cada fila, o null). Un thread de
+    fondo vacía el lote cuando vence el intervalo.
+    """
+
+    def __init__(self, client_id, columnas, max_filas=MAX_FILAS_LOTE, intervalo_ms=INTERVALO_LOTE_MS):
+        self.client_id = client_id
+        self.columnas = columnas
+        self.max_filas = max(1, max_filas)
+        self.intervalo = max(1, intervalo_ms) / 1000.0
+        self._pendientes = []
+        self._rutas = []
+        self._primera_pendiente_en = None
+        self._lock = threading.Lock()
+        self._cerrado = threading.Event()
+        self._hilo = threading.Thread(target=self._vaciar_periodicamente, daemon=True)
+
+    def iniciar(self):
+        print(json.dumps({
+            "type": "csv_schema", "client_id": self.client_id,
+            "columns": self.columnas, "default_value": VALOR_POR_DEFECTO,
+        }), flush=True)
+        self._hilo.start()
+
+    def agregar(self, fila: dict, ruta: str = None):
+        self.agregar_compacta(compactar_fila(fila, self.columnas), ruta)
+
+    def agregar_compacta(self, fila_compacta: dict, ruta: str = None):
+        """Añade una fila ya compactada (p.ej. la de ResultadoExtraccion.a_compacta())."""
+        with self._lock:
+            if not self._pendientes:
+                self._primera_pendiente_en = time.monotonic()
+            self._pendientes.append(fila_compacta)
+            self._rutas.append(ruta)
+            if len(self._pendientes) >= self.max_filas:
+                self._vaciar()
+
+    def cerrar(self):
+        self._cerrado.set()
+        if self._hilo.is_alive():
+            self._hilo.join()
+        with self._lock:
+            self._vaciar()
+
+    def _vaciar(self):
+        # Llamar con el lock tomado.
+        if self._pendientes:
+            print(json.dumps({"type": "csv_rows_batch", "client_id": self.client_id, "rows": self._pendientes, "paths": self._rutas}), flush=True)
+            self._pendientes = []
+            self._rutas = []
+
+    def _vaciar_periodicamente(self):
+        while not self._cerrado.wait(self.intervalo / 2):
+            with self._lock:
+                if self._pendientes and time.monotonic() - self._primera_pendiente_en >= self.intervalo:
+                    self._vaciar()
+
+
+class LoteadorFilasWebsocket:
+    """
+    Versión asyncio para servidor_websockets.py. Se usa como envoltorio de emitir(tipo, data, mensaje_texto):
+    intercepta los "csv_actualizacion_fila" y los agrupa en "csv_lote_filas"; cualquier otro mensaje vacía
+    antes el lote pendiente para conservar el orden (p.ej. "procesamiento_csv_terminado" llega al final).
+    """
+
+    def __init__(self, emitir, columnas, max_filas=MAX_FILAS_LOTE, intervalo_ms=INTERVALO_LOTE_MS):
+        self.emitir = emitir
+        self.columnas = columnas
+        self.max_filas = max(1, max_filas)
+        self.intervalo = max(1, intervalo_ms) / 1000.0
+        self._pendientes = []
+        self._temporizador = None
+        self._esquema_enviado = False
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, tipo_mensaje, data=None, mensaje_texto=None):
+        if tipo_mensaje == "csv_actualizacion_fila" and data and "fila_csv" in data:
+            await self.agregar_compactas([compactar_fila(data["fila_csv"], self.columnas)])
+            return
+        await self.vaciar()
+        await self.emitir(tipo_mensaje, data, mensaje_texto)
+
+    async def enviar_esquema(self):
+        if not self._esquema_enviado:
+            self._esquema_enviado = True
+            await self.emitir("csv_esquema", {"columnas": self.columnas, "valor_por_defecto": VALOR_POR_DEFECTO})
+
+    async def agregar_compactas(self, filas_compactas):
+        """Añade filas ya compactadas (p.ej. las que llegan en un csv_rows_batch de servidor.py)."""
+        await self.enviar_esquema()
+        self._pendientes.extend(filas_compactas)
+        if len(self._pendientes) >= self.max_filas:
+            await self.vaciar()
+        elif self._pendientes and self._temporizador is None:
+            self._temporizador = asyncio.get_running_loop().call_later(
+                self.intervalo, lambda: asyncio.ensure_future(self.vaciar())
+            )
+
+    async def vaciar(self):
+        async with self._lock:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+            if not self._pendientes:
+                return
+            lote, self._pendientes = self._pendientes, []
+            await self.emitir("csv_lote_filas", {"filas": lote})
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# envio_archivos.py recibe archivos .txt enviados directamente por el WebSocket y los extrae mientras llegan, sin
+# pasar por el endpoint HTTP de subida ni por el disco ni por un subprocess:
+#   {"tipo": "enviar_archivo_inicio", "id_envio": "a1", "nombre": "LS 0070 N.txt"}
+#   {"tipo": "enviar_archivo_bloque", "id_envio": "a1", "datos": "<base64>"}   (uno o varios; bytes con MessagePack)
+#   {"tipo": "enviar_archivo_fin", "id_envio": "a1"}
+# y el servidor responde {"tipo": "resultado_envio_archivo", "id_envio": "a1", "fila_csv": {...}, ...}.
+# Los bytes se decodifican igual que open(..., encoding='utf-8', errors='ignore').read() (saltos de línea
+# universales incluidos). Mientras el envío no supera el umbral de streaming de servidor.py se acumula en memoria y
+# al terminar se extrae entero, como un archivo pequeño leído de disco; al superarlo pasa a extraerse por bloques en
+# un thread propio a medida que llegan (MOTOR.extraer_por_bloques(), memoria acotada), como un archivo grande.
+# Los patrones son los de la versión activa al empezar el envío (o la que pida el cliente), aunque se active otra
+# mientras llegan los bloques.
+# La extracción cuenta contra el presupuesto de workers del planificador (planificador_trabajos.py): la de un envío
+# pequeño es un TrabajoEnvio que espera turno en la cola como cualquier solicitud; la de uno en streaming no puede
+# esperar (frenaría la conexión), así que ocupa un worker del presupuesto mientras dura su thread.
+import asyncio, codecs, hashlib, io, logging, os, queue, threading, time, traceback
+from concurrent.futures import Future
+
+import servidor as extractor
+from resultado_extraccion import ResultadoExtraccion
+
+MAX_BYTES_ENVIO = 256 * 1024 * 1024
+MAX_ENVIOS_POR_CLIENTE = 4
+MAX_BLOQUES_EN_COLA = 8  # Bloques de texto esperando al thread de streaming antes de frenar la recepción.
+
+
+class EnvioArchivo:
+    """
+    Un archivo en tránsito. agregar() se llama desde el bucle de eventos con cada bloque de bytes y terminar()
+    retorna (ResultadoExtraccion, mensaje_error) igual que servidor.extraer_resultado_de_archivo(). patrones es la
+    clave (versión, huella) de los patrones a usar (None: los activos); planificador, el PlanificadorTrabajos contra
+    cuyo presupuesto cuenta el thread de streaming (None: no se cuenta).
+    """
+
+    def __init__(self, nombre: str, umbral_streaming_bytes: int = extractor.UMBRAL_STREAMING_BYTES,
+                 max_bytes: int = MAX_BYTES_ENVIO, patrones: tuple = None, planificador=None):
+        self.nombre = os.path.basename(nombre.replace("\\", "/")) or "archivo_enviado.txt"
+        self.umbral_streaming_bytes = umbral_streaming_bytes
+        self.max_bytes = max_bytes
+        self.conjunto_patrones = extractor.conjunto_patrones(patrones)
+        self.planificador = planificador
+        self.terminando = False  # Ya llegó el final: solo falta extraer lo pendiente y responder.
+        self.bytes_recibidos = 0
+        self._sha256 = hashlib.sha256()  # Del contenido recibido: identifica el envío en el almacén (ver clave()).
+        self._decodificador = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")("ignore"), translate=True)
+        self._partes = []  # Texto acumulado mientras no se pasa a streaming.
+        self._cola = None  # queue.Queue de bloques de texto para el thread de streaming (None si aún no se usa).
+        self._futuro = None  # Future con (valores, hubo_texto) del thread de streaming.
+        self._abortado = False
+        self._cancelado = threading.Event()  # abortar() interrumpe también una extracción en curso (ver MotorExtraccion).
+
+    @property
+    def en_streaming(self) -> bool:
+        return self._cola is not None
+
+    async def agregar(self, datos: bytes):
+        """Añade un bloque; lanza ValueError si el envío supera max_bytes."""
+        self.bytes_recibidos += len(datos)
+        if self.bytes_recibidos > self.max_bytes:
+            raise ValueError(f"El archivo supera el máximo de {self.max_bytes} bytes por envío.")
+        self._sha256.update(datos)
+        texto = self._decodificador.decode(datos)
+        if self._cola is None and self.bytes_recibidos > self.umbral_streaming_bytes:
+            self._iniciar_streaming()
+        if self._cola is None:
+            self._partes.append(texto)
+        elif texto:
+            await self._encolar(texto)
+
+    async def terminar(self, executor=None):
+        """
+        Termina el envío y extrae lo que falte. executor es donde se extrae un envío no streaming (None: el por
+        defecto). Si se abortó antes o durante la extracción, el mensaje de error es MENSAJE_EXTRACCION_CANCELADA.
+        """
+        if self._abortado:
+            return ResultadoExtraccion(self.nombre), extractor.MENSAJE_EXTRACCION_CANCELADA
+        texto = self._decodificador.decode(b"", final=True)
+        try:
+            if self._cola is not None:
+                if texto:
+                    await self._encolar(texto)
+                await self._encolar(None)
+                valores, hubo_texto = await asyncio.wrap_future(self._futuro)
+                if self._abortado:
+                    return ResultadoExtraccion(self.nombre), extractor.MENSAJE_EXTRACCION_CANCELADA
+                if not hubo_texto:
+                    return ResultadoExtraccion(self.nombre), "File is empty or whitespace only"
+                return extractor.completar_resultado(valores, self.nombre), "None"
+            self._partes.append(texto)
+            txt, self._partes = "".join(self._partes), []
+            if not txt.strip():
+                return ResultadoExtraccion(self.nombre), "File is empty or whitespace only"
+            resultado = await asyncio.get_running_loop().run_in_executor(
+                executor, extractor.do_actual_processing_for_file, txt, self.nombre, None, self.conjunto_patrones.motor, self._cancelado
+            )
+            if self._abortado:
+                return ResultadoExtraccion(self.nombre), extractor.MENSAJE_EXTRACCION_CANCELADA
+            return resultado, "None"
+        except Exception as e:
+            logging.error(f"Error extrayendo el archivo enviado '{self.nombre}': {e}\n{traceback.format_exc()}")
+            return ResultadoExtraccion(self.nombre), f"Error inesperado procesando {self.nombre}: {type(e).__name__} - {e}"
+
+    def clave(self) -> str:
+        """Clave del archivo enviado para el almacén, el índice y la analítica: no tiene ruta, así que hash + nombre."""
+        return f"sha256:{self._sha256.hexdigest()}:{self.nombre}"
+
+    def abortar(self):
+        """
+        Descarta el envío (cliente desconectado o cancelación), también si ya se está extrayendo: la extracción se
+        interrumpe y el thread de streaming, si lo hay, termina solo.
+        """
+        self._abortado = True
+        self._cancelado.set()
+        self._partes = []
+        if self._cola is not None:
+            try:
+                self._cola.put_nowait(None)
+            except queue.Full:
+                pass  # El thread ve _abortado al sacar el siguiente bloque.
+
+    def _iniciar_streaming(self):
+        self._cola = queue.Queue(MAX_BLOQUES_EN_COLA)
+        self._futuro = Future()
+        pendientes, self._partes = self._partes, []
+        if self.planificador is not None:
+            self.planificador.ocupar_workers(1)
+            loop = asyncio.get_running_loop()
+            # El worker vuelve al presupuesto cuando termina el thread (también si se abortó el envío).
+            self._futuro.add_done_callback(lambda _: loop.call_soon_threadsafe(self.planificador.liberar_workers, 1))
+        threading.Thread(target=self._extraer_en_streaming, args=(pendientes,), name=f"envio_{self.nombre}", daemon=True).start()
+
+    def _bloques(self, pendientes):
+        yield from pendientes
+        for bloque in iter(self._cola.get, None):
+            if self._abortado:
+                return
+            yield bloque
+
+    def _extraer_en_streaming(self, pendientes):
+        try:
+            self._futuro.set_result(
+                self.conjunto_patrones.motor.extraer_por_bloques(self._bloques(pendientes), cancelado=self._cancelado)
+            )
+        except Exception as e:
+            self._futuro.set_exception(e)
+
+    async def _encolar(self, texto):
+        try:
+            self._cola.put_nowait(texto)
+        except queue.Full:
+            # El thread va más lento que la red: esperar aquí frena la lectura del WebSocket de este cliente.
+            await asyncio.get_running_loop().run_in_executor(None, self._poner_en_cola, texto)
+
+    def _poner_en_cola(self, texto):
+        # Si el envío se aborta mientras se espera, el thread deja de sacar bloques: no esperar para siempre.
+        while not self._abortado:
+            try:
+                self._cola.put(texto, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+class TrabajoEnvio:
+    """
+    El final de un envío (extraerlo y responder resultado_envio_archivo) como trabajo del PlanificadorTrabajos:
+    pasa por la admisión, el reparto justo y el presupuesto de workers igual que una solicitud de procesamiento.
+    Un envío en streaming no se encola: su thread ya ocupa un worker del presupuesto y el final solo lo espera.
+    emitir es el del cliente; lo que el planificador emite como procesamiento_csv_terminado (un fallo) se responde
+    como resultado_envio_archivo, y posicion_cola lleva el id_envio.
+    """
+
+    def __init__(self, id_cliente, id_envio: str, envio: EnvioArchivo, emitir):
+        self.id_cliente = id_cliente
+        self.id_envio = id_envio
+        self.envio = envio
+        self._emitir = emitir
+        self.num_workers = 1
+        self.costo_estimado = envio.bytes_recibidos
+        self.encolado_en = time.perf_counter()
+        self.terminado = asyncio.get_running_loop().create_future()
+
+    async def emitir(self, tipo_mensaje, data=None, mensaje_texto=None):
+        if tipo_mensaje == "procesamiento_csv_terminado":
+            if (data or {}).get("status") == "cancelled":
+                return  # cancelar_procesamiento ya cuenta los envíos descartados en su confirmación.
+            tipo_mensaje = "resultado_envio_archivo"
+            data = {"id_envio": self.id_envio, "fila_csv": None, "error": f"Envío no extraído ({(data or {}).get('status')}).",
+                    "bytes": self.envio.bytes_recibidos}
+        elif tipo_mensaje == "posicion_cola":
+            data = {**data, "id_envio": self.id_envio}
+        await self._emitir(tipo_mensaje, data, mensaje_texto)
+
+    def cancelar(self):
+        self.envio.abortar()
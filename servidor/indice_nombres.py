@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+# indice_nombres.py es un índice invertido de trigramas sobre los nombres de personas extraídos (columnas de
+# COLUMNAS_PERSONA), para buscar a alguien en todo el corpus sin recorrer las filas y tolerando variantes de
+# escritura (Andersson/Anderson, Eriksson/Erickson).
+#   - Cada nombre distinto (normalizado: minúsculas, sin acentos, solo letras) guarda sus palabras y sus
+#     apariciones (archivo, columna). Las palabras distintas son muchas menos que los nombres (unas 5.000 frente a
+#     80.000 en 100.000 filas), así que los trigramas se indexan por palabra y cada palabra apunta a sus nombres.
+#   - Similitud entre palabras: coeficiente de Dice de sus trigramas, 2·|común| / (|a| + |b|).
+#   - Similitud entre la consulta (k palabras) y un nombre (n palabras): el mismo Dice a nivel de palabra,
+#     2·Σ similitud de cada pareja / (k + n), con el emparejamiento (cada palabra como mucho una vez, parejas de
+#     similitud >= SIMILITUD_MINIMA_PALABRA) que más suma. "Anderson" da 0.82 con "Andersson" y 0.55 con
+#     "Per Andersson"; el orden de las palabras no importa.
+#   - Cotas sobre esa suma (ver _candidatos) reducen los candidatos a uniones e intersecciones de los conjuntos de
+#     nombres de cada palabra, que se hacen en C; solo los que quedan se puntúan en Python. buscar() empieza con un
+#     umbral alto y lo baja hasta reunir los resultados pedidos, así que casi nunca mira los nombres poco parecidos.
+# Se alimenta fila a fila mientras se extrae (agregar_fila) y no es thread-safe: usarlo desde un solo thread
+# (el bucle de eventos de servidor_websockets.py).
+import math, re, unicodedata
+from bisect import bisect_right
+from collections import defaultdict
+from itertools import accumulate, combinations
+
+COLUMNAS_PERSONA = ["Name", "Parent's Names", "Spouse's Name", "Children's Names"]
+COLUMNA_NOMBRE_ARCHIVO = "Processed File Name"
+VALORES_SIN_DATO = ("Not Mention", "ERROR", "")
+SIMILITUD_MINIMA = 0.5
+SIMILITUD_MINIMA_PALABRA = 0.5  # Por debajo, una palabra no cuenta como variante de una palabra de la consulta.
+UMBRALES_PALABRA = (0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95)  # Los que prueba _candidatos().
+COSTO_RELATIVO_PUNTUAR = 20  # Puntuar un candidato cuesta lo que meter ~20 ids en un conjunto.
+UMBRALES_ESCALONADOS = (0.9, 0.85, 0.8, 0.75, 0.7, 0.65, 0.6, 0.55)  # Los que buscar() prueba antes de similitud_minima.
+MAX_RESULTADOS = 10
+MAX_APARICIONES_POR_RESULTADO = 20
+
+#normalizar_nombre() deja un nombre en minúsculas, sin acentos y con solo letras separadas por un espacio.
+def normalizar_nombre(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[^\W\d_]+", texto))
+
+#trigramas() retorna el conjunto de trigramas de una palabra (con un espacio de relleno en cada borde).
+def trigramas(palabra: str) -> frozenset:
+    relleno = f" {palabra} "
+    return frozenset(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+
+class IndiceNombres:
+    """Índice de trigramas de los nombres de personas de las filas extraídas (ver el comentario del módulo)."""
+
+    def __init__(self, columnas=COLUMNAS_PERSONA):
+        self.columnas = columnas
+        self._ids = {}  # nombre normalizado -> id
+        self._nombres = []  # id -> nombre tal como apareció la primera vez
+        self._palabras_de_nombre = []  # id -> tupla de ids de palabra
+        self._nombres_por_longitud = defaultdict(int)  # número de palabras -> cuántos nombres la tienen
+        self._apariciones = []  # id -> {(archivo, columna, clave del archivo)}
+        self._por_archivo = defaultdict(set)  # clave del archivo -> {ids}, para reindexar un archivo extraído de nuevo
+        self._ids_palabra = {}  # palabra -> id de palabra
+        self._gramas = []  # id de palabra -> frozenset de trigramas
+        self._nombres_con_palabra = []  # id de palabra -> número de palabras del nombre -> {ids de nombre}
+        self._postings = defaultdict(lambda: defaultdict(list))  # trigrama -> longitud de la palabra -> [ids de palabra]
+
+    def num_nombres(self):
+        return len(self._nombres)
+
+    def agregar_fila(self, fila: dict, clave: str = None):
+        """
+        Indexa los nombres de una fila; si el archivo ya estaba indexado, sus apariciones anteriores se sustituyen.
+        clave identifica el archivo (su ruta absoluta, como en almacen_resultados.py; sin ella, su nombre): dos
+        archivos con el mismo nombre en directorios distintos no se sustituyen.
+        """
+        archivo = fila.get(COLUMNA_NOMBRE_ARCHIVO, "")
+        clave = clave or archivo
+        for id_nombre in self._por_archivo.pop(clave, ()):
+            self._apariciones[id_nombre] = {a for a in self._apariciones[id_nombre] if a[2] != clave}
+        for columna in self.columnas:
+            celda = fila.get(columna)
+            if not isinstance(celda, str) or celda in VALORES_SIN_DATO:
+                continue
+            for nombre in celda.split(";"):
+                nombre = nombre.strip()
+                normalizado = normalizar_nombre(nombre)
+                if not normalizado:
+                    continue
+                id_nombre = self._ids.get(normalizado)
+                if id_nombre is None:
+                    id_nombre = self._nuevo_nombre(nombre, normalizado)
+                self._apariciones[id_nombre].add((archivo, columna, clave))
+                self._por_archivo[clave].add(id_nombre)
+
+    def _nuevo_nombre(self, nombre, normalizado):
+        id_nombre = len(self._nombres)
+        self._ids[normalizado] = id_nombre
+        self._nombres.append(nombre)
+        palabras = tuple(dict.fromkeys(self._id_palabra(palabra) for palabra in normalizado.split()))
+        self._palabras_de_nombre.append(palabras)
+        self._nombres_por_longitud[len(palabras)] += 1
+        self._apariciones.append(set())
+        for id_palabra in palabras:
+            self._nombres_con_palabra[id_palabra].setdefault(len(palabras), set()).add(id_nombre)
+        return id_nombre
+
+    def _id_palabra(self, palabra):
+        id_palabra = self._ids_palabra.get(palabra)
+        if id_palabra is None:
+            id_palabra = len(self._gramas)
+            self._ids_palabra[palabra] = id_palabra
+            gramas = trigramas(palabra)
+            self._gramas.append(gramas)
+            self._nombres_con_palabra.append({})
+            for grama in gramas:
+                self._postings[grama][len(gramas)].append(id_palabra)
+        return id_palabra
+
+    def _palabras_parecidas(self, palabra, umbral):
+        """
+        Retorna {id de palabra: similitud} de las palabras indexadas con similitud >= umbral. Una palabra de L
+        trigramas solo llega al umbral t si L está entre t·q/(2-t) y (2-t)·q/t y comparte al menos m = t·(q+L)/2
+        trigramas con la consulta; basta con recorrer las listas de los q - m + 1 trigramas más raros.
+        """
+        gramas = trigramas(palabra)
+        q = len(gramas)
+        listas = {grama: self._postings.get(grama, {}) for grama in gramas}
+        parecidas = {}
+        for longitud in range(math.ceil(umbral * q / (2 - umbral) - 1e-9), math.floor((2 - umbral) * q / umbral + 1e-9) + 1):
+            minimo_comun = math.ceil(umbral * (q + longitud) / 2 - 1e-9)
+            # Los trigramas sin palabras de esta longitud cuentan como los más raros: no aportan candidatas.
+            por_rareza = sorted(gramas, key=lambda g: len(listas[g].get(longitud, ())))
+            candidatas = set()
+            for grama in por_rareza[:q - minimo_comun + 1]:
+                candidatas.update(listas[grama].get(longitud, ()))
+            for id_palabra in candidatas:
+                comun = len(gramas & self._gramas[id_palabra])
+                if comun >= minimo_comun:
+                    parecidas[id_palabra] = 2 * comun / (q + longitud)
+        return parecidas
+
+    @staticmethod
+    def _emparejar(parecidas, palabras_nombre):
+        """Mayor suma de similitudes emparejando cada palabra de la consulta y del nombre como mucho una vez."""
+        # Caso habitual: la variante más parecida de cada palabra de la consulta es una palabra distinta del nombre,
+        # y entonces ninguna otra asignación suma más.
+        total, elegidas = 0.0, []
+        for parecidas_palabra in parecidas:
+            mejor, elegida = 0.0, None
+            for id_palabra in palabras_nombre:
+                similitud = parecidas_palabra.get(id_palabra, 0.0)
+                if similitud > mejor:
+                    mejor, elegida = similitud, id_palabra
+            if elegida is not None:
+                total += mejor
+                elegidas.append(elegida)
+        if len(set(elegidas)) == len(elegidas):
+            return total
+        # Si chocan, asignación óptima por programación dinámica sobre los subconjuntos del lado más corto (unas
+        # pocas palabras): mejores[usadas] es la mayor suma con esas palabras ya emparejadas.
+        matriz = [[parecidas_palabra.get(id_palabra, 0.0) for id_palabra in palabras_nombre] for parecidas_palabra in parecidas]
+        if len(matriz) > len(palabras_nombre):
+            matriz = [list(columna) for columna in zip(*matriz)]
+        mejores = {0: 0.0}
+        for similitudes in zip(*matriz):  # Cada palabra del lado largo, con su similitud a las del corto.
+            for usadas, suma in list(mejores.items()):
+                for i, similitud in enumerate(similitudes):
+                    if similitud and not usadas >> i & 1:
+                        clave = usadas | 1 << i
+                        if suma + similitud > mejores.get(clave, -1.0):
+                            mejores[clave] = suma + similitud
+        return max(mejores.values())
+
+    def _variantes(self, parecidas, longitud):
+        """
+        Por cada palabra de la consulta, (similitudes, conjuntos, acumulado, uniones): los conjuntos de nombres de
+        `longitud` palabras de cada variante, de la más a la menos parecida, la suma acumulada de sus tamaños y las
+        uniones de las j primeras ya construidas (j -> conjunto).
+        """
+        variantes = []
+        for parecidas_palabra in parecidas:
+            ordenadas = sorted(parecidas_palabra.items(), key=lambda p: -p[1])
+            conjuntos = [self._nombres_con_palabra[id_palabra].get(longitud, ()) for id_palabra, _ in ordenadas]
+            variantes.append(([-s for _, s in ordenadas], conjuntos, list(accumulate(map(len, conjuntos), initial=0)), {}))
+        return variantes
+
+    def _candidatos(self, variantes, longitud, umbral):
+        """
+        Superconjunto de los nombres de `longitud` palabras con similitud >= umbral. Un nombre así necesita una suma
+        R = umbral·(k+longitud)/2 en sus m = min(k, longitud) parejas, y ninguna pareja aporta más de 1:
+          - si solo c palabras de la consulta tienen en él variantes con similitud >= t, suma menos de c + (m-c)·t:
+            hacen falta c > (R - m·t)/(1-t) y los candidatos son las intersecciones (en C) de c conjuntos;
+          - si se dejan fuera las e palabras de la consulta con más nombres y de las demás solo se unen las
+            variantes con similitud >= T = (R-e)/(m-e), un nombre que no esté en la unión suma menos de R.
+        De todas esas opciones se construye la más barata: unir conjuntos en C cuesta poco comparado con puntuar
+        cada candidato en Python, y el tamaño de una intersección se estima como si las palabras fueran independientes.
+        """
+        k, m = len(variantes), min(len(variantes), longitud)
+        requerido = umbral * (k + longitud) / 2
+        total = max(1, self._nombres_por_longitud[longitud])
+
+        def hasta(palabra, minima):  # Cuántas variantes de la palabra tienen similitud >= minima.
+            return bisect_right(variantes[palabra][0], -minima + 1e-9)
+
+        def tamano(palabra, minima):  # Cuántos nombres hay que meter en conjuntos para unir esas variantes.
+            cuantas = hasta(palabra, minima)
+            return 0 if cuantas in variantes[palabra][3] else variantes[palabra][2][cuantas]
+
+        def conjunto(palabra, minima):
+            cuantas = hasta(palabra, minima)
+            uniones = variantes[palabra][3]
+            if cuantas not in uniones:
+                uniones[cuantas] = set().union(*variantes[palabra][1][:cuantas])
+            return uniones[cuantas]
+
+        opciones = []
+        for t in UMBRALES_PALABRA:
+            if t <= SIMILITUD_MINIMA_PALABRA:
+                minimo = math.ceil(requerido - 1e-9)  # Por debajo de t no hay variantes: suma como mucho c.
+            else:
+                minimo = min(m, math.floor((requerido - m * t) / (1 - t) + 1e-9) + 1)
+            if minimo >= 2:
+                tamanos = [variantes[i][2][hasta(i, t)] for i in range(k)]
+                estimados = sum(
+                    total * math.prod(tamanos[i] / total for i in combinacion) for combinacion in combinations(range(k), minimo)
+                )
+                costo = estimados + sum(tamano(i, t) for i in range(k)) / COSTO_RELATIVO_PUNTUAR
+                opciones.append((costo, t, minimo, range(k)))
+        for excluidas in range(m):
+            minima = (requerido - excluidas) / (m - excluidas)
+            if minima <= SIMILITUD_MINIMA_PALABRA and excluidas >= requerido - 1e-9:
+                break  # Con todas las variantes de las demás palabras, fuera de la unión se suma como mucho e >= R.
+            tamanos = sorted((variantes[i][2][hasta(i, minima)], i) for i in range(k))[:k - excluidas]
+            costo = sum(n for n, _ in tamanos) + sum(tamano(i, minima) for _, i in tamanos) / COSTO_RELATIVO_PUNTUAR
+            opciones.append((costo, minima, 1, [i for _, i in tamanos]))
+        _, minima, minimo, palabras = min(opciones, key=lambda o: o[0])
+        conjuntos = [conjunto(i, minima) for i in palabras]
+        if minimo == 1:
+            return set().union(*conjuntos)
+        candidatos = set()
+        for combinacion in combinations(conjuntos, minimo):
+            candidatos.update(set.intersection(*combinacion))
+        return candidatos
+
+    def _puntuar(self, parecidas, umbral, por_longitud, similitudes):
+        """
+        Retorna [(similitud, apariciones, id)] de todos los nombres con similitud >= umbral. Entre las pasadas de
+        una misma búsqueda se guardan los _variantes() de cada longitud (por_longitud) y las similitudes ya
+        calculadas (similitudes: id -> similitud), para no repetirlos.
+        """
+        k = len(parecidas)
+        longitudes = range(math.ceil(umbral * k / (2 - umbral) - 1e-9), math.floor((2 - umbral) * k / umbral + 1e-9) + 1)
+        if k == 1:
+            # Una sola palabra: la similitud de un nombre de n palabras es 2·s/(1+n), con s la de su palabra más
+            # parecida. Se asigna en C (dict.update), de la variante menos parecida a la más, sin recorrer nombres.
+            mejores = {}
+            for id_palabra, s in sorted(parecidas[0].items(), key=lambda p: p[1]):
+                for longitud in longitudes:
+                    similitud = 2 * s / (1 + longitud)
+                    if similitud >= umbral:
+                        mejores.update(dict.fromkeys(self._nombres_con_palabra[id_palabra].get(longitud, ()), similitud))
+            return [(s, len(self._apariciones[i]), i) for i, s in mejores.items() if self._apariciones[i]]
+        puntuados = []
+        for longitud in longitudes:
+            if longitud not in por_longitud:
+                por_longitud[longitud] = self._variantes(parecidas, longitud)
+            for id_nombre in self._candidatos(por_longitud[longitud], longitud, umbral):
+                if not self._apariciones[id_nombre]:
+                    continue  # Su archivo se reindexó sin él.
+                similitud = similitudes.get(id_nombre)
+                if similitud is None:
+                    suma = self._emparejar(parecidas, self._palabras_de_nombre[id_nombre])
+                    similitud = similitudes[id_nombre] = 2 * suma / (k + longitud)
+                if similitud >= umbral:
+                    puntuados.append((similitud, len(self._apariciones[id_nombre]), id_nombre))
+        return puntuados
+
+    def buscar(self, consulta: str, limite: int = MAX_RESULTADOS, similitud_minima: float = SIMILITUD_MINIMA) -> list:
+        """
+        Retorna hasta `limite` nombres con similitud >= similitud_minima, del más al menos parecido (a igual
+        similitud, el que más aparece primero): [{"nombre", "similitud", "apariciones", "total_apariciones"}].
+        """
+        palabras = list(dict.fromkeys(normalizar_nombre(consulta).split()))
+        if not palabras:
+            return []
+        limite = max(1, limite)
+        similitud_minima = min(1.0, max(0.01, similitud_minima))
+        parecidas = [self._palabras_parecidas(palabra, SIMILITUD_MINIMA_PALABRA) for palabra in palabras]
+        # Primero se buscan solo nombres muy parecidos (pocos candidatos); si no salen `limite` resultados se repite
+        # con un umbral más bajo, hasta similitud_minima. Cada pasada encuentra todos los nombres sobre su umbral.
+        por_longitud, similitudes = {}, {}
+        for umbral in [u for u in UMBRALES_ESCALONADOS if u > similitud_minima] + [similitud_minima]:
+            puntuados = self._puntuar(parecidas, umbral, por_longitud, similitudes)
+            if len(puntuados) >= limite:
+                break
+        puntuados.sort(key=lambda p: (-p[0], -p[1], self._nombres[p[2]]))
+        return [
+            {
+                "nombre": self._nombres[id_nombre],
+                "similitud": round(similitud, 3),
+                "apariciones": [
+                    {"archivo": archivo, "columna": columna}
+                    for archivo, columna, _ in sorted(self._apariciones[id_nombre])[:MAX_APARICIONES_POR_RESULTADO]
+                ],
+                "total_apariciones": total,
+            }
+            for similitud, total, id_nombre in puntuados[:limite]
+        ]
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# manifiesto_incremental.py recuerda, por ruta, qué archivos ya se extrajeron y con qué resultado, para que una
+# solicitud "incremental" solo extraiga los archivos nuevos o cambiados (uploaded_files_from_client crece con cada
+# subida y sin esto se reprocesa entero). Cada entrada guarda tamaño, mtime, sha256 del contenido y la fila:
+#   - si tamaño y mtime coinciden, la fila guardada se sirve sin leer el archivo;
+#   - si solo cambió el mtime (p. ej. un "touch") se compara el sha256 antes de dar el archivo por cambiado.
+# A diferencia de cache_resultados.py (indexada por contenido, obliga a leer y hashear cada archivo), el manifiesto
+# evita incluso esa lectura. Un cambio de HUELLA_PATRONES (o de la versión activa, ver cambiar_huella()) lo invalida entero.
+# VigilanteDirectorio sondea un directorio y entrega los archivos nuevos a una corutina en cuanto dejan de cambiar.
+import asyncio, json, logging, os, threading
+
+from cache_resultados import hash_archivo, COLUMNA_NOMBRE_ARCHIVO
+from entrega_filas import compactar_fila, expandir_fila
+
+RUTA_MANIFIESTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifiesto_extraccion.json")
+VERSION_MANIFIESTO = 1
+INTERVALO_VIGILANCIA_SEGUNDOS = 2.0
+
+#firma_archivo() retorna (tamaño, mtime_ns) de un archivo; lanza OSError si no se puede consultar.
+def firma_archivo(ruta: str) -> tuple:
+    st = os.stat(ruta)
+    return st.st_size, st.st_mtime_ns
+
+
+class ManifiestoIncremental:
+    """
+    Manifiesto ruta -> {tamano, mtime_ns, sha256, fila, error} persistido en un .json.
+    Los métodos son seguros para llamarse desde varios threads (el pool los usa vía run_in_executor).
+    """
+
+    def __init__(self, huella_patrones, columnas, ruta=RUTA_MANIFIESTO):
+        self.huella = huella_patrones
+        self.columnas = columnas  # COLUMNAS_ORDENADAS: las filas se guardan compactadas (ver entrega_filas.py).
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._archivos = self._leer_disco()
+        self._pendientes = {}  # ruta -> firma vista en consultar(); registrar() solo acepta filas con firma conocida.
+        self._modificadas = set()
+        self._eliminadas = set()
+        self.estadisticas = {"servidos": 0, "extraidos": 0, "verificados_por_hash": 0}
+
+    def _leer_disco(self) -> dict:
+        try:
+            with open(self.ruta, encoding="utf-8") as fh:
+                datos = json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Manifiesto '{self.ruta}' ilegible, se empieza uno nuevo: {e}")
+            return {}
+        if datos.get("version") != VERSION_MANIFIESTO or datos.get("huella") != self.huella:
+            return {}  # Patrones distintos: ninguna fila guardada es válida.
+        return datos.get("archivos", {})
+
+    def cambiar_huella(self, huella_patrones):
+        """Pasa a otros patrones (versión activada en caliente): las filas guardadas con los anteriores dejan de valer."""
+        with self._lock:
+            if huella_patrones == self.huella:
+                return
+            self.huella = huella_patrones
+            self._archivos = self._leer_disco()
+            self._pendientes.clear()
+            self._modificadas.clear()
+            self._eliminadas.clear()
+
+    def consultar(self, ruta: str, huella_patrones=None):
+        """
+        Retorna (fila, mensaje_error) si el archivo no cambió desde que se registró, o None si hay que extraerlo.
+        En el segundo caso recuerda su firma actual para el registrar() posterior. Con huella_patrones (la de la
+        versión de un trabajo) retorna None sin recordar nada si el manifiesto es de otros patrones.
+        """
+        if huella_patrones is not None and huella_patrones != self.huella:
+            return None
+        clave = os.path.abspath(ruta)
+        try:
+            firma = firma_archivo(ruta)
+        except OSError:
+            return None  # El worker reportará el error de lectura con su mensaje habitual.
+        with self._lock:
+            entrada = self._archivos.get(clave)
+        if entrada is not None and entrada["tamano"] == firma[0]:
+            vigente = entrada["mtime_ns"] == firma[1]
+            if not vigente:
+                try:
+                    vigente = hash_archivo(ruta) == entrada["sha256"]
+                except OSError:
+                    vigente = False
+                if vigente:
+                    with self._lock:
+                        entrada["mtime_ns"] = firma[1]
+                        self._modificadas.add(clave)
+                        self.estadisticas["verificados_por_hash"] += 1
+            if vigente:
+                fila = expandir_fila(entrada["fila"], self.columnas)
+                fila[COLUMNA_NOMBRE_ARCHIVO] = os.path.basename(ruta)
+                with self._lock:
+                    self.estadisticas["servidos"] += 1
+                return fila, entrada["error"]
+        with self._lock:
+            self._pendientes[clave] = firma
+        return None
+
+    def necesita_extraccion(self, ruta: str, firma: tuple) -> bool:
+        """Comprobación rápida (sin leer el archivo) para el vigilante: True si la firma no es la registrada."""
+        with self._lock:
+            entrada = self._archivos.get(os.path.abspath(ruta))
+        return entrada is None or (entrada["tamano"], entrada["mtime_ns"]) != tuple(firma)
+
+    def registrar(self, ruta: str, fila: dict, mensaje_error: str, huella_patrones=None):
+        """
+        Guarda el resultado de un archivo consultado antes con consultar(). Se descarta si el archivo cambió
+        mientras se extraía (la fila ya no corresponde a su contenido) o si se extrajo con otros patrones que los
+        del manifiesto (huella_patrones). Los errores de E/S no se deben registrar.
+        """
+        clave = os.path.abspath(ruta)
+        with self._lock:
+            if huella_patrones is not None and huella_patrones != self.huella:
+                return
+            huella = self.huella
+            firma = self._pendientes.pop(clave, None)
+        if firma is None:
+            return
+        try:
+            sha256 = hash_archivo(ruta)
+            if firma_archivo(ruta) != firma:
+                return
+        except OSError:
+            return
+        entrada = {
+            "tamano": firma[0],
+            "mtime_ns": firma[1],
+            "sha256": sha256,
+            "fila": compactar_fila({col: val for col, val in fila.items() if col != COLUMNA_NOMBRE_ARCHIVO}, self.columnas),
+            "error": mensaje_error,
+        }
+        with self._lock:
+            if self.huella != huella:
+                return  # cambiar_huella() entretanto: la fila es de los patrones anteriores.
+            self._archivos[clave] = entrada
+            self._modificadas.add(clave)
+            self._eliminadas.discard(clave)
+            self.estadisticas["extraidos"] += 1
+
+    def podar(self):
+        """Olvida las entradas de archivos que ya no existen."""
+        with self._lock:
+            rutas = list(self._archivos)
+        borradas = [ruta for ruta in rutas if not os.path.exists(ruta)]
+        with self._lock:
+            for ruta in borradas:
+                self._archivos.pop(ruta, None)
+                self._modificadas.discard(ruta)
+                self._eliminadas.add(ruta)
+        return len(borradas)
+
+    def guardar(self):
+        """
+        Escribe el manifiesto de forma atómica. Antes vuelve a leer el del disco y solo sobreescribe las entradas
+        cambiadas aquí: otro proceso (p. ej. un servidor.py --manifest) puede haber añadido las suyas entretanto.
+        """
+        with self._lock:
+            if not self._modificadas and not self._eliminadas:
+                return
+            archivos = self._leer_disco()
+            for ruta in self._eliminadas:
+                archivos.pop(ruta, None)
+            for ruta in self._modificadas:
+                archivos[ruta] = self._archivos[ruta]
+            datos = {"version": VERSION_MANIFIESTO, "huella": self.huella, "archivos": archivos}
+            ruta_tmp = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(ruta_tmp, "w", encoding="utf-8") as fh:
+                    json.dump(datos, fh, ensure_ascii=False)
+                os.replace(ruta_tmp, self.ruta)  # Escritura atómica: un lector nunca ve un .json a medias.
+            except OSError as e:
+                logging.warning(f"No se pudo escribir el manifiesto '{self.ruta}': {e}")
+                return
+            self._archivos = archivos
+            self._modificadas.clear()
+            self._eliminadas.clear()
+
+    def num_archivos(self):
+        with self._lock:
+            return len(self._archivos)
+
+
+class VigilanteDirectorio:
+    """
+    Sondea un directorio cada `intervalo` segundos (sin dependencias: no hay inotify portable en la biblioteca
+    estándar) y llama a la corutina procesar(rutas) con los .txt nuevos o cambiados según el manifiesto.
+    Un archivo se entrega cuando su firma no cambia entre dos sondeos, para no leer una subida a medio escribir.
+    """
+
+    def __init__(self, directorio, manifiesto: ManifiestoIncremental, procesar, intervalo=INTERVALO_VIGILANCIA_SEGUNDOS):
+        self.directorio = directorio
+        self.manifiesto = manifiesto
+        self.procesar = procesar
+        self.intervalo = intervalo
+        self._vistos = {}  # ruta -> firma del sondeo anterior
+        self._ignorados = {}  # ruta -> firma con la que el procesamiento no lo registró (error de E/S)
+        self._tarea = None
+        self.estadisticas = {"sondeos": 0, "entregados": 0}
+
+    @property
+    def activo(self):
+        return self._tarea is not None and not self._tarea.done()
+
+    def iniciar(self):
+        if not self.activo:
+            self._tarea = asyncio.create_task(self._bucle())
+            logging.info(f"Vigilando '{self.directorio}' cada {self.intervalo}s.")
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+        logging.info(f"Vigilancia de '{self.directorio}' detenida.")
+
+    def _sondear(self):
+        """Retorna las rutas estables que hay que extraer (bloqueante: llamar en un executor)."""
+        firmas = {}
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            nombres = []
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            if not nombre.lower().endswith(".txt"):
+                continue
+            try:
+                firmas[ruta] = firma_archivo(ruta)
+            except OSError:
+                continue
+        listas = [
+            ruta for ruta, firma in firmas.items()
+            if self._vistos.get(ruta) == firma and self._ignorados.get(ruta) != firma
+            and self.manifiesto.necesita_extraccion(ruta, firma)
+        ]
+        self._vistos = firmas
+        return sorted(listas), firmas
+
+    async def _bucle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                rutas, firmas = await loop.run_in_executor(None, self._sondear)
+                self.estadisticas["sondeos"] += 1
+                if rutas:
+                    logging.info(f"Vigilante: {len(rutas)} archivo(s) nuevo(s) o cambiado(s) en '{self.directorio}'.")
+                    self.estadisticas["entregados"] += len(rutas)
+                    await self.procesar(rutas)
+                    # Lo que siga sin registrarse con la misma firma no se reintenta hasta que el archivo cambie.
+                    for ruta in rutas:
+                        if self.manifiesto.necesita_extraccion(ruta, firmas[ruta]):
+                            self._ignorados[ruta] = firmas[ruta]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"Error en el vigilante de '{self.directorio}': {e}")
+            await asyncio.sleep(self.intervalo)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# metricas_servidor.py lleva las métricas operativas de servidor_websockets.py para planificar capacidad y ver
+# cuándo el servidor está saturado:
+#   - trabajos activos, profundidad de la cola, subprocesses vivos y clientes conectados (medidores que se leen
+#     en el momento, de PLANIFICADOR y CLIENTS),
+#   - filas/s y bytes/s por cliente (medidos al enviar por WebSocket, en una ventana deslizante de 60 s) y
+#     bytes de entrada procesados por cliente,
+#   - latencia de cada envío WebSocket y envíos perdidos (conexión cerrada o error),
+#   - histogramas de la duración y la espera en cola de los trabajos.
+# Se consultan con el comando `stats` de la CLI o en http://localhost:8766/metrics, en el formato de texto de
+# Prometheus para que cualquier recolector pueda leerlas. El servidor HTTP es mínimo (asyncio puro, sin
+# dependencias) y solo escucha en localhost.
+import asyncio, logging, time
+from collections import deque
+
+PUERTO_METRICAS = 8766
+VENTANA_TASA_SEGUNDOS = 60
+OLVIDAR_CLIENTE_SEGUNDOS = 600  # Un cliente sin actividad durante este tiempo deja de aparecer en las series.
+LIMITES_DURACION_TRABAJO = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+LIMITES_LATENCIA_ENVIO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+
+class Histograma:
+    """Histograma acumulativo (como los de Prometheus): cuenta por límite superior, suma y total."""
+
+    def __init__(self, limites):
+        self.limites = tuple(limites)
+        self.cuentas = [0] * len(self.limites)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.suma += valor
+        self.total += 1
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.cuentas[i] += 1
+                break
+
+    def acumulado(self):
+        """Pares (límite, observaciones <= límite), terminando en ("+Inf", total)."""
+        pares, acumulado = [], 0
+        for limite, cuenta in zip(self.limites, self.cuentas):
+            acumulado += cuenta
+            pares.append((limite, acumulado))
+        pares.append(("+Inf", self.total))
+        return pares
+
+    def cuantil(self, q: float):
+        """Estimación del cuantil q: el límite del primer bucket que lo alcanza (None sin datos)."""
+        if not self.total:
+            return None
+        for limite, acumulado in self.acumulado():
+            if acumulado >= q * self.total:
+                return limite
+        return "+Inf"
+
+
+class ContadorConTasa:
+    """Total acumulado más la tasa por segundo de los últimos VENTANA_TASA_SEGUNDOS (agregada por segundo)."""
+
+    def __init__(self):
+        self.total = 0
+        self._por_segundo = deque()  # [segundo, cantidad]
+
+    def sumar(self, cantidad, ahora=None):
+        self.total += cantidad
+        segundo = int(time.monotonic() if ahora is None else ahora)
+        if self._por_segundo and self._por_segundo[-1][0] == segundo:
+            self._por_segundo[-1][1] += cantidad
+        else:
+            self._por_segundo.append([segundo, cantidad])
+        self._recortar(segundo)
+
+    def tasa(self, ahora=None) -> float:
+        segundo = int(time.monotonic() if ahora is None else ahora)
+        self._recortar(segundo)
+        return sum(cantidad for _, cantidad in self._por_segundo) / VENTANA_TASA_SEGUNDOS
+
+    def _recortar(self, segundo):
+        while self._por_segundo and self._por_segundo[0][0] <= segundo - VENTANA_TASA_SEGUNDOS:
+            self._por_segundo.popleft()
+
+
+class MetricasServidor:
+    """
+    Registro central de métricas. servidor_websockets.py llama a los métodos registrar_* desde sus puntos de
+    paso (enviar_mensaje, el subprocess de servidor.py y el final de cada trabajo) y registra como medidores las
+    lecturas instantáneas (cola del planificador, clientes conectados).
+    """
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.medidores = {}  # nombre -> (ayuda, función sin argumentos que retorna el valor)
+        self.subprocesos_vivos = 0
+        self.clientes = {}  # id_cliente -> {"filas", "bytes_enviados", "bytes_entrada", "ultima_actividad"}
+        self.latencia_envio = Histograma(LIMITES_LATENCIA_ENVIO)
+        self.envios_perdidos = {}  # motivo -> cuenta
+        self.duracion_trabajos = {}  # backend -> Histograma
+        self.espera_trabajos = Histograma(LIMITES_DURACION_TRABAJO)
+        self.trabajos_terminados = {}  # status -> cuenta
+        self._servidor_http = None
+
+    def registrar_medidor(self, nombre: str, ayuda: str, leer):
+        self.medidores[nombre] = (ayuda, leer)
+
+    def _cliente(self, id_cliente):
+        datos = self.clientes.get(id_cliente)
+        if datos is None:
+            datos = self.clientes[id_cliente] = {
+                "filas": ContadorConTasa(), "bytes_enviados": ContadorConTasa(), "bytes_entrada": 0,
+            }
+        datos["ultima_actividad"] = time.monotonic()
+        return datos
+
+    def registrar_envio(self, id_cliente, filas: int, num_bytes: int, segundos: float):
+        self.latencia_envio.observar(segundos)
+        datos = self._cliente(id_cliente)
+        datos["bytes_enviados"].sumar(num_bytes)
+        if filas:
+            datos["filas"].sumar(filas)
+
+    def registrar_envio_perdido(self, motivo: str):
+        self.envios_perdidos[motivo] = self.envios_perdidos.get(motivo, 0) + 1
+
+    def registrar_trabajo(self, id_cliente, backend: str, segundos: float, espera_segundos: float, status: str, bytes_entrada: int = 0):
+        histograma = self.duracion_trabajos.get(backend)
+        if histograma is None:
+            histograma = self.duracion_trabajos[backend] = Histograma(LIMITES_DURACION_TRABAJO)
+        histograma.observar(segundos)
+        self.espera_trabajos.observar(espera_segundos)
+        self.trabajos_terminados[status] = self.trabajos_terminados.get(status, 0) + 1
+        self._cliente(id_cliente)["bytes_entrada"] += bytes_entrada or 0
+
+    def _clientes_recientes(self):
+        limite = time.monotonic() - OLVIDAR_CLIENTE_SEGUNDOS
+        for id_cliente in [c for c, datos in self.clientes.items() if datos["ultima_actividad"] < limite]:
+            del self.clientes[id_cliente]
+        return self.clientes
+
+    def _leer_medidores(self):
+        valores = {}
+        for nombre, (_, leer) in self.medidores.items():
+            try:
+                valores[nombre] = leer()
+            except Exception as e:
+                logging.warning(f"No se pudo leer el medidor {nombre}: {e}")
+        return valores
+
+    def resumen(self) -> dict:
+        """Foto de las métricas para el comando `stats` de la CLI."""
+        return {
+            "uptime_seconds": round(time.monotonic() - self.inicio, 1),
+            "live_subprocesses": self.subprocesos_vivos,
+            **self._leer_medidores(),
+            "clients": {
+                id_cliente: {
+                    "rows_per_second": round(datos["filas"].tasa(), 2),
+                    "bytes_per_second": round(datos["bytes_enviados"].tasa(), 1),
+                    "rows_total": datos["filas"].total,
+                    "input_bytes_total": datos["bytes_entrada"],
+                }
+                for id_cliente, datos in self._clientes_recientes().items()
+            },
+            "send_latency_p50_seconds": self.latencia_envio.cuantil(0.5),
+            "send_latency_p99_seconds": self.latencia_envio.cuantil(0.99),
+            "sends_total": self.latencia_envio.total,
+            "sends_dropped": dict(self.envios_perdidos),
+            "jobs_finished": dict(self.trabajos_terminados),
+            "job_duration_p50_seconds": {b: h.cuantil(0.5) for b, h in self.duracion_trabajos.items()},
+            "job_duration_p99_seconds": {b: h.cuantil(0.99) for b, h in self.duracion_trabajos.items()},
+        }
+
+    def texto_prometheus(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (version 0.0.4)."""
+        lineas = []
+
+        def serie(nombre, tipo, ayuda, muestras):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+
+        def histograma(nombre, ayuda, por_etiqueta):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} histogram")
+            for etiquetas, h in por_etiqueta:
+                for limite, acumulado in h.acumulado():
+                    lineas.append(f"{nombre}_bucket{_etiquetas(dict(etiquetas, le=limite))} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(h.suma)}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {h.total}")
+
+        serie("ws_uptime_seconds", "gauge", "Segundos desde que arrancó el servidor.", [({}, time.monotonic() - self.inicio)])
+        serie("ws_live_subprocesses", "gauge", "Subprocesses de servidor.py en ejecución.", [({}, self.subprocesos_vivos)])
+        for nombre, valor in self._leer_medidores().items():
+            serie(f"ws_{nombre}", "gauge", self.medidores[nombre][0], [({}, valor)])
+        clientes = self._clientes_recientes()
+        serie("ws_client_rows_total", "counter", "Filas enviadas a cada cliente.",
+              [({"client": c}, d["filas"].total) for c, d in clientes.items()])
+        serie("ws_client_rows_per_second", "gauge", f"Filas/s enviadas a cada cliente (últimos {VENTANA_TASA_SEGUNDOS} s).",
+              [({"client": c}, d["filas"].tasa()) for c, d in clientes.items()])
+        serie("ws_client_bytes_sent_total", "counter", "Bytes enviados por WebSocket a cada cliente.",
+              [({"client": c}, d["bytes_enviados"].total) for c, d in clientes.items()])
+        serie("ws_client_bytes_per_second", "gauge", f"Bytes/s enviados a cada cliente (últimos {VENTANA_TASA_SEGUNDOS} s).",
+              [({"client": c}, d["bytes_enviados"].tasa()) for c, d in clientes.items()])
+        serie("ws_client_input_bytes_total", "counter", "Bytes de texto procesados en los trabajos terminados de cada cliente.",
+              [({"client": c}, d["bytes_entrada"]) for c, d in clientes.items()])
+        serie("ws_send_dropped_total", "counter", "Envíos WebSocket perdidos por motivo.",
+              [({"reason": motivo}, cuenta) for motivo, cuenta in self.envios_perdidos.items()])
+        serie("ws_jobs_finished_total", "counter", "Trabajos terminados por estado.",
+              [({"status": status}, cuenta) for status, cuenta in self.trabajos_terminados.items()])
+        histograma("ws_send_latency_seconds", "Latencia de cada envío WebSocket.", [({}, self.latencia_envio)])
+        histograma("ws_job_duration_seconds", "Duración de los trabajos (desde que salen de la cola).",
+                   [({"backend": b}, h) for b, h in self.duracion_trabajos.items()])
+        histograma("ws_job_queue_wait_seconds", "Espera de los trabajos en la cola del planificador.", [({}, self.espera_trabajos)])
+        return "\n".join(lineas) + "\n"
+
+    async def iniciar_http(self, host: str = "localhost", puerto: int = PUERTO_METRICAS):
+        try:
+            self._servidor_http = await asyncio.start_server(self._atender_http, host, puerto)
+        except OSError as e:
+            logging.warning(f"No se pudo abrir el endpoint de métricas en {host}:{puerto}: {e}. Solo estará el comando 'stats'.")
+            return
+        logging.info(f"Métricas disponibles en http://{host}:{puerto}/metrics")
+
+    async def cerrar_http(self):
+        if self._servidor_http is not None:
+            self._servidor_http.close()
+            await self._servidor_http.wait_closed()
+            self._servidor_http = None
+
+    async def _atender_http(self, reader, writer):
+        try:
+            peticion = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass  # Las cabeceras no se usan.
+            partes = peticion.decode("latin-1").split()
+            ruta = partes[1].split("?")[0] if len(partes) >= 2 else ""
+            if len(partes) >= 2 and partes[0] == "GET" and ruta in ("/", "/metrics"):
+                estado, cuerpo = "200 OK", self.texto_prometheus()
+            else:
+                estado, cuerpo = "404 Not Found", "Solo GET /metrics\n"
+            datos = cuerpo.encode("utf-8")
+            writer.write(
+                f"HTTP/1.0 {estado}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(datos)}\r\nConnection: close\r\n\r\n".encode("latin-1") + datos
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logging.warning(f"Error atendiendo una petición de métricas: {e}")
+        finally:
+            writer.close()
+
+
+#_etiquetas() formatea las etiquetas de una muestra: {a="x",b="y"} (vacío si no hay).
+def _etiquetas(etiquetas: dict) -> str:
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+#_numero() formatea un valor de muestra (enteros sin decimales, None como NaN).
+def _numero(valor) -> str:
+    if valor is None:
+        return "NaN"
+    if isinstance(valor, bool):
+        return str(int(valor))
+    if isinstance(valor, float):
+        return repr(round(valor, 6))
+    return str(valor)
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+# motor_extraccion.py agrupa la lógica de "un solo recorrido" para aplicar PATRONES_DATA a un texto.
+# Los patrones que son simples alternaciones de palabras literales (los que genera build_pattern: países,
+# destinos, ocupaciones, iglesias, etc.) se resuelven todos juntos con un trie, en una única pasada sobre
+# el texto. Solo los patrones estructurales (fechas, "born in", ventanas de contexto padre/hijo/cónyuge...)
+# se siguen ejecutando como regex independientes. Las de ventana de contexto ("father ... <nombre>") además
+# solo se ejecutan sobre las frases que contienen su palabra disparadora (ver indexar_disparadores()).
+# El resultado es idéntico al de aplicar cada regex por separado sobre el texto completo.
+# Con un PerfilPatrones (modo de instrumentación opcional) el motor además mide tiempo, matches y excepciones
+# por columna; sin él el camino rápido no cambia.
+import re, time
+
+FLAGS_PATRONES = re.IGNORECASE | re.UNICODE
+
+# Caracteres no ASCII que re.IGNORECASE considera iguales a una letra ASCII (y que str.lower() no resuelve
+# con la misma longitud). Se usa solo si el texto los contiene, para mantener las posiciones alineadas.
+_EQUIVALENTES_IGNORECASE = {"İ": "i", "ı": "i", "ſ": "s", "K": "k"}
+TABLA_PLEGADO = str.maketrans(
+    {**{chr(c): chr(c + 32) for c in range(ord("A"), ord("Z") + 1)}, **_EQUIVALENTES_IGNORECASE}
+)
+
+# Reconoce las formas literales que produce build_pattern() (con o sin grupo de captura y con "s?" opcional):
+#   \b(?:a|b|c)\b    \b(?:a|b)s?\b    \b((?:a|b))\b    \b(a|b|c)s?\b
+_RX_FORMA_LITERAL = re.compile(
+    r"^\\b(?P<abre>\((?:\?:)?)(?P<cuerpo>.*)\)(?P<plural>s\?)?\\b$", re.DOTALL
+)
+_METACARACTERES = set(".^$*+?{}[]()|")
+
+# Reconoce los patrones de ventana de contexto: \b(?:disparadores)\b[^.\n]{0,N}?(resto).
+# Como la ventana no cruza "." ni "\n", todo el match queda dentro de una misma frase.
+_RX_FORMA_VENTANA = re.compile(
+    r"^(?P<disparador>\\b\(\?:[^()]*\)\\b)\[\^\.\\n\]\{0,\d+\}\??(?P<resto>.*)$", re.DOTALL
+)
+# Elementos de regex que podrían consumir "." o "\n" (puntos, clases, escapes como \s o \W). Es conservador.
+_RX_PUEDE_CRUZAR_FRASE = re.compile(r"[.\[\n]|\\[A-Za-z0-9]")
+SEPARADORES_FRASE = (".", "\n")
+# Solapamiento (en caracteres) entre ventanas consecutivas del modo streaming; debe superar la longitud del
+# match más largo posible de cualquier patrón (las ventanas de contexto son de ~40, las fechas de ~40).
+MARGEN_STREAMING = 64 * 1024
+
+#plegar_texto() devuelve el texto en minúsculas con la misma longitud que el original, de forma que
+#una posición en el texto plegado corresponde a la misma posición en el original.
+def plegar_texto(txt: str) -> str:
+    plegado = txt.lower()
+    if len(plegado) != len(txt) or any(c in plegado for c in _EQUIVALENTES_IGNORECASE):
+        plegado = txt.translate(TABLA_PLEGADO)
+    return plegado
+
+#es_caracter_palabra() replica la definición de \w de re en modo Unicode.
+def es_caracter_palabra(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+#analizar_patron_literal() intenta reducir una regex de PATRONES_DATA a una lista ordenada de literales.
+#Parametros: rx: cadena regex, grp: grupo de captura usado. Retorna (terminos, plural) o None si no es literal.
+def analizar_patron_literal(rx: str, grp: int):
+    m = _RX_FORMA_LITERAL.match(rx)
+    if not m:
+        return None
+    cuerpo = m.group("cuerpo")
+    captura = m.group("abre") == "("
+    plural = m.group("plural") is not None
+    # El grupo usado debe abarcar todo el match: grupo 0, o grupo 1 si este envuelve todo y no hay "s?" fuera.
+    if grp not in (0, 1) or (grp == 1 and (not captura or plural)):
+        return None
+    # Un único grupo interno "(?:...)" sin nada alrededor (caso \b((?:a|b))\b que genera ALT_NOMBRES).
+    if cuerpo.startswith("(?:") and cuerpo.endswith(")") and cuerpo.count("(") == 1:
+        cuerpo = cuerpo[3:-1]
+    terminos, actual, i = [], [], 0
+    while i <= len(cuerpo):
+        c = cuerpo[i] if i < len(cuerpo) else "|"
+        if c == "\\":
+            # Un escape seguido de letra o dígito es una clase especial (\d, \s, \b...), no un literal.
+            if i + 1 >= len(cuerpo) or cuerpo[i + 1].isalnum():
+                return None
+            actual.append(cuerpo[i + 1])
+            i += 2
+            continue
+        if c == "|":
+            termino = "".join(actual)
+            # Los límites \b solo se pueden razonar localmente si el término empieza y termina en carácter de palabra.
+            if not termino or not termino.isascii() or not (es_caracter_palabra(termino[0]) and es_caracter_palabra(termino[-1])):
+                return None
+            terminos.append(termino)
+            actual = []
+        elif c in _METACARACTERES:
+            return None
+        else:
+            actual.append(c)
+        i += 1
+    return terminos, plural
+
+#analizar_patron_ventana() retorna la regex de la palabra disparadora si rx es un patrón de ventana de
+#contexto cuyo match completo nunca cruza un separador de frase; None en otro caso.
+def analizar_patron_ventana(rx: str):
+    m = _RX_FORMA_VENTANA.match(rx)
+    if not m:
+        return None
+    disparador, resto = m.group("disparador"), m.group("resto")
+    # Además el disparador debe ser ASCII para poder buscarlo en minúsculas sobre el texto plegado.
+    if _RX_PUEDE_CRUZAR_FRASE.search(disparador[2:-2]) or _RX_PUEDE_CRUZAR_FRASE.search(resto) or not disparador.isascii():
+        return None
+    return disparador
+
+#limites_frase() retorna (inicio, fin) de la frase que contiene la posición pos, delimitada por "." o "\n".
+def limites_frase(txt: str, pos: int):
+    inicio = max(txt.rfind(sep, 0, pos) for sep in SEPARADORES_FRASE) + 1
+    fines = [f for f in (txt.find(sep, pos) for sep in SEPARADORES_FRASE) if f != -1]
+    return inicio, (min(fines) if fines else len(txt))
+
+#construir_regex_trie() convierte un trie de dicts en una regex equivalente con prefijos factorizados.
+def construir_regex_trie(nodo: dict) -> str:
+    alternativas = [re.escape(c) + construir_regex_trie(nodo[c]) for c in sorted(k for k in nodo if k is not None)]
+    if not alternativas:
+        return ""
+    cuerpo = alternativas[0] if len(alternativas) == 1 else "(?:%s)" % "|".join(alternativas)
+    return f"(?:{cuerpo})?" if None in nodo else cuerpo
+
+
+class PerfilPatrones:
+    """
+    Contadores por columna de la extracción instrumentada: segundos, matches y excepciones (que sin perfil se
+    tragan en silencio), y el archivo donde la columna costó más. Se crea uno por archivo (archivo=nombre) y se
+    acumulan con fusionar(); resumen() es la forma que viaja en el sumario de processing_complete.
+    Las columnas literales se resuelven juntas en una sola pasada del trie: su tiempo va a la fase compartida
+    "literal_pass" y por columna solo se cuentan los matches.
+    """
+
+    def __init__(self, archivo: str = None):
+        self.archivo = archivo
+        self.columnas = {}  # col -> [segundos, matches, excepciones, max_segundos, archivo_max, ultima_excepcion]
+        self.tipos = {}  # col -> "literal" | "window" | "regex"
+        self.fases = {}  # fase compartida por varias columnas -> segundos
+
+    def registrar(self, col: str, segundos: float, matches: int = 0, excepcion: Exception = None, tipo: str = "regex"):
+        entrada = self.columnas.get(col)
+        if entrada is None:
+            entrada = self.columnas[col] = [0.0, 0, 0, 0.0, None, None]
+            self.tipos[col] = tipo
+        entrada[0] += segundos
+        entrada[1] += matches
+        if excepcion is not None:
+            entrada[2] += 1
+            entrada[5] = f"{type(excepcion).__name__}: {excepcion}"
+        if self.archivo is not None:
+            entrada[3], entrada[4] = entrada[0], self.archivo  # En el perfil de un archivo, el máximo es el total.
+
+    def registrar_fase(self, fase: str, segundos: float):
+        self.fases[fase] = self.fases.get(fase, 0.0) + segundos
+
+    def fusionar(self, otro):
+        """Acumula otro PerfilPatrones (de un archivo o ya agregado) en este."""
+        for col, (segundos, matches, excepciones, max_segundos, archivo_max, ultima) in otro.columnas.items():
+            entrada = self.columnas.get(col)
+            if entrada is None:
+                entrada = self.columnas[col] = [0.0, 0, 0, 0.0, None, None]
+                self.tipos[col] = otro.tipos.get(col, "regex")
+            entrada[0] += segundos
+            entrada[1] += matches
+            entrada[2] += excepciones
+            if max_segundos > entrada[3]:
+                entrada[3], entrada[4] = max_segundos, archivo_max
+            entrada[5] = ultima or entrada[5]
+        for fase, segundos in otro.fases.items():
+            self.registrar_fase(fase, segundos)
+
+    def fusionar_resumen(self, resumen: dict):
+        """Acumula un perfil en la forma de resumen() (p.ej. el que llega en el sumario de servidor.py)."""
+        otro = PerfilPatrones()
+        for c in resumen.get("columns", []):
+            otro.columnas[c["column"]] = [c["seconds"], c["matches"], c["exceptions"], c.get("slowest_file_seconds") or 0.0,
+                                          c.get("slowest_file"), c.get("last_exception")]
+            otro.tipos[c["column"]] = c.get("kind", "regex")
+        otro.fases = dict(resumen.get("shared_phases", {}))
+        self.fusionar(otro)
+
+    def resumen(self) -> dict:
+        """Columnas ordenadas de más a menos costosa, con la fase compartida de las literales aparte."""
+        columnas = [
+            {
+                "column": col,
+                "kind": self.tipos.get(col, "regex"),
+                "seconds": round(segundos, 4),
+                "matches": matches,
+                "exceptions": excepciones,
+                "slowest_file": archivo_max,
+                "slowest_file_seconds": round(max_segundos, 4),
+                "last_exception": ultima,
+            }
+            for col, (segundos, matches, excepciones, max_segundos, archivo_max, ultima) in self.columnas.items()
+        ]
+        columnas.sort(key=lambda c: -c["seconds"])
+        return {
+            "total_seconds": round(sum(c[0] for c in self.columnas.values()) + sum(self.fases.values()), 4),
+            "shared_phases": {fase: round(segundos, 4) for fase, segundos in self.fases.items()},
+            "columns": columnas,
+        }
+
+    def lineas_texto(self, max_columnas: int = 10) -> list:
+        """Tabla legible de las columnas más costosas (para la CLI del servidor y los logs)."""
+        resumen = self.resumen()
+        lineas = [f"Total {resumen['total_seconds']}s; fases compartidas: {resumen['shared_phases']}"]
+        for c in resumen["columns"][:max_columnas]:
+            linea = f"{c['column']:<25} {c['kind']:<7} {c['seconds']:>9.4f}s {c['matches']:>8} matches {c['exceptions']:>3} exc."
+            if c["slowest_file"]:
+                linea += f"  peor archivo: {c['slowest_file']} ({c['slowest_file_seconds']}s)"
+            if c["last_exception"]:
+                linea += f"  última excepción: {c['last_exception']}"
+            lineas.append(linea)
+        return lineas
+
+
+class MotorExtraccion:
+    """
+    Aplica un conjunto de patrones (col, regex, grupo) a un texto.
+    Los patrones literales se resuelven en una sola pasada con un trie; el resto se ejecuta como regex.
+    """
+
+    def __init__(self, patrones_data):
+        self.columnas = [col for col, _, _ in patrones_data]
+        self.patrones = [(col, re.compile(rx, FLAGS_PATRONES), grp) for col, rx, grp in patrones_data]
+        self.estructurales = []  # [(indice_columna, col, regex_compilada, grp)]
+        self.ventanas = []  # [(indice_columna, col, regex_compilada, grp, indice_disparador)]
+        self.disparadores = []  # regex (cadena) de cada palabra disparadora distinta
+        self.literales = []  # [(indice_columna, col, regex_compilada, grp)] (para respaldo si el trie falla)
+        self.trie = {}
+        for idx, (col, rx, grp) in enumerate(patrones_data):
+            analisis = analizar_patron_literal(rx, grp)
+            if analisis is None:
+                disparador = analizar_patron_ventana(rx)
+                if disparador is None:
+                    self.estructurales.append((idx, col, self.patrones[idx][1], grp))
+                else:
+                    if disparador not in self.disparadores:
+                        self.disparadores.append(disparador)
+                    self.ventanas.append((idx, col, self.patrones[idx][1], grp, self.disparadores.index(disparador)))
+                continue
+            terminos, plural = analisis
+            self.literales.append((idx, col, self.patrones[idx][1], grp))
+            # El orden de las alternativas define la prioridad, igual que en la regex ("As" antes que "A" si plural).
+            prioridad = 0
+            for termino in terminos:
+                variantes = [termino + "s", termino] if plural else [termino]
+                for variante in variantes:
+                    self._insertar_en_trie(variante.translate(TABLA_PLEGADO), idx, prioridad)
+                    prioridad += 1
+        self.regex_candidatos = (
+            re.compile(r"\b(?=%s)" % construir_regex_trie(self.trie)) if self.trie else None
+        )
+        # Una sola regex de búsqueda para todas las palabras disparadoras, sobre el texto plegado y sin
+        # IGNORECASE (mucho más rápida). Es de ancho cero para visitar todas las posiciones aunque dos
+        # disparadores se solapen; cada posición se confirma luego con la regex original del disparador.
+        self.disparadores_compilados = [re.compile(d, FLAGS_PATRONES) for d in self.disparadores]
+        self.regex_disparadores = (
+            re.compile(r"\b(?=%s)" % "|".join(d[2:].lower() for d in self.disparadores))
+            if self.disparadores else None
+        )
+
+    def _insertar_en_trie(self, termino_plegado, idx_columna, prioridad):
+        nodo = self.trie
+        for c in termino_plegado:
+            nodo = nodo.setdefault(c, {})
+        finales = nodo.setdefault(None, {})
+        # Si el mismo texto aparece dos veces en una columna, gana la primera alternativa.
+        finales.setdefault(idx_columna, prioridad)
+
+    def _extraer_literales(self, txt: str, plegado: str, valores: list, siguiente_libre=None, corte=None, aceptar_desde=0,
+                           conteo=None):
+        """
+        Recorre una vez el texto y rellena valores[idx] para todas las columnas literales.
+        siguiente_libre (idx_columna -> primera posición donde puede empezar el próximo match) permite
+        continuar un recorrido anterior; con corte solo se aceptan matches que empiezan antes de esa posición.
+        Los matches que empiezan antes de aceptar_desde avanzan siguiente_libre pero no se guardan.
+        Si se pasa conteo (idx_columna -> matches), se suman ahí los matches guardados.
+        Retorna siguiente_libre actualizado.
+        """
+        n = len(txt)
+        if siguiente_libre is None:
+            siguiente_libre = {}
+        desde = min((siguiente_libre.get(idx, 0) for idx, *_ in self.literales), default=0)
+        for m in self.regex_candidatos.finditer(plegado, desde):
+            # El \b de regex_candidatos ya garantiza el límite de palabra al inicio (lower() conserva \w).
+            inicio = m.start()
+            if corte is not None and inicio >= corte:
+                break
+            mejores = {}  # idx_columna -> (prioridad, fin)
+            nodo = self.trie
+            pos = inicio
+            while pos < n:
+                nodo = nodo.get(plegado[pos])
+                if nodo is None:
+                    break
+                pos += 1
+                finales = nodo.get(None)
+                if finales and (pos == n or not es_caracter_palabra(txt[pos])):
+                    for idx, prioridad in finales.items():
+                        actual = mejores.get(idx)
+                        if actual is None or prioridad < actual[0]:
+                            mejores[idx] = (prioridad, pos)
+            for idx, (_, fin) in mejores.items():
+                if inicio >= siguiente_libre.get(idx, 0):
+                    if inicio >= aceptar_desde:
+                        valores[idx].add(txt[inicio:fin])
+                        if conteo is not None:
+                            conteo[idx] = conteo.get(idx, 0) + 1
+                    siguiente_libre[idx] = fin
+        return siguiente_libre
+
+    def indexar_disparadores(self, txt: str, plegado: str = None) -> list:
+        """
+        Pre-pasada barata: localiza las palabras disparadoras y retorna, por disparador, la lista ordenada
+        de frases (inicio, fin) donde aparece. Una lista vacía significa que el patrón no puede encontrar nada.
+        """
+        if plegado is None:
+            plegado = plegar_texto(txt)
+        frases = [[] for _ in self.disparadores]
+        for m in self.regex_disparadores.finditer(plegado):
+            pos = m.start()
+            limites = None
+            for i_disp, regex_disp in enumerate(self.disparadores_compilados):
+                frases_disp = frases[i_disp]
+                # Las posiciones llegan en orden: si cae en la última frase registrada no hace falta repetirla.
+                if frases_disp and pos < frases_disp[-1][1]:
+                    continue
+                if regex_disp.match(txt, pos):
+                    if limites is None:
+                        limites = limites_frase(txt, pos)
+                    frases_disp.append(limites)
+        return frases
+
+    def extraer(self, txt: str, perfil: PerfilPatrones = None, cancelado=None) -> list:
+        """
+        Retorna una lista (en el orden de las columnas) con el set de valores limpios encontrados por columna.
+        Si una regex falla, su columna queda vacía (igual que el comportamiento histórico).
+        Con perfil se registran tiempo, matches y excepciones por columna (ver PerfilPatrones).
+        cancelado es un threading.Event opcional: si se activa, retorna entre columnas lo encontrado hasta ahí.
+        """
+        valores = [set() for _ in self.columnas]
+        t0 = time.perf_counter() if perfil is not None else 0.0
+        plegado = plegar_texto(txt) if (self.regex_candidatos is not None or self.ventanas) else None
+        if self.regex_candidatos is not None:
+            conteo = {} if perfil is not None else None
+            try:
+                self._extraer_literales(txt, plegado, valores, conteo=conteo)
+            except Exception as e:
+                # Respaldo: aplicar las regex literales una por una (con perfil, cada una se mide por separado).
+                if perfil is not None:
+                    perfil.registrar("(literal_pass)", time.perf_counter() - t0, excepcion=e, tipo="literal")
+                for idx, col, regex_compilada, grp in self.literales:
+                    self._aplicar_columna(valores, idx, col, regex_compilada, grp, txt, perfil=perfil, tipo="literal")
+            else:
+                if perfil is not None:
+                    perfil.registrar_fase("literal_pass", time.perf_counter() - t0)
+                    for idx, col, *_ in self.literales:
+                        perfil.registrar(col, 0.0, conteo.get(idx, 0), tipo="literal")
+        for idx, col, regex_compilada, grp in self.estructurales:
+            if cancelado is not None and cancelado.is_set():
+                return valores
+            self._aplicar_columna(valores, idx, col, regex_compilada, grp, txt, perfil=perfil)
+        if self.ventanas:
+            t0 = time.perf_counter() if perfil is not None else 0.0
+            try:
+                frases = self.indexar_disparadores(txt, plegado)
+            except Exception:
+                frases = None  # Respaldo: texto completo.
+            if perfil is not None:
+                perfil.registrar_fase("trigger_index", time.perf_counter() - t0)
+            for idx, col, regex_compilada, grp, i_disp in self.ventanas:
+                if cancelado is not None and cancelado.is_set():
+                    return valores
+                segmentos = None if frases is None else frases[i_disp]
+                if segmentos == []:
+                    if perfil is not None:
+                        perfil.registrar(col, 0.0, tipo="window")
+                    continue  # Ninguna frase contiene el disparador: la regex no puede encontrar nada.
+                self._aplicar_columna(valores, idx, col, regex_compilada, grp, txt, segmentos, perfil, "window")
+        return valores
+
+    def extraer_por_bloques(self, bloques, margen=MARGEN_STREAMING, aceptar_desde=0, aceptar_hasta=None,
+                            perfil: PerfilPatrones = None, cancelado=None):
+        """
+        Versión en streaming de extraer(): recibe un iterable de trozos de texto consecutivos y mantiene en
+        memoria solo una ventana acotada (lo pendiente + margen), sin importar el tamaño total.
+
+        Cada columna guarda su posición de reanudación absoluta, igual que haría finditer sobre el texto
+        completo. En cada ventana solo se aceptan matches que empiezan antes de len(ventana) - margen; los
+        que empiezan después (o cuyo final toca el borde, señal de que el margen se quedó corto) se vuelven a
+        buscar en la siguiente ventana. Así un match que cruza el borde entre bloques se encuentra una sola
+        vez y completo. El resultado es idéntico a extraer() mientras ningún match (ni intento de match)
+        abarque más de `margen` caracteres. Retorna (valores, hubo_texto) donde hubo_texto indica si apareció
+        algún carácter que no sea espacio.
+
+        Con aceptar_desde/aceptar_hasta (posiciones absolutas) solo se guardan los matches que empiezan en
+        ese rango: el texto anterior sirve para sincronizar el recorrido y el posterior como contexto. Es lo
+        que usa la extracción de un segmento de un archivo grande (ver servidor.extraer_segmento_de_archivo()).
+        Con perfil se acumulan tiempo, matches y excepciones por columna de todas las ventanas.
+        Los fallos se tratan igual que en extraer(): si una regex lanza una excepción su columna queda vacía (y no se
+        vuelve a aplicar en el resto del texto), y si falla la pasada del trie las columnas literales siguen, desde
+        donde iban, aplicando sus regex una por una.
+        cancelado es un threading.Event opcional: si se activa, se deja de leer bloques y se retorna lo encontrado
+        hasta ahí (un resultado parcial que el que lo pidió debe descartar).
+        """
+        valores = [set() for _ in self.columnas]
+        regex_columnas = [(idx, col, regex_compilada, grp, "regex") for idx, col, regex_compilada, grp in self.estructurales]
+        regex_columnas += [(idx, col, regex_compilada, grp, "window") for idx, col, regex_compilada, grp, _ in self.ventanas]
+        # Posiciones absolutas de reanudación, solo de columnas con patrón (las demás no retienen la ventana).
+        reanudar = {idx: 0 for idx, *_ in self.literales}
+        reanudar.update((idx, 0) for idx, *_ in regex_columnas)
+        conteo = {} if perfil is not None else None
+        usar_trie = self.regex_candidatos is not None
+        muertas = set()  # Columnas cuya regex lanzó una excepción: vacías hasta el final.
+        ventana, base = "", 0  # ventana[0] corresponde a la posición absoluta base
+        hubo_texto = False
+        iterador = iter(bloques)
+        bloque = next(iterador, None)
+        while bloque is not None:
+            if cancelado is not None and cancelado.is_set():
+                break
+            siguiente = next(iterador, None)
+            final = siguiente is None
+            ventana += bloque
+            hubo_texto = hubo_texto or bool(bloque.strip())
+            bloque = siguiente
+            if not final and len(ventana) <= 2 * margen:
+                continue  # Acumular hasta tener algo más que el margen.
+            corte = len(ventana) if final else len(ventana) - margen
+            if aceptar_hasta is not None:
+                corte = min(corte, aceptar_hasta - base)
+
+            if usar_trie:
+                t0 = time.perf_counter() if perfil is not None else 0.0
+                libres = {idx: max(reanudar[idx] - base, 0) for idx, *_ in self.literales}
+                # Los matches de la ventana se juntan aparte: si el trie falla a medias no queda nada de esta pasada.
+                nuevos, conteo_ventana = [set() for _ in self.columnas], {}
+                try:
+                    libres = self._extraer_literales(
+                        ventana, plegar_texto(ventana), nuevos, libres, corte, aceptar_desde - base, conteo_ventana
+                    )
+                except Exception as e:
+                    # Respaldo: desde aquí las columnas literales se aplican como regex, desde donde iban.
+                    usar_trie = False
+                    regex_columnas += [(idx, col, regex_compilada, grp, "literal") for idx, col, regex_compilada, grp in self.literales]
+                    if perfil is not None:
+                        perfil.registrar("(literal_pass)", time.perf_counter() - t0, excepcion=e, tipo="literal")
+                else:
+                    for idx, *_ in self.literales:
+                        valores[idx] |= nuevos[idx]
+                        reanudar[idx] = base + max(libres[idx], corte)
+                        if conteo is not None:
+                            conteo[idx] = conteo.get(idx, 0) + conteo_ventana.get(idx, 0)
+                    if perfil is not None:
+                        perfil.registrar_fase("literal_pass", time.perf_counter() - t0)
+            for idx, col, regex_compilada, grp, tipo in regex_columnas:
+                if cancelado is not None and cancelado.is_set():
+                    break
+                if idx in muertas:
+                    continue
+                t0 = time.perf_counter() if perfil is not None else 0.0
+                matches, excepcion = 0, None
+                pos = max(reanudar[idx] - base, 0)
+                nuevo_reanudar = base + corte
+                try:
+                    for m in regex_compilada.finditer(ventana, pos):
+                        if m.start() >= corte:
+                            break
+                        if not final and m.end() >= len(ventana) - 1:
+                            # El match llega al borde: podría seguir en el próximo bloque. Se repite allí.
+                            nuevo_reanudar = base + m.start()
+                            break
+                        valor_crudo = m.group(grp) if (m.lastindex is not None and grp <= m.lastindex) else m.group(0)
+                        if base + m.start() >= aceptar_desde:
+                            matches += 1
+                            if valor_crudo and valor_crudo.strip():
+                                valores[idx].add(valor_crudo.strip())
+                        nuevo_reanudar = max(base + m.end(), base + corte)
+                except Exception as e:
+                    excepcion = e
+                if excepcion is None:
+                    reanudar[idx] = nuevo_reanudar
+                else:
+                    # Igual que en extraer(): la columna queda vacía, y ya no retiene la ventana.
+                    valores[idx] = set()
+                    muertas.add(idx)
+                    del reanudar[idx]
+                if perfil is not None:
+                    perfil.registrar(col, time.perf_counter() - t0, matches, excepcion, tipo)
+            if aceptar_hasta is not None and base + corte >= aceptar_hasta:
+                break  # Lo que queda es solo contexto posterior.
+
+            # Descartar lo ya resuelto, conservando un carácter previo para los \b.
+            descartar = max(min(reanudar.values(), default=base + corte) - base - 1, 0)
+            ventana, base = ventana[descartar:], base + descartar
+        if perfil is not None:
+            for idx, col, *_ in self.literales:
+                perfil.registrar(col, 0.0, conteo.get(idx, 0), tipo="literal")
+        return valores, hubo_texto
+
+    def _aplicar_columna(self, valores, idx, col, regex_compilada, grp, txt, segmentos=None, perfil=None, tipo="regex"):
+        """Rellena valores[idx] con _aplicar_regex(); con perfil, midiendo tiempo, matches y excepción."""
+        if perfil is None:
+            valores[idx] = self._aplicar_regex(regex_compilada, grp, txt, segmentos)
+            return
+        t0 = time.perf_counter()
+        valores[idx], matches, excepcion = self._aplicar_regex_contando(regex_compilada, grp, txt, segmentos)
+        perfil.registrar(col, time.perf_counter() - t0, matches, excepcion, tipo)
+
+    @staticmethod
+    def _aplicar_regex(regex_compilada, grp, txt, segmentos=None):
+        """Aplica la regex al texto completo o solo a los segmentos (inicio, fin) indicados."""
+        return MotorExtraccion._aplicar_regex_contando(regex_compilada, grp, txt, segmentos)[0]
+
+    @staticmethod
+    def _aplicar_regex_contando(regex_compilada, grp, txt, segmentos=None):
+        """Igual que _aplicar_regex() pero retorna (valores, matches, excepción o None)."""
+        encontrados = set()
+        matches = 0
+        try:
+            for pos, endpos in (segmentos if segmentos is not None else [(0, len(txt))]):
+                for m in regex_compilada.finditer(txt, pos, endpos):
+                    matches += 1
+                    valor_crudo = m.group(grp) if (m.lastindex is not None and grp <= m.lastindex) else m.group(0)
+                    if valor_crudo:
+                        valor_limpio = valor_crudo.strip()
+                        if valor_limpio:
+                            encontrados.add(valor_limpio)
+        except Exception as e:
+            return set(), matches, e
+        return encontrados, matches, None
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# nodo_extraccion.py es un nodo remoto de extracción: se conecta al WebSocket de servidor_websockets.py, registra su
+# capacidad (workers) y extrae con su propio pool de procesos los archivos que le reparte el coordinador
+# (ver coordinador_nodos.py). Si la conexión se pierde, reintenta; el coordinador habrá repartido sus archivos entre
+# los demás nodos.
+#   python nodo_extraccion.py --servidor ws://servidor:8765 --capacidad 8 --token <token>
+# El token es el que tiene configurado el servidor (--token-nodos o TOKEN_NODOS_EXTRACCION, que el nodo también lee);
+# sin token, el servidor solo acepta nodos que se conectan desde su propia máquina.
+# Varios nodos pueden correr en la misma máquina (cada uno con su propia conexión) para probar el reparto.
+# Mensajes: el nodo envía {"tipo": "registrar_nodo", "capacidad": 8, "nombre": ..., "comparte_disco": false, "token": ...} y recibe
+# {"tipo": "tarea_extraccion", "id_tarea": ..., "nombre": ..., "datos": <base64, o bytes con MessagePack>} (o "ruta"
+# con --comparte-disco), a los que responde {"tipo": "resultado_tarea", "id_tarea", "archivo", "encontradas",
+# "valores", "error"} con el ResultadoExtraccion compacto. Cada tarea lleva también "patrones": [versión, huella] y
+# la primera de cada versión su "definicion_patrones" (ver conjuntos_patrones.py): el nodo no necesita tener los
+# mismos archivos de patrones que el coordinador.
+import argparse, asyncio, base64, json, logging, os, socket, traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import websockets
+
+import servidor as extractor  # Importarlo compila los patrones activos una vez; los workers lo heredan (fork) o lo importan.
+from resultado_extraccion import ResultadoExtraccion
+from protocolo_ws import CODIFICACIONES, MensajeInvalido, decodificar_mensaje
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+REINTENTO_CONEXION_S = 1.0
+MAX_REINTENTO_CONEXION_S = 30.0
+VARIABLE_TOKEN_NODOS = "TOKEN_NODOS_EXTRACCION"
+
+
+class NodoRechazado(Exception):
+    """El coordinador rechazó registrar_nodo por el token: reintentar no sirve de nada."""
+
+#_inicializar_worker() se ejecuta una vez en cada proceso del pool del nodo (con "spawn" compila aquí las regex).
+def _inicializar_worker():
+    import servidor  # noqa: F401
+
+#extraer_contenido() es la tarea de los workers del nodo: extrae un archivo recibido como bytes (o, con disco
+#compartido, leído de su ruta) con la misma semántica que servidor.extraer_resultado_de_archivo(), con los patrones
+#de la clave patrones (compilados desde definicion la primera vez que el worker la ve).
+#retorna: (ResultadoExtraccion, mensaje_error)
+def extraer_contenido(nombre: str, datos: bytes = None, ruta: str = None, patrones: tuple = None, definicion: dict = None):
+    motor = extractor.conjunto_patrones(patrones, definicion).motor
+    if ruta is not None:
+        return extractor.extraer_resultado_de_archivo(ruta, motor=motor)
+    try:
+        txt = extractor.decodificar_como_texto(datos)
+        if not txt.strip():
+            return ResultadoExtraccion(nombre), "File is empty or whitespace only"
+        return extractor.do_actual_processing_for_file(txt, nombre, motor=motor), "None"
+    except Exception as e_general:
+        return ResultadoExtraccion(nombre), f"Error inesperado procesando {nombre}: {type(e_general).__name__} - {e_general}"
+
+#atender_tarea() extrae el archivo de un mensaje tarea_extraccion en el pool y envía su resultado_tarea.
+#definiciones es el dict clave (versión, huella) -> definición de los patrones recibidos en esta conexión.
+async def atender_tarea(websocket, executor, data, definiciones):
+    respuesta = {"tipo": "resultado_tarea", "id_tarea": data.get("id_tarea")}
+    try:
+        datos = data.get("datos")
+        if isinstance(datos, str):
+            datos = base64.b64decode(datos)
+        patrones = tuple(data["patrones"]) if isinstance(data.get("patrones"), list) else None
+        # La definición (unos KB) acompaña a cada tarea hacia el worker: un worker del pool puede no haberla visto.
+        resultado, mensaje_error = await asyncio.get_running_loop().run_in_executor(
+            executor, extraer_contenido, data.get("nombre", ""), datos, data.get("ruta"), patrones, definiciones.get(patrones)
+        )
+        respuesta.update({
+            "archivo": resultado.archivo,
+            "encontradas": resultado.encontradas,
+            "valores": [list(valores_columna) for valores_columna in resultado.valores],
+            "error": mensaje_error,
+        })
+    except Exception as e_tarea:
+        logging.error(f"Error extrayendo '{data.get('nombre')}': {e_tarea}\n{traceback.format_exc()}")
+        respuesta["error_nodo"] = f"{type(e_tarea).__name__}: {e_tarea}"
+    try:
+        await websocket.send(json.dumps(respuesta))  # Las respuestas son pequeñas: siempre JSON de texto.
+    except websockets.exceptions.ConnectionClosed:
+        pass  # El coordinador ya repartió la tarea a otro nodo.
+
+#servir() mantiene una conexión con el coordinador: se registra y atiende tareas hasta que la conexión se cierra.
+async def servir(url: str, capacidad: int, nombre: str, comparte_disco: bool, executor, token: str = None):
+    # max_size=None: una tarea lleva el archivo entero.
+    async with websockets.connect(url, max_size=None) as websocket:
+        if "msgpack" in CODIFICACIONES:
+            # Con MessagePack el contenido de los archivos llega en binario en lugar de base64.
+            await websocket.send(json.dumps({"tipo": "negociar_protocolo", "codificacion": "msgpack", "compresion": "ninguna"}))
+        registro = {"tipo": "registrar_nodo", "capacidad": capacidad, "nombre": nombre, "comparte_disco": comparte_disco}
+        if token:
+            registro["token"] = token
+        await websocket.send(json.dumps(registro))
+        tareas = set()
+        definiciones = {}
+        async for mensaje in websocket:
+            try:
+                data = decodificar_mensaje(mensaje)
+            except MensajeInvalido as e_formato:
+                logging.warning(f"Mensaje del coordinador ignorado: {e_formato}")
+                continue
+            tipo_mensaje = data.get("tipo")
+            if tipo_mensaje == "tarea_extraccion":
+                # La definición se guarda antes de lanzar la tarea: las siguientes de la misma versión ya no la traen.
+                if isinstance(data.get("patrones"), list) and isinstance(data.get("definicion_patrones"), dict):
+                    definiciones[tuple(data["patrones"])] = data["definicion_patrones"]
+                tarea = asyncio.create_task(atender_tarea(websocket, executor, data, definiciones))
+                tareas.add(tarea)
+                tarea.add_done_callback(tareas.discard)
+            elif tipo_mensaje == "confirmacion_registro_nodo":
+                logging.info(f"Registrado en {url} como {data.get('id_nodo')} ({capacidad} worker(s); capacidad total {data.get('capacidad_total')}).")
+            elif tipo_mensaje == "error_servidor":
+                if data.get("status") == "error_node_auth":
+                    raise NodoRechazado(data.get("mensaje"))
+                logging.warning(f"Coordinador: {data.get('mensaje')}")
+            elif tipo_mensaje == "servidor_desconectado":
+                logging.info("El coordinador se está cerrando.")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Nodo remoto de extracción para servidor_websockets.py.")
+    parser.add_argument("--servidor", default="ws://localhost:8765", help="URL WebSocket del coordinador.")
+    parser.add_argument("--capacidad", type=int, default=os.cpu_count() or 1, help="Workers (procesos) de este nodo; por defecto, los núcleos.")
+    parser.add_argument("--nombre", default=f"{socket.gethostname()}:{os.getpid()}", help="Nombre del nodo en el coordinador.")
+    parser.add_argument("--comparte-disco", action="store_true",
+                        help="El nodo ve las mismas rutas que el coordinador (disco compartido): recibe rutas en lugar del contenido.")
+    parser.add_argument("--token", default=os.environ.get(VARIABLE_TOKEN_NODOS),
+                        help=f"Token de nodos configurado en el servidor (por defecto, la variable {VARIABLE_TOKEN_NODOS}).")
+    args = parser.parse_args()
+    capacidad = max(1, args.capacidad)
+
+    with ProcessPoolExecutor(max_workers=capacidad, initializer=_inicializar_worker) as executor:
+        espera = REINTENTO_CONEXION_S
+        while True:
+            try:
+                await servir(args.servidor, capacidad, args.nombre, args.comparte_disco, executor, args.token)
+                espera = REINTENTO_CONEXION_S
+                logging.info("Conexión con el coordinador cerrada; reconectando...")
+            except (OSError, websockets.exceptions.ConnectionClosed, websockets.exceptions.InvalidHandshake) as e_conexion:
+                logging.warning(f"Sin conexión con {args.servidor} ({e_conexion}); reintento en {espera:.0f}s.")
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, MAX_REINTENTO_CONEXION_S)
+            except NodoRechazado as e_registro:
+                logging.error(f"{e_registro} Revisa --token (o {VARIABLE_TOKEN_NODOS}).")
+                return
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("Nodo detenido.")
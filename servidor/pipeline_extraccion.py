@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# pipeline_extraccion.py encadena la extracción del modo thread de servidor.py en tres etapas que se solapan:
+#   - lectura: threads dedicados que leen y decodifican los archivos por adelantado en una cola acotada (en número
+#     de archivos y en bytes), así la espera de disco o de un directorio de red no ocupa a los extractores;
+#   - extracción: tantos threads como núcleos (o menos, si se piden menos workers) aplicando las regex al texto ya leído;
+#   - escritura: un único consumidor (el thread que recorre ejecutar()) que serializa y emite las filas.
+# Cada etapa lleva sus propios contadores (archivos, bytes, tiempo ocupado y tiempo esperando a la etapa vecina)
+# para ver cuál limita el rendimiento: lectura con mucho tiempo ocupado = I/O; extracción esperando = falta prefetch.
+import os, queue, threading, time
+
+LECTORES_POR_DEFECTO = 2
+MAX_ARCHIVOS_EN_COLA = 32  # Archivos leídos esperando a un extractor.
+MAX_BYTES_EN_COLA = 64 * 1024 * 1024  # Tope de bytes leídos y aún no extraídos (siempre cabe al menos un archivo).
+
+
+#extractores_por_nucleos() retorna cuántos threads de extracción usar: los workers pedidos, sin pasar de los núcleos.
+def extractores_por_nucleos(workers: int) -> int:
+    return max(1, min(workers, os.cpu_count() or 1))
+
+
+class ContadorEtapa:
+    """Contadores de una etapa; sumar() es seguro entre threads."""
+
+    def __init__(self, hilos: int):
+        self.hilos = hilos
+        self.archivos = 0
+        self.bytes = 0
+        self.segundos_ocupado = 0.0
+        self.segundos_esperando = 0.0
+        self._lock = threading.Lock()
+
+    def sumar(self, bytes_archivo: int, ocupado: float, esperando: float):
+        with self._lock:
+            self.archivos += 1
+            self.bytes += bytes_archivo
+            self.segundos_ocupado += ocupado
+            self.segundos_esperando += esperando
+
+    def resumen(self, duracion: float) -> dict:
+        duracion = max(duracion, 1e-9)
+        return {
+            "threads": self.hilos,
+            "files": self.archivos,
+            "bytes": self.bytes,
+            "busy_seconds": round(self.segundos_ocupado, 3),
+            "wait_seconds": round(self.segundos_esperando, 3),
+            "files_per_second": round(self.archivos / duracion, 2),
+            "mb_per_second": round(self.bytes / duracion / (1024 * 1024), 2),
+            "utilization": round(self.segundos_ocupado / (duracion * self.hilos), 3),
+        }
+
+
+class PipelineExtraccion:
+    """
+    leer(ruta) retorna el texto del archivo o None si la etapa de extracción debe leerlo ella misma (archivo para
+    streaming o error de lectura, que así se reporta con su mensaje habitual); extraer(ruta, texto) retorna la salida
+    del archivo. tamanos (ruta -> bytes) alimenta los contadores y el tope de bytes en cola.
+    """
+
+    def __init__(self, leer, extraer, extractores: int, lectores: int = LECTORES_POR_DEFECTO,
+                 max_archivos_en_cola: int = MAX_ARCHIVOS_EN_COLA, max_bytes_en_cola: int = MAX_BYTES_EN_COLA):
+        self.leer = leer
+        self.extraer = extraer
+        self.num_extractores = max(1, extractores)
+        self.num_lectores = max(1, lectores)
+        self.max_archivos_en_cola = max_archivos_en_cola
+        self.max_bytes_en_cola = max_bytes_en_cola
+        self.lectura = ContadorEtapa(self.num_lectores)
+        self.extraccion = ContadorEtapa(self.num_extractores)
+        self.escritura = ContadorEtapa(1)
+        self.max_archivos_en_cola_visto = 0
+        self.duracion = 0.0
+
+    def ejecutar(self, rutas: list, tamanos: dict = None):
+        """
+        Recorre (ruta, salida, excepcion) en orden de terminación; quien recorre el generador es la etapa de
+        escritura. excepcion es la que lanzó extraer() (y salida None) o None.
+        """
+        tamanos = tamanos or {}
+        t0 = time.perf_counter()
+        pendientes = queue.Queue()
+        for ruta in rutas:
+            pendientes.put(ruta)
+        textos = queue.Queue(self.max_archivos_en_cola)
+        salidas = queue.Queue()
+        cupo = threading.Condition()
+        estado = {"bytes_en_cola": 0, "lectores_vivos": self.num_lectores, "extractores_vivos": self.num_extractores}
+
+        def lector():
+            try:
+                while True:
+                    try:
+                        ruta = pendientes.get_nowait()
+                    except queue.Empty:
+                        return
+                    t_inicio = time.perf_counter()
+                    texto = self.leer(ruta)
+                    t_leido = time.perf_counter()
+                    bytes_archivo = tamanos.get(ruta, 0) if texto is not None else 0
+                    with cupo:
+                        # Se espera si el archivo no cabe en el tope de bytes, salvo con la cola vacía.
+                        cupo.wait_for(lambda: estado["bytes_en_cola"] == 0
+                                      or estado["bytes_en_cola"] + bytes_archivo <= self.max_bytes_en_cola)
+                        estado["bytes_en_cola"] += bytes_archivo
+                    textos.put((ruta, texto, bytes_archivo))
+                    self.max_archivos_en_cola_visto = max(self.max_archivos_en_cola_visto, textos.qsize())
+                    self.lectura.sumar(bytes_archivo, t_leido - t_inicio, time.perf_counter() - t_leido)
+            finally:
+                with cupo:
+                    estado["lectores_vivos"] -= 1
+                    ultimo = estado["lectores_vivos"] == 0
+                if ultimo:
+                    for _ in range(self.num_extractores):
+                        textos.put(None)
+
+        def extractor():
+            try:
+                while True:
+                    t_espera = time.perf_counter()
+                    elemento = textos.get()
+                    if elemento is None:
+                        return
+                    ruta, texto, bytes_en_cola = elemento
+                    with cupo:
+                        estado["bytes_en_cola"] -= bytes_en_cola
+                        cupo.notify_all()
+                    t_inicio = time.perf_counter()
+                    try:
+                        salida, excepcion = self.extraer(ruta, texto), None
+                    except Exception as e:
+                        salida, excepcion = None, e
+                    salidas.put((ruta, salida, excepcion))
+                    self.extraccion.sumar(tamanos.get(ruta, 0), time.perf_counter() - t_inicio, t_inicio - t_espera)
+            finally:
+                with cupo:
+                    estado["extractores_vivos"] -= 1
+                    ultimo = estado["extractores_vivos"] == 0
+                if ultimo:
+                    salidas.put(None)
+
+        # Daemon: si la escritura falla, el proceso puede terminar sin esperar a que se vacíen las colas.
+        hilos = [threading.Thread(target=lector, name=f"lector_{i}", daemon=True) for i in range(self.num_lectores)]
+        hilos += [threading.Thread(target=extractor, name=f"extractor_{i}", daemon=True) for i in range(self.num_extractores)]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            while True:
+                t_espera = time.perf_counter()
+                elemento = salidas.get()
+                if elemento is None:
+                    break
+                t_inicio = time.perf_counter()
+                yield elemento
+                self.escritura.sumar(tamanos.get(elemento[0], 0), time.perf_counter() - t_inicio, t_inicio - t_espera)
+        finally:
+            self.duracion = time.perf_counter() - t0
+
+    def resumen(self) -> dict:
+        return {
+            "reader": self.lectura.resumen(self.duracion),
+            "extraction": self.extraccion.resumen(self.duracion),
+            "writer": self.escritura.resumen(self.duracion),
+            "max_files_queued": self.max_archivos_en_cola_visto,
+            "queue_limit_bytes": self.max_bytes_en_cola,
+        }
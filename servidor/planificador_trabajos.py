@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# planificador_trabajos.py es la cola central de trabajos (solicitudes de procesamiento) de servidor_websockets.py.
+# Todos los trabajos de todos los clientes pasan por aquí, tanto los del pool persistente como los del camino
+# por subprocess, así que la máquina nunca ejecuta más de lo que admite el presupuesto global:
+#   - admisión: cada cliente puede tener como mucho MAX_PENDIENTES_POR_CLIENTE trabajos en cola y la cola entera
+#     MAX_PENDIENTES_TOTAL; lo que pase de ahí se rechaza en el momento en lugar de acumularse.
+#   - presupuesto: los trabajos en ejecución no suman más de `presupuesto_workers` workers ni más de
+#     `max_simultaneos` trabajos. Un trabajo que pide más workers que el presupuesto se recorta al presupuesto.
+#   - reparto justo (weighted fair queuing): cada cliente acumula un "tiempo virtual" = coste servido / peso, y
+#     el siguiente trabajo es el más antiguo del cliente con menor tiempo virtual. Un cliente que manda cien
+#     trabajos no deja esperando al que manda uno; con peso 2 un cliente recibe el doble de capacidad.
+#   - posición y ETA: cada trabajo en espera recibe "posicion_cola" cuando cambia su posición. La ETA usa los
+#     segundos por byte medidos en los trabajos ya terminados (media móvil exponencial).
+#   - cancelación: cancelar_trabajos_de() saca de la cola los trabajos de un cliente y pide parar (trabajo.cancelar())
+#     a los que ya se ejecutan; sus workers vuelven al presupuesto en cuanto el trabajo termina.
+#   - trabajo fuera de la cola: ocupar_workers()/liberar_workers() cuentan contra el presupuesto lo que no puede
+#     esperar turno (la extracción en streaming de un archivo enviado por el WebSocket, ver envio_archivos.py).
+import asyncio, logging, os, time
+
+MAX_TRABAJOS_SIMULTANEOS = 4
+MAX_PENDIENTES_POR_CLIENTE = 5
+MAX_PENDIENTES_TOTAL = 100
+PESO_POR_DEFECTO = 1.0
+SUAVIZADO_ETA = 0.3  # Peso de la última medida en la media móvil de segundos por byte.
+
+
+class AdmisionRechazada(Exception):
+    """La cola no admite el trabajo (límite por cliente o global alcanzado)."""
+
+
+class PlanificadorTrabajos:
+    """
+    Cola central con presupuesto global y reparto justo entre clientes. Un trabajo es cualquier objeto con
+    id_cliente, num_workers, emitir (corutina emitir(tipo, data=None, mensaje_texto=None)), encolado_en y
+    terminado (Future), y opcionalmente estimar_costo() (bytes a procesar) y cancelar() (pedir que pare cuanto
+    antes, entregando lo que ya tenga). Se ejecuta con la corutina `ejecutar(trabajo)` que se pasa al encolarlo.
+    """
+
+    def __init__(self, max_simultaneos=MAX_TRABAJOS_SIMULTANEOS, presupuesto_workers=None,
+                 max_pendientes_por_cliente=MAX_PENDIENTES_POR_CLIENTE, max_pendientes_total=MAX_PENDIENTES_TOTAL):
+        self.max_simultaneos = max(1, max_simultaneos)
+        self.presupuesto_workers = max(1, presupuesto_workers or os.cpu_count() or 1)
+        self.max_pendientes_por_cliente = max_pendientes_por_cliente
+        self.max_pendientes_total = max_pendientes_total
+        self.pesos = {}  # id_cliente -> peso (PESO_POR_DEFECTO si no se fijó)
+        self.tiempo_virtual = {}  # id_cliente -> coste servido / peso
+        self.pendientes = []  # [(trabajo, ejecutar)] en orden de llegada
+        self.en_ejecucion = {}  # trabajo -> (tarea, inicio)
+        self.workers_en_uso = 0
+        self.segundos_por_byte = None
+        # Cada trabajo admitido acaba contado en uno solo de completados, cancelados o fallidos.
+        self.estadisticas = {"admitidos": 0, "rechazados": 0, "completados": 0, "cancelados": 0, "fallidos": 0}
+        self._condicion = None
+        self._despachador = None
+        self._posiciones_enviadas = {}
+        self._cancelados_en_ejecucion = set()  # Ya contados en cancelados: no cuentan como completados al terminar.
+
+    async def iniciar(self):
+        self._condicion = asyncio.Condition()
+        self._despachador = asyncio.create_task(self._bucle_despacho())
+        logging.info(
+            f"Planificador de trabajos listo: {self.max_simultaneos} trabajo(s) simultáneo(s), "
+            f"presupuesto de {self.presupuesto_workers} worker(s)."
+        )
+
+    async def cerrar(self):
+        tareas = [tarea for tarea, _ in self.en_ejecucion.values()]
+        if self._despachador is not None:
+            tareas.append(self._despachador)
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        for trabajo, _ in self.pendientes:
+            if not trabajo.terminado.done():
+                trabajo.terminado.cancel()
+        self.pendientes = []
+        self._despachador = None
+
+    def fijar_peso(self, id_cliente, peso: float):
+        self.pesos[id_cliente] = peso
+
+    def ocupar_workers(self, n: int = 1):
+        """Cuenta n workers ocupados fuera de la cola: los trabajos en cola esperan hasta liberar_workers()."""
+        self.workers_en_uso += n
+
+    def liberar_workers(self, n: int = 1):
+        """Devuelve al presupuesto los workers de ocupar_workers(). Llamar desde el bucle de eventos."""
+        self.workers_en_uso -= n
+        if self._condicion is not None:
+            asyncio.ensure_future(self._despertar_despachador())
+
+    async def _despertar_despachador(self):
+        async with self._condicion:
+            self._condicion.notify_all()
+
+    async def encolar(self, trabajo, ejecutar):
+        """Admite el trabajo en la cola o lanza AdmisionRechazada. Retorna el trabajo."""
+        trabajo.num_workers = min(trabajo.num_workers, self.presupuesto_workers)
+        if getattr(trabajo, "costo_estimado", None) is None:
+            estimar = getattr(trabajo, "estimar_costo", None)
+            trabajo.costo_estimado = await asyncio.get_running_loop().run_in_executor(None, estimar) if estimar else 0
+        async with self._condicion:
+            # La admisión se decide junto con el append: dos solicitudes que estiman a la vez no pasan ambas el límite.
+            pendientes_cliente = sum(1 for t, _ in self.pendientes if t.id_cliente == trabajo.id_cliente)
+            if pendientes_cliente >= self.max_pendientes_por_cliente:
+                self.estadisticas["rechazados"] += 1
+                raise AdmisionRechazada(
+                    f"Ya hay {pendientes_cliente} solicitud(es) suya(s) en cola (máximo {self.max_pendientes_por_cliente})."
+                )
+            if len(self.pendientes) >= self.max_pendientes_total:
+                self.estadisticas["rechazados"] += 1
+                raise AdmisionRechazada(f"La cola del servidor está llena ({self.max_pendientes_total} solicitudes).")
+            if trabajo.id_cliente not in self.tiempo_virtual or not self._tiene_trabajos(trabajo.id_cliente):
+                # Un cliente que vuelve tras estar inactivo no acumula "crédito": empieza al nivel de los activos.
+                activos = [self.tiempo_virtual[c] for c in self._clientes_activos()]
+                self.tiempo_virtual[trabajo.id_cliente] = max(
+                    self.tiempo_virtual.get(trabajo.id_cliente, 0.0), min(activos, default=0.0)
+                )
+            self.pendientes.append((trabajo, ejecutar))
+            self.estadisticas["admitidos"] += 1
+            self._condicion.notify_all()
+        await self._notificar_posiciones()
+        return trabajo
+
+    async def cancelar_trabajos_de(self, id_cliente) -> dict:
+        """
+        Cancela los trabajos del cliente. Los que esperan en cola salen de ella y reciben procesamiento_csv_terminado
+        con status "cancelled"; a los que se ejecutan se les llama cancelar() y terminan por su cuenta (con su propio
+        procesamiento_csv_terminado). Retorna {"en_cola": n, "en_ejecucion": m}.
+        """
+        async with self._condicion:
+            en_cola = [pendiente for pendiente in self.pendientes if pendiente[0].id_cliente == id_cliente]
+            for pendiente in en_cola:
+                self.pendientes.remove(pendiente)
+                self._posiciones_enviadas.pop(pendiente[0], None)
+            en_ejecucion = [trabajo for trabajo in self.en_ejecucion if trabajo.id_cliente == id_cliente]
+            en_ejecucion = [trabajo for trabajo in en_ejecucion if trabajo not in self._cancelados_en_ejecucion]
+            self._cancelados_en_ejecucion.update(en_ejecucion)
+            self.estadisticas["cancelados"] += len(en_cola) + len(en_ejecucion)
+            self._condicion.notify_all()
+        for trabajo in en_ejecucion:
+            cancelar = getattr(trabajo, "cancelar", None)
+            if cancelar is not None:
+                cancelar()
+        for trabajo, _ in en_cola:
+            resumen = {"status": "cancelled", "files_attempted": 0, "cancelled_while": "queued"}
+            try:
+                await trabajo.emitir("procesamiento_csv_terminado", data=resumen)
+            except Exception as e:
+                logging.warning(f"No se pudo notificar la cancelación al cliente {trabajo.id_cliente}: {e}")
+            if not trabajo.terminado.done():
+                trabajo.terminado.set_result(resumen)
+        if en_cola:
+            await self._notificar_posiciones()
+        if en_cola or en_ejecucion:
+            logging.info(f"Cancelados los trabajos del cliente {id_cliente}: {len(en_cola)} en cola, {len(en_ejecucion)} en ejecución.")
+        return {"en_cola": len(en_cola), "en_ejecucion": len(en_ejecucion)}
+
+    def orden_proyectado(self):
+        """Orden en que se despacharían los pendientes si no llegara nada nuevo."""
+        tiempo_virtual = dict(self.tiempo_virtual)
+        restantes = list(self.pendientes)
+        orden = []
+        while restantes:
+            elegido = min(restantes, key=lambda p: (tiempo_virtual.get(p[0].id_cliente, 0.0), p[0].encolado_en))
+            restantes.remove(elegido)
+            orden.append(elegido)
+            tiempo_virtual[elegido[0].id_cliente] = tiempo_virtual.get(elegido[0].id_cliente, 0.0) + self._costo_ponderado(elegido[0])
+        return orden
+
+    def estado(self) -> dict:
+        """Foto del planificador para la CLI y los logs."""
+        return {
+            "en_ejecucion": len(self.en_ejecucion),
+            "en_cola": len(self.pendientes),
+            "workers_en_uso": self.workers_en_uso,
+            "presupuesto_workers": self.presupuesto_workers,
+            "segundos_por_byte": self.segundos_por_byte,
+            **self.estadisticas,
+        }
+
+    def _tiene_trabajos(self, id_cliente):
+        return any(t.id_cliente == id_cliente for t, _ in self.pendientes) or \
+            any(t.id_cliente == id_cliente for t in self.en_ejecucion)
+
+    def _clientes_activos(self):
+        return {t.id_cliente for t, _ in self.pendientes} | {t.id_cliente for t in self.en_ejecucion}
+
+    def _costo_ponderado(self, trabajo):
+        # Todo trabajo cuenta al menos 1 byte, para que los vacíos también roten entre clientes.
+        return max(trabajo.costo_estimado or 0, 1) / self.pesos.get(trabajo.id_cliente, PESO_POR_DEFECTO)
+
+    def _siguiente_despachable(self):
+        """Retorna el siguiente (trabajo, ejecutar) según el reparto justo si cabe en el presupuesto, o None."""
+        if not self.pendientes or len(self.en_ejecucion) >= self.max_simultaneos:
+            return None
+        siguiente = min(self.pendientes, key=lambda p: (self.tiempo_virtual.get(p[0].id_cliente, 0.0), p[0].encolado_en))
+        # Sin saltarse al elegido aunque otro más pequeño cupiera: así un trabajo grande no espera indefinidamente.
+        if self.workers_en_uso + siguiente[0].num_workers > self.presupuesto_workers:
+            return None
+        return siguiente
+
+    def _eta_segundos(self, costo_por_delante):
+        if self.segundos_por_byte is None:
+            return None  # Aún no hay medidas.
+        ahora = time.perf_counter()
+        restante_en_ejecucion = sum(
+            max(0.0, (t.costo_estimado or 0) * self.segundos_por_byte - (ahora - inicio))
+            for t, (_, inicio) in self.en_ejecucion.items()
+        )
+        return round((restante_en_ejecucion + costo_por_delante * self.segundos_por_byte) / self.max_simultaneos, 1)
+
+    async def _notificar_posiciones(self):
+        costo_por_delante = 0
+        for posicion, (trabajo, _) in enumerate(self.orden_proyectado(), start=1):
+            eta_inicio = self._eta_segundos(costo_por_delante)
+            costo_por_delante += trabajo.costo_estimado or 0
+            if self._posiciones_enviadas.get(trabajo) == posicion:
+                continue
+            self._posiciones_enviadas[trabajo] = posicion
+            try:
+                await trabajo.emitir("posicion_cola", {
+                    "posicion": posicion,
+                    "trabajos_en_cola": len(self.pendientes),
+                    "trabajos_en_ejecucion": len(self.en_ejecucion),
+                    "eta_inicio_segundos": eta_inicio,
+                    "eta_fin_segundos": self._eta_segundos(costo_por_delante),
+                })
+            except Exception as e:
+                logging.warning(f"No se pudo notificar la posición en cola al cliente {trabajo.id_cliente}: {e}")
+
+    async def _bucle_despacho(self):
+        while True:
+            async with self._condicion:
+                await self._condicion.wait_for(lambda: self._siguiente_despachable() is not None)
+                trabajo, ejecutar = self._siguiente_despachable()
+                self.pendientes.remove((trabajo, ejecutar))
+                self._posiciones_enviadas.pop(trabajo, None)
+                self.tiempo_virtual[trabajo.id_cliente] = self.tiempo_virtual.get(trabajo.id_cliente, 0.0) + self._costo_ponderado(trabajo)
+                self.workers_en_uso += trabajo.num_workers
+                self.en_ejecucion[trabajo] = (asyncio.create_task(self._ejecutar(trabajo, ejecutar)), time.perf_counter())
+            await self._notificar_posiciones()
+
+    async def _ejecutar(self, trabajo, ejecutar):
+        t0 = time.perf_counter()
+        resultado = "fallidos"
+        try:
+            resumen = await ejecutar(trabajo)
+            if not trabajo.terminado.done():
+                trabajo.terminado.set_result(resumen)
+            self._medir(trabajo, time.perf_counter() - t0)
+            resultado = "completados"
+        except asyncio.CancelledError:
+            resultado = "cancelados"
+            if not trabajo.terminado.done():
+                trabajo.terminado.cancel()
+            raise
+        except Exception as e:
+            logging.exception(f"Error ejecutando trabajo del cliente {trabajo.id_cliente}: {e}")
+            try:
+                await trabajo.emitir("error_servidor", mensaje_texto=f"Error crítico ejecutando la solicitud: {e}")
+                await trabajo.emitir("procesamiento_csv_terminado", data={"status": "fallido_planificador"})
+            except Exception:
+                pass
+            if not trabajo.terminado.done():
+                trabajo.terminado.set_result({"status": "fallido_planificador"})
+        finally:
+            async with self._condicion:
+                self.en_ejecucion.pop(trabajo, None)
+                self.workers_en_uso -= trabajo.num_workers
+                if trabajo in self._cancelados_en_ejecucion:
+                    self._cancelados_en_ejecucion.discard(trabajo)  # Ya contado en cancelados.
+                else:
+                    self.estadisticas[resultado] += 1
+                self._condicion.notify_all()
+
+    def _medir(self, trabajo, duracion):
+        if not trabajo.costo_estimado:
+            return
+        medida = duracion / trabajo.costo_estimado
+        if self.segundos_por_byte is None:
+            self.segundos_por_byte = medida
+        else:
+            self.segundos_por_byte = SUAVIZADO_ETA * medida + (1 - SUAVIZADO_ETA) * self.segundos_por_byte
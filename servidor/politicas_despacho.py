@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# politicas_despacho.py decide en qué orden se reparten los archivos de un lote entre los workers, usando el tamaño
+# del archivo como estimación de su tiempo de proceso (ráfaga), y mide los tiempos reales que resultan.
+# Son las políticas que la GUI simula en cliente/src/algorithms, pero aplicadas al procesamiento real:
+#   - fcfs: orden de llegada (el de glob o el de la solicitud). Es el comportamiento anterior.
+#   - sjf:  el más corto primero; minimiza la espera media.
+#   - lpt:  el más largo primero (Longest Processing Time); con varios workers minimiza el makespan porque
+#           un archivo grande nunca queda para el final.
+#   - hrrn: mayor tasa de respuesta (espera + ráfaga) / ráfaga. Dentro de un lote todos los archivos llegan a
+#           la vez, así que la espera es la misma para todos y el orden resultante coincide con sjf.
+import os, time
+
+POLITICAS_DESPACHO = ("fcfs", "sjf", "lpt", "hrrn")
+POLITICA_POR_DEFECTO = "fcfs"
+
+#tamano_archivo() retorna el tamaño en bytes de un archivo, o 0 si no se puede leer (el worker reportará el error).
+def tamano_archivo(ruta: str) -> int:
+    try:
+        return os.path.getsize(ruta)
+    except OSError:
+        return 0
+
+#tasa_respuesta() es la prioridad de HRRN: (espera + ráfaga) / ráfaga.
+def tasa_respuesta(espera: float, rafaga: float) -> float:
+    return (espera + rafaga) / max(rafaga, 1)
+
+#ordenar_por_politica() retorna las rutas en el orden en que deben despacharse según la política.
+#Los empates conservan el orden de llegada (orden estable), igual que en los algoritmos del cliente.
+def ordenar_por_politica(rutas: list, politica: str, tamanos: dict = None) -> list:
+    if politica not in POLITICAS_DESPACHO:
+        raise ValueError(f"Política de despacho desconocida: {politica}")
+    if tamanos is None:
+        tamanos = {ruta: tamano_archivo(ruta) for ruta in rutas}
+    if politica == "sjf":
+        return sorted(rutas, key=lambda r: tamanos[r])
+    if politica == "lpt":
+        return sorted(rutas, key=lambda r: -tamanos[r])
+    if politica == "hrrn":
+        # Misma llegada para todo el lote: en el instante del despacho todos llevan la misma espera.
+        return sorted(rutas, key=lambda r: -tasa_respuesta(0, tamanos[r]))
+    return list(rutas)
+
+#agrupar_en_tandas() parte la lista ya ordenada en tandas de como mucho max_archivos archivos y max_bytes bytes
+#(una tanda nunca queda vacía), para que juntar archivos pequeños no cree tareas mucho más largas que el resto.
+def agrupar_en_tandas(rutas: list, tamanos: dict, max_archivos: int, max_bytes: int) -> list:
+    tandas, actual, bytes_actual = [], [], 0
+    for ruta in rutas:
+        if actual and (len(actual) >= max_archivos or bytes_actual + tamanos[ruta] > max_bytes):
+            tandas.append(actual)
+            actual, bytes_actual = [], 0
+        actual.append(ruta)
+        bytes_actual += tamanos[ruta]
+    if actual:
+        tandas.append(actual)
+    return tandas
+
+
+class MetricasDespacho:
+    """
+    Tiempos medidos de un lote. Todos los archivos llegan en inicio_lote; los workers informan cuándo
+    empezaron y terminaron cada archivo (time.time(), comparable entre procesos):
+      espera = inicio - inicio_lote, retorno (turnaround) = fin - inicio_lote, makespan = último fin - inicio_lote.
+    """
+
+    def __init__(self, politica: str, inicio_lote: float = None):
+        self.politica = politica
+        self.inicio_lote = time.time() if inicio_lote is None else inicio_lote
+        self.archivos = {}  # ruta -> [inicio, fin, tamaño]
+
+    def registrar(self, ruta: str, inicio: float, fin: float, tamano: int = None):
+        """Registra un tramo de trabajo sobre un archivo (varios tramos si se procesó por segmentos)."""
+        actual = self.archivos.get(ruta)
+        if actual is None:
+            self.archivos[ruta] = [inicio, fin, tamano_archivo(ruta) if tamano is None else tamano]
+        else:
+            actual[0] = min(actual[0], inicio)
+            actual[1] = max(actual[1], fin)
+
+    def resumen(self, detalle_por_archivo: bool = True) -> dict:
+        if not self.archivos:
+            return {"dispatch_policy": self.politica}
+        esperas = [inicio - self.inicio_lote for inicio, _, _ in self.archivos.values()]
+        retornos = [fin - self.inicio_lote for _, fin, _ in self.archivos.values()]
+        resumen = {
+            "dispatch_policy": self.politica,
+            "makespan_seconds": round(max(retornos), 3),
+            "avg_wait_seconds": round(sum(esperas) / len(esperas), 3),
+            "max_wait_seconds": round(max(esperas), 3),
+            "avg_turnaround_seconds": round(sum(retornos) / len(retornos), 3),
+        }
+        if detalle_por_archivo:
+            resumen["file_metrics"] = [
+                {
+                    "file": os.path.basename(ruta),
+                    "size_bytes": tamano,
+                    "wait_seconds": round(inicio - self.inicio_lote, 3),
+                    "turnaround_seconds": round(fin - self.inicio_lote, 3),
+                }
+                for ruta, (inicio, fin, tamano) in self.archivos.items()
+            ]
+        return resumen
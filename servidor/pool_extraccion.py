@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+# pool_extraccion.py mantiene un pool de workers de extracción de larga vida, propiedad de servidor_websockets.py.
+# En lugar de lanzar "python -u servidor.py" por cada solicitud (arranque del intérprete + compilación de
+# PATRONES + creación de un Executor nuevo), los workers se crean y precalientan una sola vez al iniciar el
+# servidor; los trabajos llegan por la cola del planificador (planificador_trabajos.py) y sus filas se emiten con
+# los mismos tipos de mensaje WebSocket que usaba el camino por subprocess.
+import asyncio, logging, os, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import servidor as extractor  # Importarlo compila PATRONES/MOTOR una vez en este proceso.
+from motor_extraccion import PerfilPatrones
+from cache_resultados import CacheResultados
+from manifiesto_incremental import ManifiestoIncremental
+from planificador_trabajos import PlanificadorTrabajos, MAX_TRABAJOS_SIMULTANEOS
+from entrega_filas import LoteadorFilasWebsocket, MAX_FILAS_LOTE, INTERVALO_LOTE_MS
+from politicas_despacho import POLITICA_POR_DEFECTO, MetricasDespacho, ordenar_por_politica, tamano_archivo
+from ajuste_concurrencia import MODO_AUTO, AjustadorWorkers, SemaforoAjustable, elegir_configuracion, estimar_tareas
+from coordinador_nodos import MODO_DISTRIBUIDO, CoordinadorNodos, NodoLocal
+
+#_inicializar_worker() se ejecuta una vez en cada proceso del pool. Con "spawn" (Windows) es aquí donde se
+#compilan las regex; con "fork" el proceso ya hereda el módulo compilado del servidor.
+def _inicializar_worker():
+    import servidor  # noqa: F401
+
+#_ping_worker() es una tarea vacía usada para forzar la creación (precalentamiento) de los workers.
+def _ping_worker():
+    return os.getpid()
+
+#_precalentar_patrones() compila en un worker la versión de los patrones de la clave (versión, huella), para que
+#el primer archivo de un trabajo con una versión recién activada no pague la compilación.
+def _precalentar_patrones(patrones):
+    extractor.conjunto_patrones(patrones)
+    return os.getpid()
+
+#extraer_en_worker() es la unidad de trabajo que corre dentro del pool: un archivo -> (resultado, mensaje_error, perfil),
+#con resultado el ResultadoExtraccion (viaja compacto desde el proceso worker) y perfil el PerfilPatrones del archivo
+#si perfilar (None si no). patrones es la clave (versión, huella) de los patrones del trabajo (None: los activos).
+#cancelado es el threading.Event del trabajo (solo en el pool de threads: no viaja a otro proceso).
+def extraer_en_worker(ruta, simulate_delay_ms=0, perfilar=False, patrones=None, cancelado=None):
+    perfil = PerfilPatrones(os.path.basename(ruta)) if perfilar else None
+    resultado, mensaje_error = extractor.extraer_resultado_de_archivo(
+        ruta, simulate_delay_ms, perfil=perfil, motor=extractor.conjunto_patrones(patrones).motor, cancelado=cancelado
+    )
+    return resultado, mensaje_error, perfil
+
+
+class TrabajoCancelado(Exception):
+    """El trabajo se canceló antes de que el archivo llegara a un worker, o mientras un thread lo extraía."""
+
+
+class TrabajoExtraccion:
+    """Una solicitud de procesamiento de un cliente, tal como se encola en el pool."""
+
+    def __init__(self, id_cliente, rutas_archivos, directorio_default, num_workers, concurrency_mode, emitir, entrega=None,
+                 politica_despacho=POLITICA_POR_DEFECTO, perfilar_patrones=False, incremental=False, patrones=None):
+        self.id_cliente = id_cliente
+        self.rutas_archivos = list(rutas_archivos or [])
+        self.directorio_default = directorio_default
+        # En modo auto num_workers es el máximo (por defecto, los núcleos); el pool elige cuántos usar. En modo
+        # distributed el cupo es la capacidad de los nodos y num_workers solo se informa.
+        num_workers_por_defecto = (os.cpu_count() or 1) if concurrency_mode in (MODO_AUTO, MODO_DISTRIBUIDO) else 1
+        self.num_workers = num_workers if isinstance(num_workers, int) and num_workers > 0 else num_workers_por_defecto
+        self.concurrency_mode = concurrency_mode
+        self.emitir = emitir  # corutina emitir(tipo_mensaje, data=None, mensaje_texto=None)
+        self.entrega = entrega or {"modo": "filas"}  # ver entrega_filas.py para el modo "lotes"
+        self.politica_despacho = politica_despacho  # ver politicas_despacho.py
+        self.perfilar_patrones = perfilar_patrones  # Medir el coste de cada columna (ver motor_extraccion.PerfilPatrones).
+        self.incremental = incremental  # Servir desde el manifiesto los archivos sin cambios (ver manifiesto_incremental.py).
+        # Clave (versión, huella) de los patrones del trabajo, fijada al crearlo (None: la versión activa en ese momento):
+        # activar otra versión en caliente no cambia los patrones de los trabajos ya encolados o en curso.
+        self.patrones = tuple(patrones) if patrones is not None else extractor.conjunto_patrones().clave
+        self.encolado_en = time.perf_counter()
+        self.terminado = asyncio.get_running_loop().create_future()
+        self.costo_estimado = None  # Bytes a procesar; lo calcula el planificador con estimar_costo().
+        self.cancelado = asyncio.Event()  # Lo activa cancelar(); ver PlanificadorTrabajos.cancelar_trabajos_de().
+        self.cancelado_hilos = threading.Event()  # El mismo aviso para los threads que están extrayendo un archivo.
+
+    def cancelar(self):
+        """
+        Pide que el trabajo pare: no se lanzan más archivos, los que extrae el pool de threads se interrumpen y se
+        entrega lo que ya esté en los workers de proceso o en nodos.
+        """
+        self.cancelado.set()
+        self.cancelado_hilos.set()
+
+    def estimar_costo(self):
+        """Suma de los tamaños de los archivos que procesará el trabajo (bloqueante: llamar en un executor)."""
+        archivos, _, _ = extractor.resolver_archivos_entrada(self.rutas_archivos, self.directorio_default)
+        return sum(tamano_archivo(ruta) for ruta in archivos)
+
+
+class PoolExtraccion:
+    """
+    Pool persistente de workers de extracción. Mantiene un ThreadPoolExecutor (modo 'thread', dentro del
+    proceso del servidor) y un ProcessPoolExecutor (modo 'process'), ambos creados y precalentados en iniciar().
+    En modo 'distributed' los archivos se reparten entre el ProcessPoolExecutor y los nodos remotos registrados en
+    el coordinador (ver coordinador_nodos.py).
+    """
+
+    def __init__(self, workers_proceso=None, workers_thread=None, trabajos_simultaneos=MAX_TRABAJOS_SIMULTANEOS, cache=None,
+                 planificador=None, manifiesto=None, almacen=None, indice_nombres=None, coordinador=None, analitica=None):
+        self.workers_proceso = workers_proceso or os.cpu_count() or 1
+        self.workers_thread = workers_thread or os.cpu_count() or 1
+        # Cola de trabajos: la del servidor (compartida con el camino por subprocess) o una propia.
+        self._planificador_propio = planificador is None
+        self.planificador = planificador or PlanificadorTrabajos(
+            trabajos_simultaneos, presupuesto_workers=max(self.workers_proceso, self.workers_thread)
+        )
+        # Caché de filas por contenido (ver cache_resultados.py); None crea la de por defecto y False la desactiva.
+        self.cache = (CacheResultados(extractor.HUELLA_PATRONES) if cache is None else cache) or None
+        # Manifiesto de los trabajos incrementales (ver manifiesto_incremental.py); None crea el de por defecto y False
+        # lo desactiva (los trabajos con incremental=True se extraen entonces enteros).
+        self.manifiesto = (
+            ManifiestoIncremental(extractor.HUELLA_PATRONES, extractor.COLUMNAS_ORDENADAS) if manifiesto is None else manifiesto
+        ) or None
+        # Base de resultados (ver almacen_resultados.py) donde se guarda cada fila extraída; None si no se guardan.
+        self.almacen = almacen
+        # Índice de nombres (ver indice_nombres.py) al que se añade cada fila extraída; None si no se indexan.
+        self.indice_nombres = indice_nombres
+        # Agregados del corpus (ver analitica_corpus.py) a los que se suma cada fila extraída; None si no se agregan.
+        self.analitica = analitica
+        # Coordinador de nodos de extracción (ver coordinador_nodos.py); None crea el de por defecto y False lo
+        # desactiva (el modo distributed se ejecuta entonces como process).
+        self.coordinador = (CoordinadorNodos() if coordinador is None else coordinador) or None
+        self.executors = {}
+
+    async def iniciar(self):
+        loop = asyncio.get_running_loop()
+        self.executors["thread"] = ThreadPoolExecutor(
+            max_workers=self.workers_thread, thread_name_prefix="extraccion"
+        )
+        self.executors["process"] = ProcessPoolExecutor(
+            max_workers=self.workers_proceso, initializer=_inicializar_worker
+        )
+        # Precalentar: forzar el arranque de todos los procesos (e importación de servidor.py) ahora,
+        # y no en la primera solicitud de un cliente.
+        t0 = time.perf_counter()
+        pids = await asyncio.gather(
+            *(loop.run_in_executor(self.executors["process"], _ping_worker) for _ in range(self.workers_proceso))
+        )
+        logging.info(
+            f"Pool de extracción listo: {len(set(pids))} proceso(s), {self.workers_thread} thread(s). "
+            f"Precalentado en {time.perf_counter() - t0:.2f}s."
+        )
+        if self.coordinador is not None:
+            self.coordinador.registrar(NodoLocal(self.workers_proceso, self._extraer_en_nodo_local))
+        if self._planificador_propio:
+            await self.planificador.iniciar()
+
+    async def precalentar_patrones(self, patrones):
+        """
+        Compila una versión de los patrones en los procesos del pool (una tarea por worker; el reparto lo decide el
+        executor, así que un worker puede quedar sin ella y compilarla con su primer archivo). Retorna los workers
+        que la compilaron.
+        """
+        executor = self.executors.get("process")
+        if executor is None:
+            return 0
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(
+            *(loop.run_in_executor(executor, _precalentar_patrones, patrones) for _ in range(self.workers_proceso))
+        )
+        return len(set(pids))
+
+    async def encolar(self, trabajo: TrabajoExtraccion):
+        """
+        Añade un trabajo a la cola del planificador. Retorna el trabajo (trabajo.terminado se resuelve al acabar)
+        o lanza planificador_trabajos.AdmisionRechazada si la cola no lo admite.
+        """
+        return await self.planificador.encolar(trabajo, self.ejecutar_trabajo)
+
+    async def cerrar(self):
+        if self._planificador_propio:
+            await self.planificador.cerrar()
+        if self.coordinador is not None:
+            self.coordinador.quitar("local")
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+        self.executors = {}
+        logging.info("Pool de extracción cerrado.")
+
+    async def _extraer_en_nodo_local(self, ruta, patrones=None):
+        """Extracción de un archivo en el nodo local del coordinador: el ProcessPoolExecutor del pool."""
+        resultado, mensaje_error, _ = await asyncio.get_running_loop().run_in_executor(
+            self.executors["process"], extraer_en_worker, ruta, 0, False, patrones
+        )
+        return resultado, mensaje_error
+
+    async def ejecutar_trabajo(self, trabajo: TrabajoExtraccion):
+        """Ejecuta un trabajo ya despachado por el planificador y retorna su resumen."""
+        if trabajo.entrega.get("modo") != "lotes":
+            return await self._ejecutar_trabajo_con(trabajo, trabajo.emitir)
+        loteador = LoteadorFilasWebsocket(
+            trabajo.emitir,
+            extractor.COLUMNAS_ORDENADAS,
+            trabajo.entrega.get("max_filas", MAX_FILAS_LOTE),
+            trabajo.entrega.get("intervalo_ms", INTERVALO_LOTE_MS),
+        )
+        try:
+            return await self._ejecutar_trabajo_con(trabajo, loteador)
+        finally:
+            await loteador.vaciar()
+
+    async def _ejecutar_trabajo_con(self, trabajo: TrabajoExtraccion, emitir):
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+
+        archivos, avisos, directorio_invalido = await loop.run_in_executor(
+            None, extractor.resolver_archivos_entrada, trabajo.rutas_archivos, trabajo.directorio_default
+        )
+        for aviso in avisos:
+            await emitir("progreso_procesamiento_info", mensaje_texto=aviso)
+        if directorio_invalido:
+            resumen = {"status": "error_invalid_directory"}
+            await emitir("procesamiento_csv_terminado", data=resumen)
+            return resumen
+        if not archivos:
+            await emitir("progreso_procesamiento_info", mensaje_texto="No se especificaron archivos .txt válidos para procesar.")
+            resumen = {"status": "no_files_found"}
+            await emitir("procesamiento_csv_terminado", data=resumen)
+            return resumen
+
+        # Orden de despacho según el tamaño (ráfaga estimada); las tareas se crean en ese orden y el semáforo
+        # las deja pasar en el mismo orden.
+        tamanos = await loop.run_in_executor(None, lambda: {ruta: tamano_archivo(ruta) for ruta in archivos})
+        archivos = ordenar_por_politica(archivos, trabajo.politica_despacho, tamanos)
+        metricas = MetricasDespacho(trabajo.politica_despacho)
+
+        # Modo auto: modo y workers según el lote (ver ajuste_concurrencia.py); "sequential_visual" es un solo thread.
+        # Con nodos remotos conectados, lo que auto reparte entre procesos se reparte entre los nodos.
+        modo, workers_pedidos, eleccion_auto = trabajo.concurrency_mode, trabajo.num_workers, None
+        if modo == MODO_AUTO:
+            eleccion_auto = elegir_configuracion(
+                estimar_tareas(list(tamanos.values()), max(extractor.UMBRAL_SEGMENTACION_BYTES, 2 * extractor.TAMANO_SEGMENTO_BYTES),
+                               extractor.TAMANO_SEGMENTO_BYTES),
+                sum(tamanos.values()), nucleos=self.workers_proceso, max_workers=trabajo.num_workers,
+            )
+            modo, workers_pedidos = eleccion_auto["modo"], eleccion_auto["workers"]
+            if modo == "process" and self.coordinador is not None and self.coordinador.hay_nodos_remotos():
+                modo = MODO_DISTRIBUIDO
+            await emitir("progreso_procesamiento_info", mensaje_texto=f"Modo auto: {modo} con {workers_pedidos} worker(s) ({eleccion_auto['motivo']}).")
+        # Al perfilar se extrae en el pool local: los nodos remotos no devuelven perfil.
+        if modo == MODO_DISTRIBUIDO and (self.coordinador is None or trabajo.perfilar_patrones):
+            modo = "process"
+        if modo == MODO_DISTRIBUIDO:
+            executor, limite = None, self.coordinador.limite
+            workers_trabajo = max(1, min(len(archivos), limite))
+        else:
+            modo = modo if modo in self.executors else "thread"
+            executor = self.executors[modo]
+            limite = self.workers_proceso if modo == "process" else self.workers_thread
+            workers_trabajo = max(1, min(workers_pedidos, len(archivos), limite))
+        await emitir(
+            "progreso_procesamiento_info",
+            mensaje_texto=(
+                f"Iniciando procesamiento en pool persistente ({modo}) de {len(archivos)} archivo(s) "
+                f"con {workers_trabajo} worker(s). Espera en cola: {t0 - trabajo.encolado_en:.2f}s."
+            ),
+        )
+
+        # Limita cuántas tareas (archivos o segmentos) de este trabajo están a la vez en el pool compartido.
+        # No se acota por número de archivos: un solo archivo enorme puede ocupar varios workers con sus segmentos.
+        # En modo auto el cupo lo sigue ajustando un AjustadorWorkers con las filas/s medidas; en modo distributed es
+        # la capacidad de los nodos vivos en cada momento (crece o mengua al conectarse o caerse un nodo).
+        ajustador, archivos_por_nodo = None, {}
+        if modo == MODO_DISTRIBUIDO:
+            semaforo = SemaforoAjustable(self.coordinador)
+        elif eleccion_auto is not None and min(workers_pedidos, limite) > 1:
+            ajustador = AjustadorWorkers(min(workers_pedidos, limite))
+            semaforo = SemaforoAjustable(ajustador)
+        else:
+            semaforo = asyncio.Semaphore(max(1, min(workers_pedidos, limite)))
+        # Al perfilar se extrae todo de verdad: un acierto de caché no diría nada del coste de los patrones.
+        # Caché y manifiesto se consultan con la huella de la versión del trabajo: el manifiesto es de la versión activa
+        # y un trabajo de otra versión extrae sus archivos sin consultarlo ni registrarlos en él.
+        huella_patrones = trabajo.patrones[1]
+        cache = self.cache if not trabajo.perfilar_patrones else None
+        manifiesto = self.manifiesto if trabajo.incremental and not trabajo.perfilar_patrones else None
+        perfil_trabajo = PerfilPatrones() if trabajo.perfilar_patrones else None
+        # Archivos con el mismo contenido dentro del lote se extraen una sola vez: clave -> Future del resultado.
+        en_curso = {}
+        contadores = {"hit": 0, "miss": 0, "dedup": 0, "manifiesto": 0}
+
+        # Al cancelar, las tareas que aún esperan al semáforo salen sin llegar a un worker (TrabajoCancelado). En el
+        # pool de threads el archivo en curso se interrumpe entre bloques o columnas y se descarta su resultado
+        # parcial; en un worker de proceso (o un nodo) el archivo termina y entrega su fila: el trabajo acaba tras,
+        # como mucho, un archivo (o segmento de TAMANO_SEGMENTO_BYTES) por worker.
+        cancelado_hilos = trabajo.cancelado_hilos if modo == "thread" else None
+
+        def comprobar_cancelacion():
+            if trabajo.cancelado.is_set():
+                raise TrabajoCancelado()
+
+        async def extraer_segmento_desde_pool(ruta, inicio, fin):
+            async with semaforo:
+                comprobar_cancelacion()
+                t_inicio = time.time()
+                try:
+                    resultado, _, _, perfil = await loop.run_in_executor(
+                        executor, extractor.extraer_segmento_cronometrado, ruta, inicio, fin, trabajo.perfilar_patrones, trabajo.patrones
+                    )
+                finally:
+                    metricas.registrar(ruta, t_inicio, time.time(), tamanos[ruta])
+                if perfil is not None:
+                    perfil_trabajo.fusionar(perfil)
+                return resultado
+
+        async def extraer_desde_pool(ruta):
+            if modo == MODO_DISTRIBUIDO:
+                # Archivos enteros: el coordinador elige el nodo (los segmentos no se reparten entre nodos).
+                async with semaforo:
+                    comprobar_cancelacion()
+                    inicio = time.time()
+                    try:
+                        resultado, mensaje_error = await self.coordinador.extraer(ruta, tamanos[ruta], archivos_por_nodo, trabajo.patrones)
+                    finally:
+                        metricas.registrar(ruta, inicio, time.time(), tamanos[ruta])
+                return resultado.a_fila(extractor.COLUMNAS_ORDENADAS), mensaje_error
+            segmentos = []
+            if modo == "process" and min(workers_pedidos, limite) > 1:
+                try:
+                    segmentos = await loop.run_in_executor(None, extractor.planificar_segmentos, ruta)
+                except OSError:
+                    segmentos = []  # El worker reportará el error de lectura con su mensaje habitual.
+            if len(segmentos) <= 1:
+                async with semaforo:
+                    comprobar_cancelacion()
+                    inicio = time.time()
+                    try:
+                        resultado, mensaje_error, perfil = await loop.run_in_executor(
+                            executor, extraer_en_worker, ruta, 0, trabajo.perfilar_patrones, trabajo.patrones, cancelado_hilos
+                        )
+                    finally:
+                        metricas.registrar(ruta, inicio, time.time(), tamanos[ruta])
+                    if mensaje_error == extractor.MENSAJE_EXTRACCION_CANCELADA:
+                        raise TrabajoCancelado()  # Resultado parcial: ni se emite ni se cachea.
+                    if perfil is not None:
+                        perfil_trabajo.fusionar(perfil)
+            else:
+                # Archivo grande: sus segmentos se extraen en paralelo y se fusionan en una sola fila.
+                resultados = await asyncio.gather(*(extraer_segmento_desde_pool(ruta, inicio, fin) for inicio, fin in segmentos))
+                resultado, mensaje_error = await loop.run_in_executor(None, extractor.fusionar_segmentos, ruta, resultados)
+            # Borde de salida del pool: caché, manifiesto, almacén, índice y cliente reciben la fila serializada.
+            return resultado.a_fila(extractor.COLUMNAS_ORDENADAS), mensaje_error
+
+        async def extraer(ruta):
+            nombre = os.path.basename(ruta)
+            try:
+                comprobar_cancelacion()
+                if manifiesto is not None:
+                    guardado = await loop.run_in_executor(None, manifiesto.consultar, ruta, huella_patrones)
+                    if guardado is not None:
+                        contadores["manifiesto"] += 1
+                        return ruta, guardado, None
+                clave = None
+                if cache is not None:
+                    try:
+                        clave = await loop.run_in_executor(None, cache.clave_para_archivo, ruta, huella_patrones)
+                    except OSError:
+                        clave = None  # El worker reportará el error de lectura con su mensaje habitual.
+                if clave is not None:
+                    entrada = await loop.run_in_executor(None, cache.obtener, clave)
+                    if entrada is not None:
+                        contadores["hit"] += 1
+                        fila, mensaje_error = cache.fila_desde_entrada(entrada, nombre), entrada["error"]
+                        if manifiesto is not None:
+                            await loop.run_in_executor(None, manifiesto.registrar, ruta, fila, mensaje_error, huella_patrones)
+                        return ruta, (fila, mensaje_error), None
+                    if clave in en_curso:
+                        fila, mensaje_error = await asyncio.shield(en_curso[clave])
+                        contadores["dedup"] += 1
+                        fila = dict(fila)
+                        fila["Processed File Name"] = nombre
+                        if manifiesto is not None and not extractor.es_error_reportable(mensaje_error):
+                            await loop.run_in_executor(None, manifiesto.registrar, ruta, fila, mensaje_error, huella_patrones)
+                        return ruta, (fila, mensaje_error), None
+                    en_curso[clave] = loop.create_future()
+                contadores["miss"] += 1
+                try:
+                    fila, mensaje_error = await extraer_desde_pool(ruta)
+                except Exception as exc:
+                    if clave is not None:
+                        pendiente = en_curso.pop(clave)
+                        pendiente.set_exception(exc)
+                        pendiente.exception()  # Marcada como consultada aunque no haya duplicados esperando.
+                    raise
+                if clave is not None:
+                    en_curso[clave].set_result((fila, mensaje_error))
+                    # Solo se cachea lo que depende únicamente del contenido (no errores de E/S).
+                    if not extractor.es_error_reportable(mensaje_error):
+                        await loop.run_in_executor(None, cache.guardar, clave, fila, mensaje_error)
+                if manifiesto is not None and not extractor.es_error_reportable(mensaje_error):
+                    await loop.run_in_executor(None, manifiesto.registrar, ruta, fila, mensaje_error, huella_patrones)
+                return ruta, (fila, mensaje_error), None
+            except TrabajoCancelado:
+                return ruta, None, None
+            except Exception as exc:
+                return ruta, None, exc
+
+        ok, fallidos, cancelados = 0, 0, 0
+        # ensure_future en orden: as_completed() por sí solo crearía las tareas en un orden arbitrario.
+        for siguiente in asyncio.as_completed([asyncio.ensure_future(extraer(ruta)) for ruta in archivos]):
+            ruta, resultado, exc = await siguiente
+            nombre = os.path.basename(ruta)
+            if resultado is None and exc is None:
+                cancelados += 1  # Cancelado antes de extraerse: no se emite fila.
+                continue
+            if ajustador is not None:
+                ajustador.registrar()
+            if exc is not None:
+                fallidos += 1
+                logging.error(f"Excepción del pool para '{ruta}': {exc}\n{''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))}")
+                await emitir("progreso_procesamiento_info", mensaje_texto=f"Error grave en worker para {nombre}: {exc}")
+                fila = {col: 'ERROR' for col in extractor.COLUMNAS_ORDENADAS}
+                fila["Processed File Name"] = nombre
+            else:
+                ok += 1
+                fila, mensaje_error = resultado
+                if extractor.es_error_reportable(mensaje_error):
+                    await emitir("progreso_procesamiento_info", mensaje_texto=f"Error procesando {nombre}: {mensaje_error}")
+                else:
+                    clave_archivo = os.path.abspath(ruta)  # Dos archivos con el mismo nombre son filas distintas.
+                    if self.almacen is not None:
+                        self.almacen.agregar(fila, clave_archivo)
+                    if self.indice_nombres is not None:
+                        self.indice_nombres.agregar_fila(fila, clave_archivo)
+                    if self.analitica is not None:
+                        self.analitica.agregar_fila(fila, clave_archivo)
+            await emitir("csv_actualizacion_fila", {"fila_csv": fila})
+
+        status = "completed"
+        if cancelados > 0:
+            status = "cancelled"
+        elif fallidos > 0:
+            status = "failed_catastrophically" if ok == 0 else "completed_with_worker_exceptions"
+        resumen = {
+            "files_attempted": len(archivos),
+            "tasks_completed_ok": ok,
+            "tasks_failed_exception": fallidos,
+            "status": status,
+            "duration_seconds": round(time.perf_counter() - t0, 2),
+            "queue_wait_seconds": round(t0 - trabajo.encolado_en, 2),
+            "concurrency_mode_used": modo,
+            "workers_used": workers_trabajo,
+            "execution_backend": "persistent_pool",
+            "cache_hits": contadores["hit"],
+            "cache_misses": contadores["miss"],
+            "cache_deduplicated": contadores["dedup"],
+            "pattern_version": trabajo.patrones[0],
+            "pattern_fingerprint": huella_patrones,
+        }
+        if cancelados > 0:
+            resumen["files_cancelled"] = cancelados
+        if manifiesto is not None:
+            await loop.run_in_executor(None, manifiesto.guardar)
+            resumen["incremental"] = {"files_from_manifest": contadores["manifiesto"], "files_extracted": len(archivos) - contadores["manifiesto"]}
+        # Las métricas solo cubren los archivos extraídos en el pool (los aciertos de caché no esperan worker).
+        resumen.update(metricas.resumen())
+        if eleccion_auto is not None:
+            resumen["concurrency_mode_requested"] = MODO_AUTO
+            resumen["auto_tuning"] = {"mode": eleccion_auto["modo"], "workers": eleccion_auto["workers"], "reason": eleccion_auto["motivo"]}
+            if ajustador is not None:
+                resumen["auto_tuning"].update(ajustador.resumen())
+        if modo == MODO_DISTRIBUIDO:
+            resumen["distributed"] = {"files_per_node": archivos_por_nodo, "capacity": self.coordinador.limite}
+        if perfil_trabajo is not None:
+            resumen["pattern_profile"] = perfil_trabajo.resumen()
+        await emitir("procesamiento_csv_terminado", data=resumen)
+        logging.info(f"Trabajo del pool completado para cliente {trabajo.id_cliente}: {resumen}")
+        return resumen
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# protocolo_ws.py codifica y decodifica los mensajes WebSocket según el protocolo negociado con cada cliente.
+# Por defecto (y siempre para el cliente React) cada mensaje es un frame de texto con el JSON del payload.
+# Tras conexion_establecida (que anuncia lo disponible) un cliente puede enviar
+#   {"tipo": "negociar_protocolo", "codificacion": "msgpack", "compresion": "zlib"}
+# para recibir frames binarios: un byte de cabecera (bit 0: cuerpo comprimido con zlib, bit 1: MessagePack en lugar
+# de JSON UTF-8) seguido del cuerpo. Con compresión solo se comprimen los mensajes de más de UMBRAL_COMPRESION_BYTES
+# (los pequeños no ganan nada); la cabecera dice en cada frame cómo leerlo, así que el cliente decodifica cada frame
+# por su tipo (texto = JSON, binario = cabecera) sin importar cuándo cambió el protocolo. El servidor acepta del
+# cliente los mismos dos tipos de frame.
+# Aparte de esto, el transporte negocia permessage-deflate (RFC 7692) en el handshake HTTP con los clientes que lo
+# ofrecen (los navegadores lo hacen); la compresión zlib de aquí es para clientes sin esa extensión.
+import json, zlib
+
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional: sin ella solo se ofrece la codificación JSON.
+    msgpack = None
+
+CODIFICACIONES = ["json"] + (["msgpack"] if msgpack is not None else [])
+COMPRESIONES = ["ninguna", "zlib"]
+PROTOCOLO_POR_DEFECTO = {"codificacion": "json", "compresion": "ninguna"}
+UMBRAL_COMPRESION_BYTES = 512
+MAX_BYTES_DESCOMPRIMIDOS = 16 * 1024 * 1024  # Tope de un mensaje del cliente ya descomprimido.
+BIT_ZLIB = 0x01
+BIT_MSGPACK = 0x02
+
+
+class MensajeInvalido(ValueError):
+    """El frame recibido no se puede decodificar con el protocolo de este módulo."""
+
+
+#protocolos_ofrecidos() describe las codificaciones y compresiones que acepta negociar_protocolo (para conexion_establecida).
+def protocolos_ofrecidos() -> dict:
+    return {"codificaciones": list(CODIFICACIONES), "compresiones": list(COMPRESIONES)}
+
+#validar_protocolo() retorna el protocolo {"codificacion", "compresion"} pedido o lanza ValueError si no está disponible.
+def validar_protocolo(codificacion, compresion) -> dict:
+    if codificacion not in CODIFICACIONES:
+        raise ValueError(f"codificacion debe ser una de {', '.join(CODIFICACIONES)}.")
+    if compresion not in COMPRESIONES:
+        raise ValueError(f"compresion debe ser una de {', '.join(COMPRESIONES)}.")
+    return {"codificacion": codificacion, "compresion": compresion}
+
+#codificar_mensaje() convierte un payload en lo que se pasa a websocket.send(): str (frame de texto) o bytes (binario).
+def codificar_mensaje(payload: dict, protocolo: dict = None):
+    protocolo = protocolo or PROTOCOLO_POR_DEFECTO
+    if protocolo == PROTOCOLO_POR_DEFECTO:
+        return json.dumps(payload)
+    if protocolo["codificacion"] == "msgpack":
+        cabecera, cuerpo = BIT_MSGPACK, msgpack.packb(payload, use_bin_type=True)
+    else:
+        cabecera, cuerpo = 0, json.dumps(payload).encode("utf-8")
+    if protocolo["compresion"] == "zlib" and len(cuerpo) > UMBRAL_COMPRESION_BYTES:
+        comprimido = zlib.compress(cuerpo)
+        if len(comprimido) < len(cuerpo):
+            cabecera, cuerpo = cabecera | BIT_ZLIB, comprimido
+    return bytes((cabecera,)) + cuerpo
+
+#decodificar_mensaje() es la operación inversa de codificar_mensaje(); lanza MensajeInvalido si el frame no es válido.
+def decodificar_mensaje(mensaje):
+    if isinstance(mensaje, str):
+        try:
+            return json.loads(mensaje)
+        except json.JSONDecodeError:
+            raise MensajeInvalido("JSON inválido") from None
+    if not mensaje or mensaje[0] & ~(BIT_ZLIB | BIT_MSGPACK):
+        raise MensajeInvalido("frame binario sin cabecera válida")
+    cabecera, cuerpo = mensaje[0], bytes(mensaje[1:])
+    if cabecera & BIT_ZLIB:
+        descompresor = zlib.decompressobj()
+        try:
+            cuerpo = descompresor.decompress(cuerpo, MAX_BYTES_DESCOMPRIMIDOS)
+        except zlib.error:
+            raise MensajeInvalido("cuerpo zlib inválido") from None
+        if descompresor.unconsumed_tail:
+            raise MensajeInvalido(f"el mensaje descomprimido supera {MAX_BYTES_DESCOMPRIMIDOS} bytes")
+    if cabecera & BIT_MSGPACK:
+        if msgpack is None:
+            raise MensajeInvalido("MessagePack no está disponible en este servidor")
+        try:
+            return msgpack.unpackb(cuerpo, raw=False)
+        except Exception:
+            raise MensajeInvalido("MessagePack inválido") from None
+    try:
+        return json.loads(cuerpo.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise MensajeInvalido("JSON inválido") from None
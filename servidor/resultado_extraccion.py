@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# resultado_extraccion.py define el resultado tipado de extraer un archivo.
+# En lugar de un dict de 33 cadenas ('Not Mention' o 'a; b; c') que la lógica "quitar" vuelve a partir y unir,
+# el resultado guarda una máscara de bits con las columnas encontradas y, solo para esas columnas, la tupla
+# ordenada de sus valores. Se convierte a fila (dict) o a fila compacta (ver entrega_filas.py) únicamente en el
+# borde de salida: al emitir, cachear o guardar.
+# Los valores se internan y las tuplas idénticas (('Sweden',), ('farmer',)...) se comparten entre resultados, así
+# que cada resultado retenido (lotes, índices, agregados) solo paga su máscara y una tupla de referencias.
+import sys
+
+from entrega_filas import VALOR_POR_DEFECTO
+
+# Tope de tuplas distintas compartidas; pasado el tope las nuevas se guardan sin compartir.
+MAX_TUPLAS_COMPARTIDAS = 100_000
+_TUPLAS_COMPARTIDAS = {}
+
+#compartir_tupla() retorna la instancia compartida de una tupla de valores (con sus cadenas internadas).
+def compartir_tupla(valores: tuple) -> tuple:
+    compartida = _TUPLAS_COMPARTIDAS.get(valores)
+    if compartida is not None:
+        return compartida
+    valores = tuple(map(sys.intern, valores))
+    if len(_TUPLAS_COMPARTIDAS) < MAX_TUPLAS_COMPARTIDAS:
+        return _TUPLAS_COMPARTIDAS.setdefault(valores, valores)
+    return valores
+
+
+class ResultadoExtraccion:
+    """
+    Resultado de un archivo: archivo (nombre base), encontradas (bit i activo si la columna i de MOTOR.columnas
+    tiene valores) y valores (las tuplas ordenadas de las columnas encontradas, en orden de columna).
+    Es inmutable por convención y se serializa compacto al pasar entre procesos (ver __reduce__).
+    """
+
+    __slots__ = ("archivo", "encontradas", "valores")
+
+    def __init__(self, archivo: str, encontradas: int = 0, valores: tuple = ()):
+        self.archivo = archivo
+        self.encontradas = encontradas
+        self.valores = valores
+
+    @classmethod
+    def desde_columnas(cls, archivo: str, valores_por_columna):
+        """Construye el resultado a partir de una tupla (vacía si no hubo datos) por columna."""
+        encontradas, valores = 0, []
+        for i, valores_columna in enumerate(valores_por_columna):
+            if valores_columna:
+                encontradas |= 1 << i
+                valores.append(compartir_tupla(valores_columna))
+        return cls(archivo, encontradas, tuple(valores))
+
+    def __reduce__(self):
+        # Sin __dict__ ni nombres de slot por objeto: solo los tres campos.
+        return ResultadoExtraccion, (self.archivo, self.encontradas, self.valores)
+
+    def tiene(self, indice: int) -> bool:
+        return bool(self.encontradas >> indice & 1)
+
+    def valores_de(self, indice: int) -> tuple:
+        """Tupla ordenada de valores de la columna (vacía si no se encontró)."""
+        if not self.encontradas >> indice & 1:
+            return ()
+        return self.valores[bin(self.encontradas & ((1 << indice) - 1)).count("1")]
+
+    def columnas_encontradas(self):
+        """Recorre (índice de columna, tupla de valores) de las columnas encontradas."""
+        encontradas, i, j = self.encontradas, 0, 0
+        while encontradas:
+            if encontradas & 1:
+                yield i, self.valores[j]
+                j += 1
+            encontradas >>= 1
+            i += 1
+
+    def a_fila(self, columnas: list) -> dict:
+        """Fila completa; columnas son las de los valores seguidas de la del nombre de archivo (COLUMNAS_ORDENADAS)."""
+        fila = dict.fromkeys(columnas[:-1], VALOR_POR_DEFECTO)
+        for i, valores_columna in self.columnas_encontradas():
+            fila[columnas[i]] = '; '.join(valores_columna)
+        fila[columnas[-1]] = self.archivo
+        return fila
+
+    def a_compacta(self, columnas: list) -> dict:
+        """Lo mismo que entrega_filas.compactar_fila(self.a_fila(columnas), columnas), sin construir la fila completa."""
+        fila_compacta = {}
+        for i, valores_columna in self.columnas_encontradas():
+            texto = '; '.join(valores_columna)
+            if texto != VALOR_POR_DEFECTO:
+                fila_compacta[str(i)] = texto
+        if self.archivo != VALOR_POR_DEFECTO:
+            fila_compacta[str(len(columnas) - 1)] = self.archivo
+        return fila_compacta
@@ -1,210 +1,473 @@
-import os, re, argparse, time, json, glob, sys, traceback, threading
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import os, argparse, time, json, glob, sys, traceback, threading, functools
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from motor_extraccion import PerfilPatrones, MARGEN_STREAMING
+from conjuntos_patrones import RegistroPatrones, ErrorConjuntoPatrones
+from politicas_despacho import POLITICAS_DESPACHO, POLITICA_POR_DEFECTO, MetricasDespacho, ordenar_por_politica, agrupar_en_tandas, tamano_archivo
+from entrega_filas import LoteadorFilasStdout, VALOR_POR_DEFECTO, MAX_FILAS_LOTE, INTERVALO_LOTE_MS
+from resultado_extraccion import ResultadoExtraccion
+from manifiesto_incremental import ManifiestoIncremental
+from almacen_resultados import AlmacenResultados
+from pipeline_extraccion import PipelineExtraccion, LECTORES_POR_DEFECTO, extractores_por_nucleos
+from ajuste_concurrencia import MODO_AUTO, MODOS_CONCURRENCIA, AjustadorWorkers, elegir_configuracion, estimar_tareas
 
 # Configuración de la ruta del script y las variables globales
 ROOT = os.path.dirname(os.path.abspath(__file__)) # Corregido _file_ a __file__
-APELLIDOS_SE = ["Andersson", "Johansson", "Eriksson", "Nilsson", "Larsson", "Svensson", "Carlsson", "Persson", "Gustafsson", "Pettersson", "Jansson", "Olsson"]
-NOMBRES_PERSONA = ["Conrad Reinell", "Annie Erickson", "Mary Livingston", "Erik Andersson", "Olof Jernberg"] + APELLIDOS_SE
-PAISES = ["Sweden", "Norway", "Denmark", "Finland", "Germany", "Canada", "USA"]
-DESTINOS = ["Chicago", "Minneapolis", "Moline", "Jamestown", "Rockford", "Seattle", "Worcester", "Gothenburg", "Stockholm"]
-OCUPACIONES = ["farmer", "factory worker", "domestic servant", "carpenter", "blacksmith", "railroad worker", "lumberjack", "tailor", "mason", "fisherman", "miner", "teacher", "pastor"]
-MODO_VIAJE = ["steamship", "ship", "boat", "railroad", "wagon", "horse", "stagecoach", "bicycle"]
-PUERTOS = ["Ellis Island", "Halifax", "Quebec", "New York", "Liverpool"]
-RAZONES_INM = ["work", "job", "opportunity", "poverty", "hunger", "famine"]
-EVENTOS_HIST = ["World War I", "World War II", "Great Depression", "Prohibition", "Industrial Revolution", "Panic of 1873"]
-IGLESIAS = ["Lutheran", "Baptist", "Methodist", "Quaker", "Augustana Evangelical Lutheran Church", "Swedish Mission Covenant Church"]
-ESC_FIJO = ["Augustana College", "Northwestern College", "Sacred Heart School"]
-
-# Aqui con build_pattern() se construyen los patrones regex para los nombres, ocupaciones, etc.
-def build_pattern(words, *, plural=False, boundaries=True):
-    esc = [re.escape(w) for w in words]
-    pat = r"(?:%s)" % "|".join(esc)
-    if plural: pat = f"{pat}s?"
-    return rf"\b{pat}\b" if boundaries else pat
+# VERSION_EXTRACCION se incrementa cuando cambia la lógica de extracción (p.ej. quitar_local) sin cambiar PATRONES_DATA.
+VERSION_EXTRACCION = 1
+
+# Archivos más grandes que UMBRAL_STREAMING_BYTES se extraen por bloques de TAMANO_BLOQUE_STREAMING caracteres,
+# con memoria acotada, en lugar de leerse enteros (ver MotorExtraccion.extraer_por_bloques()).
+UMBRAL_STREAMING_BYTES = 16 * 1024 * 1024
+TAMANO_BLOQUE_STREAMING = 1024 * 1024
+
+# Con --concurrency-mode process, los archivos más grandes que UMBRAL_SEGMENTACION_BYTES se dividen en segmentos
+# de TAMANO_SEGMENTO_BYTES que se extraen en paralelo y se fusionan en una sola fila. Cada segmento lee además
+# MARGEN_SEGMENTO_BYTES antes y después (4 bytes por carácter UTF-8 como máximo: al menos MARGEN_STREAMING caracteres).
+TAMANO_SEGMENTO_BYTES = 8 * 1024 * 1024
+UMBRAL_SEGMENTACION_BYTES = 2 * TAMANO_SEGMENTO_BYTES
+MARGEN_SEGMENTO_BYTES = 4 * MARGEN_STREAMING
+
+# En modo process main() envía los archivos a los workers en tandas de hasta MAX_ARCHIVOS_POR_TANDA (--chunk-size).
+MAX_ARCHIVOS_POR_TANDA = 32
+
+# Mensaje de error de un archivo cuya extracción se interrumpió porque su trabajo se canceló (ver el argumento
+# cancelado de extraer_resultado_de_archivo()): su resultado es parcial y no debe emitirse ni guardarse.
+MENSAJE_EXTRACCION_CANCELADA = "Extraction cancelled"
 
 #grp0_or_1() es una función auxiliar para manejar grupos de regex
 def grp0_or_1(m, grp):
     return m.group(grp) if (m and m.lastindex is not None and grp <= m.lastindex) else (m.group(0) if m else '')
 
-# Definición de patrones regex para fechas, nombres, ocupaciones, etc.
-REGEX_AÑO = r"(18[5-9]\d|19[0-2]\d)"
-REGEX_YMD = rf"{REGEX_AÑO}[-/.](0[1-9]|1[0-2])[-/.](0[1-9]|[12]\d|3[01])"
-REGEX_LARGA = (rf"(?:(?:Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday),?\s)?"
-               rf"(January|February|March|April|May|June|July|August|September|October|November|December)"
-               rf"\s(0?[1-9]|[12]\d|3[01]),?\s{REGEX_AÑO}")
-REGEX_FECHA = rf"(?:{REGEX_YMD}|{REGEX_LARGA}|{REGEX_AÑO})"
-ALT_NOMBRES = build_pattern(NOMBRES_PERSONA, boundaries=False)
-ALT_OCUPACIONES = build_pattern(OCUPACIONES, boundaries=False)
-ALT_OCUP_PLURAL = build_pattern(OCUPACIONES, plural=True, boundaries=False)
-pattern_name = rf"\b({ALT_NOMBRES})\b"
-pattern_parent_name = rf"\b(?:father|mother|parents?)\b[^.\n]{{0,40}}?({ALT_NOMBRES})"
-pattern_children_name = rf"\b(?:son|daughter|child|children)\b[^.\n]{{0,40}}?({ALT_NOMBRES})"
-pattern_grand_name = rf"\b(?:grandson|granddaughter|grandchild|grandchildren)\b[^.\n]{{0,40}}?({ALT_NOMBRES})"
-pattern_job_title = rf"\b(?:title|position|role|worked as|hired as)\b[^.\n]{{0,30}}?({ALT_OCUPACIONES}s?)"
-
+# Los patrones (PATRONES_DATA y sus vocabularios) se leen de patrones/<versión>.json (ver conjuntos_patrones.py).
+# REGISTRO_PATRONES guarda los conjuntos compilados de este proceso; al importar se activa la versión más reciente,
+# que da PATRONES_DATA, MOTOR, COLUMNAS_ORDENADAS y HUELLA_PATRONES. Las tareas que fijan otra versión la piden con
+# su clave (versión, huella) en el argumento patrones (ver conjunto_patrones()).
+REGISTRO_PATRONES = RegistroPatrones(VERSION_EXTRACCION)
 try:
-    PATRONES_DATA = [
-        ("Name", pattern_name, 1), ("Date of Birth", rf"born[^0-9A-Za-z]{{0,40}}({REGEX_FECHA})", 1),
-        ("Place of Birth", rf"born in\s+([A-Z][a-zA-Z\s]+(?:\s*,\s*[A-Z][a-zA-Z\s]*)?)", 1),
-        ("Date of Interview", REGEX_FECHA, 0), ("Location of Interview", build_pattern(DESTINOS), 0),
-        ("Parent's Names", pattern_parent_name, 1), ("Parent's Birthplace", build_pattern(PAISES + DESTINOS), 0),
-        ("Parent's Occupation", rf"\b(?:father|mother|parents?)\b[^.\n]{{0,30}}?({ALT_OCUP_PLURAL})", 1),
-        ("Siblings", r"\b(brother|sister|sibling)s?\b", 0),
-        ("Spouse's Name", rf"\b(?:wife|husband|spouse)\b[^.\n]{{0,40}}?({ALT_NOMBRES})", 1),
-        ("Children's Names", pattern_children_name, 1), ("Grandchildren's Names", pattern_grand_name, 1),
-        ("Date of Immigration", REGEX_AÑO, 0), ("Country of Origin", build_pattern(PAISES), 0),
-        ("Reason for Immigration", build_pattern(RAZONES_INM), 0), ("Mode of Travel", build_pattern(MODO_VIAJE), 0),
-        ("Ports of Entry", build_pattern(PUERTOS), 0), ("Destinations", build_pattern(DESTINOS), 0),
-        ("Occupation", build_pattern(OCUPACIONES, plural=True), 0),
-        ("Employer", r"\b(?:University|College|Hospital|Company|Plant|Factory|Inc\.|Ltd\.)\b.*?(?=[\.,;]|$)", 0),
-        ("Job Title", pattern_job_title, 1),
-        ("Education Level", r"\b(first grade|high school|college|university|seminary|degree|diploma)\b", 0),
-        ("Schools Attended", build_pattern(ESC_FIJO), 0),
-        ("Year of Graduation", r"graduat(?:e|ed|ion)\w*\s*(?:in|from|of)?\s*(\d{{4}})", 1),
-        ("Health Issues", build_pattern(["ulcer", "typhoid fever", "injury", "tuberculosis", "illness", "disease"]), 0),
-        ("Medical Treatments", build_pattern(["operation", "surgery", "blood transfusion", "vaccination", "medication", "treatment"]), 0),
-        ("Cause of Death", build_pattern(["heart attack", "cancer", "stroke", "accident", "influenza", "pneumonia", "old age"]), 0),
-        ("Church Affiliation", build_pattern(IGLESIAS), 0),
-        ("Community Involvement", build_pattern(EVENTOS_HIST + ["volunteer", "committee", "club"]), 0),
-        ("Social Activities", build_pattern(["soccer", "ice hockey", "choir singing", "theater", "dance", "picnic", "festival"]), 0),
-        ("Language Spoken", build_pattern(["English", "Swedish", "German", "Italian", "Norwegian", "Danish", "Finnish"]), 0),
-        ("Cultural Practices", build_pattern(["Midsommar", "Lucia", "Jul", "Christmas", "Easter", "Thanksgiving"]), 0),
-    ]
-    PATRONES = [(col, re.compile(rx, re.IGNORECASE | re.UNICODE), grp) for col, rx, grp in PATRONES_DATA]
-    # MODIFICADO: Eliminada "Error Info" de COLUMNAS_ORDENADAS
-    COLUMNAS_ORDENADAS = [col for col, _, _ in PATRONES_DATA] + ["Processed File Name"]
-except re.error as e:
-    error_msg = f"Error fatal compilando Regex: {e}"
+    CONJUNTO_PATRONES = REGISTRO_PATRONES.activar()
+    PATRONES_DATA = CONJUNTO_PATRONES.patrones_data
+    # MOTOR resuelve todas las columnas literales en una sola pasada y solo ejecuta como regex las estructurales.
+    MOTOR = CONJUNTO_PATRONES.motor
+    PATRONES = MOTOR.patrones
+    # MODIFICADO: Eliminada "Error Info" de COLUMNAS_ORDENADAS. Es la misma en todas las versiones de los patrones.
+    COLUMNAS_ORDENADAS = CONJUNTO_PATRONES.columnas_ordenadas
+    # HUELLA_PATRONES identifica la versión de los patrones (y de la lógica de extracción); la usa la caché de filas.
+    HUELLA_PATRONES = CONJUNTO_PATRONES.huella
+except ErrorConjuntoPatrones as e:
+    error_msg = f"Error fatal cargando los patrones: {e}"
     print(json.dumps({"type": "script_error", "message": error_msg}), flush=True)
     print(f"SERVIDOR.PY CRITICAL: {error_msg}", file=sys.stderr, flush=True)
     sys.exit(1)
-    
-#do_actual_processing_for_file() aplica las regex al contenido del texto y actualiza fila_resultante_ref
-#parametros: txt_content: contenido del archivo, fila_resultante_ref: diccionario de resultados
-def do_actual_processing_for_file(txt_content: str, fila_resultante_ref: dict):
+
+#conjunto_patrones() retorna el ConjuntoPatrones de una clave (versión, huella) recibida con una tarea (None: el activo);
+#definicion es la de la versión si llegó con la tarea (nodos remotos), si no se lee de patrones/.
+def conjunto_patrones(patrones: tuple = None, definicion: dict = None):
+    return REGISTRO_PATRONES.obtener(tuple(patrones) if patrones is not None else None, definicion)
+
+# REGLAS_QUITAR son los pares (origen, destino) de la lógica "quitar": los valores de origen se eliminan del destino
+# (p.ej. el entrevistado no es su propio hijo). Se aplican en este orden, con índices de MOTOR.columnas.
+REGLAS_QUITAR = [
+    ("Name", "Parent's Names"), ("Name", "Children's Names"), ("Name", "Grandchildren's Names"),
+    ("Parent's Names", "Children's Names"), ("Parent's Names", "Grandchildren's Names"),
+]
+INDICES_QUITAR = [(MOTOR.columnas.index(src), MOTOR.columnas.index(dst)) for src, dst in REGLAS_QUITAR]
+INDICE_OCUPACION = MOTOR.columnas.index("Occupation")
+INDICE_PUESTO = MOTOR.columnas.index("Job Title")
+
+#do_actual_processing_for_file() aplica las regex al contenido del texto y retorna el ResultadoExtraccion del archivo
+#parametros: txt_content: contenido del archivo, nombre_archivo: valor de "Processed File Name"
+def do_actual_processing_for_file(txt_content: str, nombre_archivo: str, perfil: PerfilPatrones = None, motor=None,
+                                  cancelado=None) -> ResultadoExtraccion:
     """
-    Aplica todas las regex al contenido del texto y actualiza fila_resultante_ref.
-    Retorna True si se encontraron datos, False en caso contrario.
+    Aplica todas las regex al contenido del texto; resultado.encontradas es 0 si no se encontraron datos.
+    Con perfil (--profile-patterns) se registran tiempo, matches y excepciones de cada columna.
+    motor es el de la versión de los patrones a usar (None: MOTOR); cancelado, ver MotorExtraccion.extraer().
     """
-    datos_encontrados_global = False
-    for col, regex_compilada, grp_captura in PATRONES:
-        try:
-            matches = regex_compilada.finditer(txt_content)
-            valores_encontrados_para_columna = set()
-            for m in matches:
-                valor_crudo = grp0_or_1(m, grp_captura)
-                if valor_crudo: 
-                    valor_limpio = valor_crudo.strip()
-                    if valor_limpio:
-                        valores_encontrados_para_columna.add(valor_limpio)
-            
-            if valores_encontrados_para_columna:
-                fila_resultante_ref[col] = '; '.join(sorted(list(valores_encontrados_para_columna)))
-                datos_encontrados_global = True
-        except Exception as e_regex:
-            # No imprimimos warning por cada regex para no saturar, la columna quedará "Not Mention"
-            # print(f"DEBUG_SERVIDOR_PY: WARN: Regex para '{col}' falló: {e_regex}", file=sys.stderr, flush=True)
-            pass 
-        
-    # quitar_local() elimina nombres de columnas específicas de otras columnas recibe los parametros
-    # parametros: src_col: columna de origen, dst_col: columna de destino, fila_dict: diccionario de fila_resultante_ref
-    def quitar_local(src_col, dst_col, fila_dict):
-        val_src = fila_dict.get(src_col, 'Not Mention')
-        val_dst = fila_dict.get(dst_col, 'Not Mention')
-        if val_src != 'Not Mention' and val_dst != 'Not Mention':
-            set_src = set(s.strip().lower() for s in val_src.split(';'))
-            lista_dst_original = [v.strip() for v in val_dst.split(';')]
-            nuevos_val = [v for v in lista_dst_original if v.strip().lower() not in set_src]
-            fila_dict[dst_col] = '; '.join(sorted(nuevos_val)) if nuevos_val else 'Not Mention'
+    # Una sola pasada para las columnas literales + las regex estructurales (ver motor_extraccion.py).
+    # Si una regex falla, su columna queda "Not Mention" igual que antes (el perfil cuenta la excepción).
+    return completar_resultado((motor or MOTOR).extraer(txt_content, perfil, cancelado), nombre_archivo)
+
+# completar_resultado() construye el ResultadoExtraccion a partir de los valores encontrados por el motor (un set por
+# columna, en el orden de MOTOR.columnas) y aplica la lógica "quitar". Es común al modo normal y al modo streaming.
+def completar_resultado(valores_por_columna: list, nombre_archivo: str) -> ResultadoExtraccion:
+    valores = [tuple(sorted(encontrados)) if encontrados else () for encontrados in valores_por_columna]
+
+    # Una columna cuenta como presente si su texto en la fila no sería 'Not Mention'.
+    def presente(valores_columna):
+        return bool(valores_columna) and valores_columna != (VALOR_POR_DEFECTO,)
+
+    # Las piezas se parten por ';' y se recortan igual que si se partiera el texto 'a; b' de la fila.
     try:
-        quitar_local("Name", "Parent's Names", fila_resultante_ref)
-        quitar_local("Name", "Children's Names", fila_resultante_ref)
-        quitar_local("Name", "Grandchildren's Names", fila_resultante_ref)
-        quitar_local("Parent's Names", "Children's Names", fila_resultante_ref)
-        quitar_local("Parent's Names", "Grandchildren's Names", fila_resultante_ref)
-        if fila_resultante_ref.get("Occupation","").lower() == fila_resultante_ref.get("Job Title","").lower() and \
-           fila_resultante_ref.get("Occupation") != 'Not Mention':
-            fila_resultante_ref["Job Title"] = "Not Mention"
+        for src, dst in INDICES_QUITAR:
+            if presente(valores[src]) and presente(valores[dst]):
+                set_src = {pieza.strip().lower() for valor in valores[src] for pieza in valor.split(';')}
+                piezas_dst = [pieza.strip() for valor in valores[dst] for pieza in valor.split(';')]
+                valores[dst] = tuple(sorted(v for v in piezas_dst if v.lower() not in set_src))
+        ocupacion = '; '.join(valores[INDICE_OCUPACION]) if valores[INDICE_OCUPACION] else VALOR_POR_DEFECTO
+        puesto = '; '.join(valores[INDICE_PUESTO]) if valores[INDICE_PUESTO] else VALOR_POR_DEFECTO
+        if ocupacion.lower() == puesto.lower() and ocupacion != VALOR_POR_DEFECTO:
+            valores[INDICE_PUESTO] = ()
     except Exception as e_quitar:
-            print(f"DEBUG_SERVIDOR_PY: WARN: Lógica 'quitar' falló: {e_quitar}", file=sys.stderr, flush=True) # El nombre del archivo se puede loguear en el llamador
-    
-    return datos_encontrados_global
+        print(f"DEBUG_SERVIDOR_PY: WARN: Lógica 'quitar' falló: {e_quitar}", file=sys.stderr, flush=True) # El nombre del archivo se puede loguear en el llamador
 
-# procesar_archivo_y_emitir_fila() procesa un archivo .txt y emite una fila de resultados
-# parametros: path: ruta del archivo, client_id_stdout: ID del cliente, worker_visual_id: ID del worker visual, total_visual_workers: total de workers visuales
-def procesar_archivo_y_emitir_fila(path: str, client_id_stdout: str, worker_visual_id: int, total_visual_workers: int, simulate_processing_delay_ms: int = 0):
+    return ResultadoExtraccion.desde_columnas(nombre_archivo, valores)
+
+# leer_bloques_texto() lee un archivo de texto por bloques de tamano_bloque caracteres (decodificación y saltos
+# de línea idénticos a fh.read(), pero sin cargar el archivo entero en memoria)
+def leer_bloques_texto(path: str, tamano_bloque: int = TAMANO_BLOQUE_STREAMING):
+    with open(path, encoding='utf-8', errors='ignore') as fh:
+        for bloque in iter(lambda: fh.read(tamano_bloque), ''):
+            yield bloque
+
+# decodificar_como_texto() decodifica bytes igual que open(..., encoding='utf-8', errors='ignore').read()
+# (incluida la conversión de saltos de línea \r\n y \r a \n)
+def decodificar_como_texto(datos: bytes) -> str:
+    return datos.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+# planificar_segmentos() divide un archivo grande en rangos de bytes [inicio, fin) que se pueden extraer en paralelo
+# parametros: path: ruta del archivo, tamano_segmento: bytes por segmento (0 desactiva la división)
+# retorna: lista de (inicio, fin); un solo rango si el archivo no supera el umbral
+def planificar_segmentos(path: str, tamano_segmento: int = TAMANO_SEGMENTO_BYTES):
+    tamano = os.path.getsize(path)
+    if tamano_segmento <= 0 or tamano <= max(UMBRAL_SEGMENTACION_BYTES, 2 * tamano_segmento):
+        return [(0, tamano)]
+    cortes = [0]
+    with open(path, 'rb') as fh:
+        for objetivo in range(tamano_segmento, tamano, tamano_segmento):
+            fh.seek(objetivo - 1)
+            vistazo = fh.read(8)
+            # No cortar dentro de un carácter UTF-8 ni entre el \r y el \n de un salto de línea, para que
+            # la concatenación de los segmentos decodificados sea exactamente el texto completo.
+            d = 1
+            while d < len(vistazo) and (0x80 <= vistazo[d] < 0xC0 or vistazo[d - 1:d + 1] == b'\r\n'):
+                d += 1
+            corte = objetivo - 1 + d
+            if cortes[-1] < corte < tamano:
+                cortes.append(corte)
+    cortes.append(tamano)
+    return list(zip(cortes, cortes[1:]))
+
+# extraer_segmento_de_archivo() extrae los valores de un segmento [inicio, fin) (en bytes) de un archivo grande
+# retorna: (valores por columna, hubo_texto, mensaje_error) para combinar con fusionar_segmentos()
+def extraer_segmento_de_archivo(path: str, inicio: int, fin: int, margen_bytes: int = MARGEN_SEGMENTO_BYTES,
+                                perfil: PerfilPatrones = None, motor=None):
     """
-    Procesa UN archivo .txt (aplicando regex reales), e incluye información del "worker visual".
-    Puede simular un retardo si simulate_processing_delay_ms > 0.
+    Lee el segmento más un margen a cada lado: el margen previo sincroniza el recorrido de cada patrón con el
+    que haría una pasada sobre el archivo completo y el posterior completa los matches que cruzan el borde.
+    Solo se guardan los matches que empiezan dentro del segmento, así que ninguno se cuenta dos veces.
     """
+    motor = motor or MOTOR
+    valores = [set() for _ in motor.columnas]
+    try:
+        desde = max(inicio - margen_bytes, 0)
+        with open(path, 'rb') as fh:
+            fh.seek(desde)
+            previo = decodificar_como_texto(fh.read(inicio - desde))
+            propio = decodificar_como_texto(fh.read(fin - inicio))
+            posterior = decodificar_como_texto(fh.read(margen_bytes))
+        valores, _ = motor.extraer_por_bloques(
+            [previo + propio + posterior], aceptar_desde=len(previo), aceptar_hasta=len(previo) + len(propio), perfil=perfil
+        )
+        return valores, bool(propio.strip()), "None"
+    except FileNotFoundError:
+        return valores, False, f"Archivo no encontrado: {path}"
+    except IOError as e_io:
+        return valores, False, f"Error I/O leyendo {os.path.basename(path)}: {e_io}"
+
+# fusionar_segmentos() combina los resultados de extraer_segmento_de_archivo() en el resultado del archivo completo
+# (unión de los valores por columna y luego la misma lógica "quitar" que do_actual_processing_for_file())
+# retorna: (resultado, mensaje_error) igual que extraer_resultado_de_archivo()
+def fusionar_segmentos(path: str, resultados_segmentos: list):
+    nombre_base_archivo = os.path.basename(path)
+    for _, _, mensaje_error in resultados_segmentos:
+        if mensaje_error != "None":
+            return ResultadoExtraccion(nombre_base_archivo), mensaje_error
+    if not any(hubo_texto for _, hubo_texto, _ in resultados_segmentos):
+        return ResultadoExtraccion(nombre_base_archivo), "File is empty or whitespace only"
+    valores = [set() for _ in MOTOR.columnas]
+    for valores_segmento, _, _ in resultados_segmentos:
+        for encontrados, del_segmento in zip(valores, valores_segmento):
+            encontrados.update(del_segmento)
+    return completar_resultado(valores, nombre_base_archivo), "None"
 
+# extraer_resultado_de_archivo() lee un archivo .txt, aplica las regex y retorna su ResultadoExtraccion (sin emitir nada)
+# parametros: path: ruta del archivo, simulate_processing_delay_ms: retardo artificial opcional,
+#             umbral_streaming_bytes: a partir de este tamaño el archivo se procesa por bloques (memoria acotada),
+#             perfil: PerfilPatrones opcional donde se registra el coste de cada columna,
+#             motor: MotorExtraccion de la versión de los patrones a usar (None: MOTOR),
+#             cancelado: threading.Event opcional que interrumpe la extracción entre bloques o columnas
+# retorna: (resultado, mensaje_error) donde mensaje_error es "None" si no hubo problemas, o
+#          MENSAJE_EXTRACCION_CANCELADA (con un resultado parcial) si cancelado se activó
+def extraer_resultado_de_archivo(path: str, simulate_processing_delay_ms: int = 0,
+                                 umbral_streaming_bytes: int = UMBRAL_STREAMING_BYTES, perfil: PerfilPatrones = None,
+                                 txt: str = None, motor=None, cancelado=None):
+    """
+    Procesa UN archivo .txt (aplicando regex reales) y retorna (resultado, mensaje_error).
+    Es la unidad de trabajo compartida por este script y por el pool persistente de servidor_websockets.py.
+    Los archivos más grandes que umbral_streaming_bytes se extraen con MOTOR.extraer_por_bloques().
+    txt es el contenido ya leído por la etapa de lectura del pipeline (ver leer_texto_para_pipeline()).
+    """
     nombre_base_archivo = os.path.basename(path)
     
-    fila_resultante = {col: 'Not Mention' for col in COLUMNAS_ORDENADAS}
-    fila_resultante["Processed File Name"] = nombre_base_archivo
+    resultado = ResultadoExtraccion(nombre_base_archivo)
     
-   
     current_file_error_message = "None"
 
     try:
-        with open(path, encoding='utf-8', errors='ignore') as fh:
-            txt = fh.read()
-
-        if not txt.strip():
-           
-            current_file_error_message = "File is empty or whitespace only"
-          
+        if txt is None and os.path.getsize(path) > umbral_streaming_bytes:
+            # Transcripción muy grande: se extrae por bloques con memoria acotada (ver MOTOR.extraer_por_bloques()).
+            valores, hubo_texto = (motor or MOTOR).extraer_por_bloques(leer_bloques_texto(path), perfil=perfil, cancelado=cancelado)
+            if not hubo_texto:
+                current_file_error_message = "File is empty or whitespace only"
+            else:
+                resultado = completar_resultado(valores, nombre_base_archivo)
         else:
-            # Siempre hacemos el procesamiento real de datos
-            datos_encontrados = do_actual_processing_for_file(txt, fila_resultante)
-            if not datos_encontrados:
-                # print(f"DEBUG_SERVIDOR_PY: No se encontraron datos regex en '{nombre_base_archivo}'.", file=sys.stderr, flush=True)
-                pass # Los campos ya son "Not Mention"
+            if txt is None:
+                with open(path, encoding='utf-8', errors='ignore') as fh:
+                    txt = fh.read()
+
+            if not txt.strip():
+               
+                current_file_error_message = "File is empty or whitespace only"
+              
+            else:
+                # Siempre hacemos el procesamiento real de datos
+                resultado = do_actual_processing_for_file(txt, nombre_base_archivo, perfil, motor, cancelado)
+                if not resultado.encontradas:
+                    # print(f"DEBUG_SERVIDOR_PY: No se encontraron datos regex en '{nombre_base_archivo}'.", file=sys.stderr, flush=True)
+                    pass # Los campos ya son "Not Mention"
 
         if simulate_processing_delay_ms > 0:
             time.sleep(simulate_processing_delay_ms / 1000.0)
 
-    except FileNotFoundError:
+    except OSError as e_io:
 
-        current_file_error_message = f"Archivo no encontrado: {path}"
-    except IOError as e_io:
-
-        current_file_error_message = f"Error I/O leyendo {nombre_base_archivo}: {e_io}"
+        current_file_error_message = mensaje_error_lectura(path, e_io)
     except Exception as e_general:
 
         current_file_error_message = f"Error inesperado procesando {nombre_base_archivo}: {type(e_general).__name__} - {e_general}" # Corregido _name_ a __name__
-        print(f"DEBUG_SERVIDOR_PY: EXCEPCION en procesar_archivo_y_emitir_fila para '{nombre_base_archivo}': {e_general}\n{traceback.format_exc()}", file=sys.stderr, flush=True)
+        print(f"DEBUG_SERVIDOR_PY: EXCEPCION en extraer_resultado_de_archivo para '{nombre_base_archivo}': {e_general}\n{traceback.format_exc()}", file=sys.stderr, flush=True)
 
-    # Emitir la fila
-    
-    if current_file_error_message != "None" and current_file_error_message != "File is empty or whitespace only":
-        print(json.dumps({"type": "progress_message", "client_id": client_id_stdout, "message": f"Error procesando {nombre_base_archivo}: {current_file_error_message}"}), flush=True)
-    
-    print(json.dumps({
-        "type": "csv_data_row",
-        "client_id": client_id_stdout,
-        "data": fila_resultante 
-    }), flush=True)
+    if cancelado is not None and cancelado.is_set():
+        current_file_error_message = MENSAJE_EXTRACCION_CANCELADA
+
+    return resultado, current_file_error_message
+
+# mensaje_error_lectura() es el mensaje de error de un archivo que no se pudo leer (el mismo en todos los caminos de
+# extracción, también cuando el archivo se lee para enviarlo a un nodo remoto)
+def mensaje_error_lectura(path: str, e_io: OSError) -> str:
+    if isinstance(e_io, FileNotFoundError):
+        return f"Archivo no encontrado: {path}"
+    return f"Error I/O leyendo {os.path.basename(path)}: {e_io}"
+
+# extraer_fila_de_archivo() es extraer_resultado_de_archivo() con el resultado ya convertido en fila (dict completo)
+# parametros: patrones: clave (versión, huella) de los patrones a usar (None: los activos), como en las demás tareas
+# retorna: (fila_resultante, mensaje_error)
+def extraer_fila_de_archivo(path: str, simulate_processing_delay_ms: int = 0,
+                            umbral_streaming_bytes: int = UMBRAL_STREAMING_BYTES, perfil: PerfilPatrones = None, patrones: tuple = None):
+    resultado, current_file_error_message = extraer_resultado_de_archivo(
+        path, simulate_processing_delay_ms, umbral_streaming_bytes, perfil, motor=conjunto_patrones(patrones).motor
+    )
+    return resultado.a_fila(COLUMNAS_ORDENADAS), current_file_error_message
+
+# es_error_reportable() indica si el mensaje de error de un archivo debe notificarse al cliente
+def es_error_reportable(mensaje_error: str) -> bool:
+    return mensaje_error != "None" and mensaje_error != "File is empty or whitespace only"
+
+# procesar_archivo_y_emitir_fila() procesa un archivo .txt y emite una fila de resultados
+# parametros: path: ruta del archivo, client_id_stdout: ID del cliente, worker_visual_id: ID del worker visual, total_visual_workers: total de workers visuales
+def procesar_archivo_y_emitir_fila(path: str, client_id_stdout: str, worker_visual_id: int, total_visual_workers: int, simulate_processing_delay_ms: int = 0,
+                                   umbral_streaming_bytes: int = UMBRAL_STREAMING_BYTES, perfil: PerfilPatrones = None, patrones: tuple = None):
+    """
+    Procesa UN archivo .txt (aplicando regex reales), e incluye información del "worker visual".
+    Puede simular un retardo si simulate_processing_delay_ms > 0.
+    """
+    resultado, current_file_error_message = extraer_resultado_de_archivo(
+        path, simulate_processing_delay_ms, umbral_streaming_bytes, perfil, motor=conjunto_patrones(patrones).motor
+    )
+    emitir_resultado_de_archivo(client_id_stdout, path, resultado, current_file_error_message)
+
+# extraer_tanda_de_archivos() es la tarea de los workers de main(): procesa varios archivos seguidos y retorna sus
+# resultados al proceso padre (ResultadoExtraccion, que viaja compacto entre procesos) en lugar de imprimirlos
+# retorna: lista de (ruta, resultado, mensaje_error, inicio, fin, perfil) con inicio/fin en time.time() del worker
+#          y perfil el PerfilPatrones del archivo si perfilar (None si no)
+# parametros: patrones: clave (versión, huella) de los patrones a usar; el worker los compila la primera vez que la ve
+def extraer_tanda_de_archivos(rutas: list, simulate_processing_delay_ms: int = 0, umbral_streaming_bytes: int = UMBRAL_STREAMING_BYTES,
+                              perfilar: bool = False, patrones: tuple = None):
+    motor = conjunto_patrones(patrones).motor
+    resultados = []
+    for ruta in rutas:
+        inicio = time.time()
+        perfil = PerfilPatrones(os.path.basename(ruta)) if perfilar else None
+        resultado, current_file_error_message = extraer_resultado_de_archivo(ruta, simulate_processing_delay_ms, umbral_streaming_bytes, perfil, motor=motor)
+        resultados.append((ruta, resultado, current_file_error_message, inicio, time.time(), perfil))
+    return resultados
+
+# leer_texto_para_pipeline() es la etapa de lectura del modo thread: lee el archivo igual que extraer_resultado_de_archivo()
+# retorna: el texto, o None si el archivo va por streaming o no se pudo leer (la etapa de extracción lo lee entonces
+#          ella misma y reporta el error con su mensaje habitual)
+def leer_texto_para_pipeline(path: str, umbral_streaming_bytes: int = UMBRAL_STREAMING_BYTES):
+    try:
+        if os.path.getsize(path) > umbral_streaming_bytes:
+            return None
+        with open(path, encoding='utf-8', errors='ignore') as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+# extraer_texto_cronometrado() es la etapa de extracción del modo thread: extrae el texto ya leído (o el archivo, si
+# txt es None) y retorna (resultado, mensaje_error, inicio, fin, perfil) como cada elemento de extraer_tanda_de_archivos()
+def extraer_texto_cronometrado(path: str, txt: str, simulate_processing_delay_ms: int = 0,
+                               umbral_streaming_bytes: int = UMBRAL_STREAMING_BYTES, perfilar: bool = False, patrones: tuple = None):
+    inicio = time.time()
+    perfil = PerfilPatrones(os.path.basename(path)) if perfilar else None
+    resultado, current_file_error_message = extraer_resultado_de_archivo(
+        path, simulate_processing_delay_ms, umbral_streaming_bytes, perfil, txt, conjunto_patrones(patrones).motor
+    )
+    return resultado, current_file_error_message, inicio, time.time(), perfil
+
+# extraer_segmento_cronometrado() es extraer_segmento_de_archivo() como tarea de main(): añade inicio y fin (time.time())
+# y, si perfilar, el PerfilPatrones del segmento (None si no)
+def extraer_segmento_cronometrado(path: str, inicio: int, fin: int, perfilar: bool = False, patrones: tuple = None):
+    t_inicio = time.time()
+    perfil = PerfilPatrones(os.path.basename(path)) if perfilar else None
+    resultado = extraer_segmento_de_archivo(path, inicio, fin, perfil=perfil, motor=conjunto_patrones(patrones).motor)
+    return resultado, t_inicio, time.time(), perfil
+
+# planificar_tareas() convierte la lista de archivos, ya ordenada por la política de despacho, en las tareas que se
+# envían al executor en ese orden: ("tanda", [rutas]) para archivos normales y ("segmento", ruta, inicio, fin) para
+# cada segmento de un archivo dividido
+def planificar_tareas(archivos_ordenados: list, segmentos_por_archivo: dict, tamanos: dict, max_archivos: int, max_bytes: int):
+    tareas, pendientes = [], []
+    for ruta_f in archivos_ordenados + [None]:
+        if ruta_f is not None and ruta_f not in segmentos_por_archivo:
+            pendientes.append(ruta_f)
+            continue
+        tareas.extend(("tanda", tanda) for tanda in agrupar_en_tandas(pendientes, tamanos, max_archivos, max_bytes))
+        pendientes = []
+        if ruta_f is not None:
+            tareas.extend(("segmento", ruta_f, inicio, fin) for inicio, fin in segmentos_por_archivo[ruta_f])
+    return tareas
+
+# calcular_tamano_tanda() elige cuántos archivos enviar por tarea al pool de procesos: unas 4 tandas por worker
+# (para que el reparto siga equilibrado) y nunca más de MAX_ARCHIVOS_POR_TANDA
+def calcular_tamano_tanda(num_archivos: int, num_workers: int) -> int:
+    return max(1, min(MAX_ARCHIVOS_POR_TANDA, num_archivos // (4 * max(1, num_workers))))
+
+# emitir_resultado_de_archivo() emite (desde el proceso principal) la fila de un archivo y, si lo hubo, su error
+# parametros: client_id_stdout: ID del cliente, path: ruta del archivo, fila_resultante: ResultadoExtraccion de
+#             extraer_resultado_de_archivo() o fila (dict) guardada en el manifiesto, mensaje_error del archivo
+def emitir_resultado_de_archivo(client_id_stdout: str, path: str, fila_resultante, current_file_error_message: str):
+    if es_error_reportable(current_file_error_message):
+        print(json.dumps({"type": "progress_message", "client_id": client_id_stdout, "message": f"Error procesando {os.path.basename(path)}: {current_file_error_message}"}), flush=True)
+    elif MANIFIESTO is not None or ALMACEN is not None:
+        fila_resultante = como_fila(fila_resultante)
+        if MANIFIESTO is not None:
+            MANIFIESTO.registrar(path, fila_resultante, current_file_error_message)
+        if ALMACEN is not None:
+            ALMACEN.agregar(fila_resultante, os.path.abspath(path))
+    emitir_fila(client_id_stdout, fila_resultante, path)
+
+# como_fila() serializa un ResultadoExtraccion como fila completa (dict); las filas que ya son dict se retornan tal cual
+def como_fila(fila_o_resultado) -> dict:
+    if isinstance(fila_o_resultado, ResultadoExtraccion):
+        return fila_o_resultado.a_fila(COLUMNAS_ORDENADAS)
+    return fila_o_resultado
+
+# LOTEADOR es el acumulador de filas del modo --output-format batch (None en el modo clásico fila a fila).
+LOTEADOR = None
+# MANIFIESTO es el manifiesto del modo --manifest (None si se extraen todos los archivos); ver manifiesto_incremental.py.
+MANIFIESTO = None
+# ALMACEN es la base de resultados del modo --store (None si las filas solo se emiten); ver almacen_resultados.py.
+ALMACEN = None
+
+# emitir_fila() imprime una fila por stdout en el formato de salida activo (es el borde donde se serializa el resultado)
+# parametros: client_id_stdout: ID del cliente, fila: diccionario completo de la fila o ResultadoExtraccion,
+#             path: ruta del archivo de la fila (se emite absoluta, para distinguir archivos con el mismo nombre)
+def emitir_fila(client_id_stdout: str, fila, path: str = None):
+    ruta_absoluta = os.path.abspath(path) if path else None
+    if LOTEADOR is None:
+        print(json.dumps({
+            "type": "csv_data_row",
+            "client_id": client_id_stdout,
+            "data": como_fila(fila),
+            "path": ruta_absoluta,
+        }), flush=True)
+    elif isinstance(fila, ResultadoExtraccion):
+        LOTEADOR.agregar_compacta(fila.a_compacta(COLUMNAS_ORDENADAS), ruta_absoluta)
+    else:
+        LOTEADOR.agregar(fila, ruta_absoluta)
     
 
+# resolver_archivos_entrada() construye la lista de .txt a procesar a partir de rutas explícitas o de un directorio
+# parametros: input_files: lista de rutas, default_input_dir: directorio usado si la lista está vacía
+# retorna: (archivos_a_procesar, avisos para el cliente, directorio_invalido)
+def resolver_archivos_entrada(input_files, default_input_dir):
+    archivos_a_procesar = []
+    avisos = []
+    if input_files:
+        for ruta_f_arg in input_files:
+            ruta_normalizada = os.path.normpath(ruta_f_arg)
+            if os.path.isfile(ruta_normalizada) and ruta_normalizada.lower().endswith('.txt'):
+                archivos_a_procesar.append(ruta_normalizada)
+            else:
+                avisos.append(f"Advertencia: Archivo '{ruta_normalizada}' no es un .txt válido o no existe y será omitido.")
+                print(f"DEBUG_SERVIDOR_PY: Archivo '{ruta_normalizada}' inválido u omitido.", file=sys.stderr, flush=True)
+    elif default_input_dir:
+        dir_path = os.path.normpath(default_input_dir)
+        if os.path.isdir(dir_path):
+            patron_busqueda = os.path.join(dir_path, "*.txt")
+            archivos_a_procesar = [f for f in glob.glob(patron_busqueda) if os.path.isfile(f)]
+            if not archivos_a_procesar:
+                avisos.append(f"No se encontraron archivos .txt en el directorio: {dir_path}")
+        else:
+            avisos.append(f"Error: El directorio por defecto '{dir_path}' no es válido o no existe.")
+            return [], avisos, True
+    return archivos_a_procesar, avisos, False
+
 # main() es la función principal que maneja la lógica del script
 def main():
     t0_script = time.perf_counter()
     parser = argparse.ArgumentParser(description="Procesa archivos .txt y emite datos como JSON.")
     parser.add_argument("--input-file", action="append", default=[], help="Ruta a un archivo .txt específico.")
     parser.add_argument("--default-input-dir", help="Directorio a procesar.")
-    parser.add_argument("--concurrency-mode", choices=['thread', 'process', 'sequential_visual'], default='thread',
-                        help="Modo: 'thread', 'process' (paralelismo real), 'sequential_visual' (secuencial en backend, simula N workers para GUI).")
-    parser.add_argument("--workers", type=int, default=1, 
-                        help="Número de workers. Para 'thread'/'process', son workers reales. Para 'sequential_visual', es el N° de workers a simular para la GUI.")
+    parser.add_argument("--concurrency-mode", choices=MODOS_CONCURRENCIA, default='thread',
+                        help="Modo: 'thread', 'process' (paralelismo real), 'sequential_visual' (secuencial en backend, simula N workers para GUI), 'auto' (elige modo y workers según el lote y los ajusta durante la ejecución).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Número de workers (1 por defecto). Para 'thread'/'process', son workers reales. Para 'sequential_visual', es el N° de workers a simular para la GUI. Para 'auto', el máximo (por defecto, los núcleos).")
     parser.add_argument("--client-id", required=True, help="ID del cliente.")
+    parser.add_argument("--output-format", choices=['rows', 'batch'], default='rows',
+                        help="'rows': una línea csv_data_row por archivo (dict completo). 'batch': esquema una vez y lotes de filas compactas (solo columnas encontradas).")
+    parser.add_argument("--batch-size", type=int, default=MAX_FILAS_LOTE, help="Máximo de filas por lote en --output-format batch.")
+    parser.add_argument("--batch-interval-ms", type=int, default=INTERVALO_LOTE_MS, help="Tiempo máximo (ms) que una fila espera en un lote en --output-format batch.")
+    parser.add_argument("--streaming-threshold-mb", type=float, default=UMBRAL_STREAMING_BYTES / (1024 * 1024),
+                        help="Archivos más grandes que esto (MB) se procesan por bloques con memoria acotada.")
+    parser.add_argument("--segment-size-mb", type=float, default=TAMANO_SEGMENTO_BYTES / (1024 * 1024),
+                        help="En modo process, archivos grandes se dividen en segmentos de este tamaño (MB) extraídos en paralelo. 0 desactiva.")
+    parser.add_argument("--dispatch-policy", choices=POLITICAS_DESPACHO, default=POLITICA_POR_DEFECTO,
+                        help="Orden de despacho de los archivos según su tamaño: fcfs (orden de llegada), sjf (más corto primero), lpt (más largo primero) o hrrn.")
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="En modo process, archivos por tarea enviada a cada worker. 0 = automático.")
+    parser.add_argument("--reader-threads", type=int, default=LECTORES_POR_DEFECTO,
+                        help="En modo thread, threads de la etapa de lectura que leen los archivos por adelantado para los extractores.")
+    parser.add_argument("--profile-patterns", action="store_true",
+                        help="Mide tiempo, matches y excepciones de cada columna de PATRONES y los agrega en el sumario (pattern_profile).")
+    parser.add_argument("--manifest",
+                        help="Modo incremental: ruta del manifiesto (.json). Solo se extraen los archivos nuevos o cambiados; el resto se sirve desde el manifiesto.")
+    parser.add_argument("--store",
+                        help="Ruta de la base SQLite de resultados (ver almacen_resultados.py); cada fila extraída se guarda también ahí.")
+    parser.add_argument("--pattern-version",
+                        help="Versión de los patrones (patrones/<versión>.json) a usar; por defecto, la más reciente.")
+    parser.add_argument("--pattern-fingerprint",
+                        help="Huella esperada de --pattern-version; si el archivo ya no coincide con ella, el lote no se procesa.")
     parser.add_argument("--simulate-delay-ms", type=int, default=0,
                         help="Si > 0, añade un retardo artificial (en ms) a cada procesamiento de archivo para simular carga.")
 
     args = parser.parse_args()
     client_id = args.client_id
+    umbral_streaming_bytes = int(args.streaming_threshold_mb * 1024 * 1024)
 
-    num_workers_visual_gui = args.workers
+    num_workers_visual_gui = args.workers or 1
     
     msg_inicial_detalle = (
         f"Script 'servidor.py' para cliente {client_id}. "
@@ -215,40 +478,97 @@ def main():
     print(json.dumps({"type": "progress_message", "client_id": client_id, "message": msg_inicial_detalle}), flush=True)
     print(f"DEBUG_SERVIDOR_PY: main() llamado. Args: {args}", file=sys.stderr, flush=True)
 
-    archivos_a_procesar = []
-    if args.input_file:
-        for ruta_f_arg in args.input_file:
-            ruta_normalizada = os.path.normpath(ruta_f_arg)
-            if os.path.isfile(ruta_normalizada) and ruta_normalizada.lower().endswith('.txt'):
-                archivos_a_procesar.append(ruta_normalizada)
-            else:
-                print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Advertencia: Archivo '{ruta_normalizada}' no es un .txt válido o no existe y será omitido."}), flush=True)
-                print(f"DEBUG_SERVIDOR_PY: Archivo '{ruta_normalizada}' inválido u omitido.", file=sys.stderr, flush=True)
-                pass 
-    elif args.default_input_dir:
-        dir_path = os.path.normpath(args.default_input_dir)
-        if os.path.isdir(dir_path):
-            patron_busqueda = os.path.join(dir_path, "*.txt")
-            archivos_a_procesar = [f for f in glob.glob(patron_busqueda) if os.path.isfile(f)]
-            if not archivos_a_procesar:
-                 print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"No se encontraron archivos .txt en el directorio: {dir_path}"}), flush=True)
-        else:
-            print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error: El directorio por defecto '{dir_path}' no es válido o no existe."}), flush=True)
-            print(f"DEBUG_SERVIDOR_PY: Directorio por defecto '{dir_path}' inválido.", file=sys.stderr, flush=True)
-            print(json.dumps({"type": "processing_complete", "client_id": client_id, "summary": {"status": "error_invalid_directory"}}), flush=True)
-            return
+    # Versión de los patrones del lote: la que fijó el servidor para el trabajo (con su huella) o la más reciente.
+    try:
+        conjunto = conjunto_patrones((args.pattern_version, args.pattern_fingerprint) if args.pattern_version else None)
+    except ErrorConjuntoPatrones as e_patrones:
+        print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error en los patrones: {e_patrones}"}), flush=True)
+        print(json.dumps({"type": "processing_complete", "client_id": client_id, "summary": {"status": "error_pattern_version"}}), flush=True)
+        return
+    patrones = conjunto.clave
 
+    archivos_a_procesar, avisos_entrada, directorio_invalido = resolver_archivos_entrada(args.input_file, args.default_input_dir)
+    for aviso in avisos_entrada:
+        print(json.dumps({"type": "progress_message", "client_id": client_id, "message": aviso}), flush=True)
+    if directorio_invalido:
+        print(f"DEBUG_SERVIDOR_PY: Directorio por defecto '{args.default_input_dir}' inválido.", file=sys.stderr, flush=True)
+        print(json.dumps({"type": "processing_complete", "client_id": client_id, "summary": {"status": "error_invalid_directory"}}), flush=True)
+        return
 
     if not archivos_a_procesar:
         print(json.dumps({"type": "progress_message", "client_id": client_id, "message": "No se especificaron archivos .txt válidos para procesar."}), flush=True)
         print(json.dumps({"type": "processing_complete", "client_id": client_id, "summary": {"status": "no_files_found"}}), flush=True)
         return
 
+    # Modo incremental: los archivos que no cambiaron desde la última extracción salen del manifiesto y no se extraen.
+    # Al perfilar se extrae todo de verdad (como con la caché del pool).
+    global MANIFIESTO
+    filas_del_manifiesto = []
+    if args.manifest and not args.profile_patterns:
+        MANIFIESTO = ManifiestoIncremental(conjunto.huella, COLUMNAS_ORDENADAS, args.manifest)
+        pendientes = []
+        for ruta_f in archivos_a_procesar:
+            guardado = MANIFIESTO.consultar(ruta_f)
+            if guardado is None:
+                pendientes.append(ruta_f)
+            else:
+                filas_del_manifiesto.append((ruta_f,) + guardado)
+        archivos_a_procesar = pendientes
+        print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Modo incremental: {len(filas_del_manifiesto)} archivo(s) sin cambios servidos desde el manifiesto, {len(pendientes)} por extraer."}), flush=True)
+
     num_archivos_a_procesar = len(archivos_a_procesar)
+    # El tamaño del archivo es la estimación de su ráfaga para la política de despacho.
+    tamanos = {ruta_f: tamano_archivo(ruta_f) for ruta_f in archivos_a_procesar}
+    archivos_a_procesar = ordenar_por_politica(archivos_a_procesar, args.dispatch_policy, tamanos)
+    metricas = MetricasDespacho(args.dispatch_policy)
+    # Perfil agregado del lote: cada archivo (o segmento) se mide en su propio PerfilPatrones y se acumula aquí.
+    perfil_lote = PerfilPatrones() if args.profile_patterns else None
+
+    # Modo auto: el modo y los workers se eligen según el lote (ver ajuste_concurrencia.py) y, en modo process, el
+    # número de tareas en curso se sigue ajustando con las filas/s medidas.
+    eleccion_auto = None
+    ajustador = None
+    if args.concurrency_mode == MODO_AUTO:
+        tamano_segmento = int(args.segment_size_mb * 1024 * 1024)
+        num_tareas_estimadas = estimar_tareas(list(tamanos.values()), max(UMBRAL_SEGMENTACION_BYTES, 2 * tamano_segmento), tamano_segmento)
+        eleccion_auto = elegir_configuracion(num_tareas_estimadas, sum(tamanos.values()), max_workers=args.workers)
+        args.concurrency_mode = eleccion_auto["modo"]
+        num_workers_visual_gui = eleccion_auto["workers"]
+        print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Modo auto: {eleccion_auto['modo']} con {eleccion_auto['workers']} worker(s) ({eleccion_auto['motivo']})."}), flush=True)
+
+    # En modo process un archivo enorme no debe ocupar un solo worker mientras el resto espera:
+    # se divide en segmentos que se reparten entre los workers como tareas independientes.
+    segmentos_por_archivo = {}
+    if args.concurrency_mode == 'process' and num_workers_visual_gui > 1:
+        tamano_segmento = int(args.segment_size_mb * 1024 * 1024)
+        for ruta_f in archivos_a_procesar:
+            try:
+                segmentos = planificar_segmentos(ruta_f, tamano_segmento)
+            except OSError:
+                continue  # El worker reportará el error de lectura con su mensaje habitual.
+            if len(segmentos) > 1:
+                segmentos_por_archivo[ruta_f] = segmentos
+                print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Archivo grande {os.path.basename(ruta_f)} dividido en {len(segmentos)} segmentos para extracción en paralelo."}), flush=True)
+    num_tareas = num_archivos_a_procesar + sum(len(segmentos) - 1 for segmentos in segmentos_por_archivo.values())
     
-    if args.concurrency_mode in ['thread', 'process']:
-        workers_reales_pool = max(1, min(num_workers_visual_gui, num_archivos_a_procesar))
-        executor_type = ThreadPoolExecutor if args.concurrency_mode == 'thread' else ProcessPoolExecutor
+    pipeline = None
+    if args.concurrency_mode == 'thread':
+        # Modo thread: lectura por adelantado, extracción con un thread por núcleo y emisión desde este thread.
+        workers_reales_pool = extractores_por_nucleos(min(num_workers_visual_gui, num_tareas))
+        executor_type = None
+        pipeline = PipelineExtraccion(
+            functools.partial(leer_texto_para_pipeline, umbral_streaming_bytes=umbral_streaming_bytes),
+            functools.partial(extraer_texto_cronometrado, simulate_processing_delay_ms=args.simulate_delay_ms,
+                              umbral_streaming_bytes=umbral_streaming_bytes, perfilar=args.profile_patterns, patrones=patrones),
+            extractores=workers_reales_pool, lectores=min(args.reader_threads, max(1, num_tareas)),
+        )
+        msg_proc = f"Iniciando procesamiento CONCURRENTE REAL (thread, pipeline) de {num_archivos_a_procesar} archivo(s) con {pipeline.num_lectores} thread(s) de lectura y {workers_reales_pool} de extracción (GUI simulará {num_workers_visual_gui})."
+
+    elif args.concurrency_mode == 'process':
+        workers_reales_pool = max(1, min(num_workers_visual_gui, num_tareas))
+        executor_type = ProcessPoolExecutor
+        if eleccion_auto is not None and workers_reales_pool > 1:
+            ajustador = AjustadorWorkers(workers_reales_pool)
         msg_proc = f"Iniciando procesamiento CONCURRENTE REAL ({args.concurrency_mode}) de {num_archivos_a_procesar} archivo(s) con {workers_reales_pool} workers en pool (GUI simulará {num_workers_visual_gui})."
     
     elif args.concurrency_mode == 'sequential_visual':
@@ -264,41 +584,136 @@ def main():
     print(json.dumps({"type": "progress_message", "client_id": client_id, "message": msg_proc}), flush=True)
 
     files_processed_ok = 0
+
+    global LOTEADOR, ALMACEN
+    if args.store:
+        ALMACEN = AlmacenResultados(args.store)
+        ALMACEN.iniciar()
+    if args.output_format == 'batch':
+        LOTEADOR = LoteadorFilasStdout(client_id, COLUMNAS_ORDENADAS, args.batch_size, args.batch_interval_ms)
+        LOTEADOR.iniciar()
+    for ruta_f, fila_guardada, mensaje_error in filas_del_manifiesto:
+        emitir_resultado_de_archivo(client_id, ruta_f, fila_guardada, mensaje_error)
+        files_processed_ok += 1
    
     futures_exceptions = 0 
 
-    if executor_type: 
+    if pipeline is not None:
+        try:
+            for ruta_f, salida, exc_extraccion in pipeline.ejecutar(archivos_a_procesar, tamanos):
+                if exc_extraccion is not None:
+                    futures_exceptions += 1
+                    print(f"DEBUG_SERVIDOR_PY: EXCEPCION en extracción para '{ruta_f}': {exc_extraccion}", file=sys.stderr, flush=True)
+                    print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error grave en worker para {os.path.basename(ruta_f)}: {exc_extraccion}"}), flush=True)
+                    error_fila = {col: 'ERROR' for col in COLUMNAS_ORDENADAS}
+                    error_fila["Processed File Name"] = os.path.basename(ruta_f)
+                    emitir_fila(client_id, error_fila, ruta_f)
+                    continue
+                resultado_archivo, mensaje_error, inicio, fin, perfil = salida
+                metricas.registrar(ruta_f, inicio, fin, tamanos[ruta_f])
+                if perfil is not None:
+                    perfil_lote.fusionar(perfil)
+                emitir_resultado_de_archivo(client_id, ruta_f, resultado_archivo, mensaje_error)
+                files_processed_ok += 1
+        except Exception as e_pipeline:
+            print(f"DEBUG_SERVIDOR_PY: Error crítico en el pipeline: {e_pipeline}\n{traceback.format_exc()}", file=sys.stderr, flush=True)
+            print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error crítico en el pipeline: {e_pipeline}"}), flush=True)
+            futures_exceptions = num_archivos_a_procesar + len(filas_del_manifiesto) - files_processed_ok
+
+    elif executor_type: 
+        # Los workers no escriben en stdout: retornan sus filas y solo este proceso las serializa y emite, así
+        # las líneas nunca se entremezclan. En modo process los archivos se envían en tandas para repartir el
+        # coste de IPC de cada tarea entre varios archivos pequeños.
+        # Las tareas se envían en el orden de la política; una tanda tampoco supera su parte proporcional de bytes
+        # para que agrupar no junte varios archivos grandes en una sola tarea.
+        archivos_normales = [ruta_f for ruta_f in archivos_a_procesar if ruta_f not in segmentos_por_archivo]
+        tamano_tanda = 1
+        if args.concurrency_mode == 'process':
+            tamano_tanda = args.chunk_size if args.chunk_size > 0 else calcular_tamano_tanda(len(archivos_normales), workers_reales_pool)
+            if ajustador is not None and args.chunk_size <= 0:
+                tamano_tanda = max(1, tamano_tanda // 4)  # Tandas más pequeñas: el ajustador decide más a menudo.
+        max_bytes_tanda = max(1, sum(tamanos[ruta_f] for ruta_f in archivos_normales) // (4 * workers_reales_pool))
+        tareas = planificar_tareas(archivos_a_procesar, segmentos_por_archivo, tamanos, tamano_tanda, max_bytes_tanda)
         try:
             with executor_type(max_workers=workers_reales_pool) as executor:
-                futures = {
-                    executor.submit(procesar_archivo_y_emitir_fila, ruta_f, client_id, idx % num_workers_visual_gui, num_workers_visual_gui, args.simulate_delay_ms): (idx, ruta_f) # Ajustado idx para worker_visual_id
-                    for idx, ruta_f in enumerate(archivos_a_procesar)
-                }
+                futures = {}
+                tareas_por_enviar = iter(tareas)
+
+                # Sin ajustador se envían todas las tareas de una vez; con él, solo las que permite su límite actual.
+                def enviar_tareas():
+                    limite_en_curso = ajustador.limite if ajustador is not None else len(tareas)
+                    while len(futures) < limite_en_curso:
+                        tarea = next(tareas_por_enviar, None)
+                        if tarea is None:
+                            return
+                        if tarea[0] == "tanda":
+                            futures[executor.submit(extraer_tanda_de_archivos, tarea[1], args.simulate_delay_ms, umbral_streaming_bytes, args.profile_patterns, patrones)] = tarea[1]
+                        else:
+                            _, ruta_f, inicio, fin = tarea
+                            futures[executor.submit(extraer_segmento_cronometrado, ruta_f, inicio, fin, args.profile_patterns, patrones)] = [ruta_f]
+
+                enviar_tareas()
+                # Resultados parciales de los archivos divididos; la fila se emite al llegar el último segmento.
+                parciales = {ruta_f: [] for ruta_f in segmentos_por_archivo}
                 
-                for future_item in as_completed(futures):
-                    idx_original, ruta_f_original = futures[future_item]
-                    try:
-                        future_item.result() 
-                        files_processed_ok += 1 
-                    except Exception as exc_future:
-                        futures_exceptions += 1
-                        print(f"DEBUG_SERVIDOR_PY: EXCEPCION DEL FUTURE para '{ruta_f_original}': {exc_future}\n{traceback.format_exc()}", file=sys.stderr, flush=True)
-                        print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error grave en worker para {os.path.basename(ruta_f_original)}: {exc_future}"}), flush=True)
-                       
-                        error_fila = {col: 'ERROR' for col in COLUMNAS_ORDENADAS}
-                        error_fila["Processed File Name"] = os.path.basename(ruta_f_original)
-                       
-                        print(json.dumps({"type": "csv_data_row", "client_id": client_id, "data": error_fila}), flush=True)
+                while futures:
+                    # Con todas las tareas ya enviadas basta una pasada de as_completed(); con ajustador hay pocas en curso.
+                    terminados = as_completed(list(futures)) if ajustador is None else wait(futures, return_when=FIRST_COMPLETED)[0]
+                    for future_item in terminados:
+                        rutas_future = futures.pop(future_item)
+                        if ajustador is not None:
+                            ajustador.registrar(len(rutas_future))
+                        try:
+                            resultado = future_item.result() 
+                        except Exception as exc_future:
+                            for ruta_f_original in rutas_future:
+                                if ruta_f_original in segmentos_por_archivo and parciales.pop(ruta_f_original, None) is None:
+                                    continue  # El archivo ya se reportó como fallido por otro segmento.
+                                futures_exceptions += 1
+                                print(f"DEBUG_SERVIDOR_PY: EXCEPCION DEL FUTURE para '{ruta_f_original}': {exc_future}\n{traceback.format_exc()}", file=sys.stderr, flush=True)
+                                print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error grave en worker para {os.path.basename(ruta_f_original)}: {exc_future}"}), flush=True)
+                           
+                                error_fila = {col: 'ERROR' for col in COLUMNAS_ORDENADAS}
+                                error_fila["Processed File Name"] = os.path.basename(ruta_f_original)
+                           
+                                emitir_fila(client_id, error_fila, ruta_f_original)
+                            continue
+
+                        ruta_f_original = rutas_future[0]
+                        if ruta_f_original in segmentos_por_archivo:
+                            if ruta_f_original not in parciales:
+                                continue  # Otro segmento de este archivo ya falló y se reportó.
+                            resultado, inicio, fin, perfil = resultado
+                            metricas.registrar(ruta_f_original, inicio, fin, tamanos[ruta_f_original])
+                            if perfil is not None:
+                                perfil_lote.fusionar(perfil)
+                            parciales[ruta_f_original].append(resultado)
+                            if len(parciales[ruta_f_original]) == len(segmentos_por_archivo[ruta_f_original]):
+                                emitir_resultado_de_archivo(client_id, ruta_f_original, *fusionar_segmentos(ruta_f_original, parciales.pop(ruta_f_original)))
+                                files_processed_ok += 1
+                            continue
+                        for ruta_f, resultado_archivo, mensaje_error, inicio, fin, perfil in resultado:
+                            metricas.registrar(ruta_f, inicio, fin, tamanos[ruta_f])
+                            if perfil is not None:
+                                perfil_lote.fusionar(perfil)
+                            emitir_resultado_de_archivo(client_id, ruta_f, resultado_archivo, mensaje_error)
+                            files_processed_ok += 1
+                    enviar_tareas()
 
         except Exception as e_executor: 
             print(f"DEBUG_SERVIDOR_PY: Error crítico con el Executor: {e_executor}\n{traceback.format_exc()}", file=sys.stderr, flush=True)
             print(json.dumps({"type": "progress_message", "client_id": client_id, "message": f"Error crítico con Executor: {e_executor}"}), flush=True)
-            futures_exceptions = num_archivos_a_procesar - files_processed_ok
+            futures_exceptions = num_archivos_a_procesar + len(filas_del_manifiesto) - files_processed_ok
 
     else: 
         for idx, ruta_f in enumerate(archivos_a_procesar):
             try:
-                procesar_archivo_y_emitir_fila(ruta_f, client_id, idx % num_workers_visual_gui, num_workers_visual_gui, args.simulate_delay_ms) 
+                inicio = time.time()
+                perfil = PerfilPatrones(os.path.basename(ruta_f)) if perfil_lote is not None else None
+                procesar_archivo_y_emitir_fila(ruta_f, client_id, idx % num_workers_visual_gui, num_workers_visual_gui, args.simulate_delay_ms, umbral_streaming_bytes, perfil, patrones)
+                metricas.registrar(ruta_f, inicio, time.time(), tamanos[ruta_f])
+                if perfil is not None:
+                    perfil_lote.fusionar(perfil)
                 files_processed_ok +=1 
             except Exception as exc_seq: 
                 futures_exceptions += 1
@@ -308,7 +723,7 @@ def main():
                 error_fila = {col: 'ERROR' for col in COLUMNAS_ORDENADAS}
                 error_fila["Processed File Name"] = os.path.basename(ruta_f)
                 
-                print(json.dumps({"type": "csv_data_row", "client_id": client_id, "data": error_fila}), flush=True)
+                emitir_fila(client_id, error_fila, ruta_f)
 
 
     dt_script = time.perf_counter() - t0_script
@@ -319,15 +734,39 @@ def main():
          final_status = "completed_no_tasks_ok" 
     
     summary = {
-        "files_attempted": num_archivos_a_procesar,
+        "files_attempted": num_archivos_a_procesar + len(filas_del_manifiesto),
         "tasks_completed_ok": files_processed_ok, 
         "tasks_failed_exception": futures_exceptions,
         "status": final_status,
         "duration_seconds": round(dt_script, 2),
         "concurrency_mode_used": args.concurrency_mode,
         "workers_visual_gui": num_workers_visual_gui,
-        "simulated_delay_per_task_ms": args.simulate_delay_ms
+        "simulated_delay_per_task_ms": args.simulate_delay_ms,
+        "pattern_version": conjunto.version,
+        "pattern_fingerprint": conjunto.huella,
     }
+    summary.update(metricas.resumen())
+    if eleccion_auto is not None:
+        summary["concurrency_mode_requested"] = MODO_AUTO
+        summary["auto_tuning"] = {"mode": eleccion_auto["modo"], "workers": eleccion_auto["workers"], "reason": eleccion_auto["motivo"]}
+        if ajustador is not None:
+            summary["auto_tuning"].update(ajustador.resumen())
+    if pipeline is not None:
+        summary["pipeline"] = pipeline.resumen()
+    if MANIFIESTO is not None:
+        MANIFIESTO.podar()
+        MANIFIESTO.guardar()
+        summary["incremental"] = {"files_from_manifest": len(filas_del_manifiesto), "files_extracted": num_archivos_a_procesar}
+    if perfil_lote is not None:
+        summary["pattern_profile"] = perfil_lote.resumen()
+        for linea in perfil_lote.lineas_texto(5):
+            print(f"DEBUG_SERVIDOR_PY: PERFIL {linea}", file=sys.stderr, flush=True)
+    if LOTEADOR is not None:
+        LOTEADOR.cerrar()
+        summary["output_format"] = args.output_format
+    if ALMACEN is not None:
+        ALMACEN.cerrar()
+        summary["stored_rows"] = ALMACEN.estadisticas["filas_guardadas"]
     print(f"DEBUG_SERVIDOR_PY: Finalizando script. Sumario: {summary}", file=sys.stderr, flush=True)
     print(json.dumps({"type": "processing_complete", "client_id": client_id, "summary": summary}), flush=True)
 
@@ -1,5 +1,21 @@
 # -*- coding: utf-8 -*-
-import asyncio, websockets, json, logging, os, subprocess, sys
+import argparse, asyncio, websockets, base64, hmac, ipaddress, json, logging, os, signal, subprocess, sys, functools, time
+from pool_extraccion import PoolExtraccion, TrabajoExtraccion
+from planificador_trabajos import PlanificadorTrabajos, AdmisionRechazada
+from entrega_filas import LoteadorFilasWebsocket, MAX_FILAS_LOTE, INTERVALO_LOTE_MS, expandir_fila
+from politicas_despacho import POLITICAS_DESPACHO, POLITICA_POR_DEFECTO
+from motor_extraccion import PerfilPatrones
+from metricas_servidor import MetricasServidor, PUERTO_METRICAS
+from manifiesto_incremental import VigilanteDirectorio, RUTA_MANIFIESTO
+from almacen_resultados import AlmacenResultados, TAMANO_PAGINA_POR_DEFECTO
+from indice_nombres import IndiceNombres, MAX_RESULTADOS, SIMILITUD_MINIMA
+from analitica_corpus import AnaliticaCorpus, INTERVALO_INSTANTANEAS_MS, MAX_ETIQUETAS_INSTANTANEA
+from envio_archivos import EnvioArchivo, TrabajoEnvio, MAX_ENVIOS_POR_CLIENTE
+from servidor import COLUMNAS_ORDENADAS, REGISTRO_PATRONES, MENSAJE_EXTRACCION_CANCELADA, es_error_reportable
+from conjuntos_patrones import ErrorConjuntoPatrones
+from ajuste_concurrencia import MODO_AUTO
+from coordinador_nodos import MODO_DISTRIBUIDO, NodoRemoto
+from protocolo_ws import MAX_BYTES_DESCOMPRIMIDOS, PROTOCOLO_POR_DEFECTO, MensajeInvalido, codificar_mensaje, decodificar_mensaje, protocolos_ofrecidos, validar_protocolo
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
@@ -12,6 +28,60 @@ CLIENT_CONFIGS = {} # CLIENT_CONFIGS es un diccionario que almacena la configura
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # BASE_DIR es el directorio base del script actual.
 SCRIPT_SERVIDOR_PY = os.path.join(BASE_DIR, "servidor.py") # SCRIPT_SERVIDOR_PY es la ruta al script servidor.py que se ejecutará para procesar archivos CSV.
 TEXT_FILES_DIR = os.path.join(os.path.dirname(BASE_DIR), "english_text_files") # TEXT_FILES_DIR es el directorio donde se almacenan los archivos de texto por defecto.
+UPLOADS_DIR = os.path.join(os.path.dirname(BASE_DIR), "uploaded_files_from_client") # UPLOADS_DIR es donde server_http_upload.js guarda las subidas de los clientes.
+HOST_SERVIDOR = "localhost" # HOST_SERVIDOR es la dirección en la que escucha el WebSocket (--host; "0.0.0.0" para aceptar nodos de otras máquinas).
+PUERTO_SERVIDOR = 8765 # PUERTO_SERVIDOR es el puerto del WebSocket (--puerto).
+VARIABLE_TOKEN_NODOS = "TOKEN_NODOS_EXTRACCION" # Variable de entorno con el token compartido de los nodos de extracción.
+TOKEN_NODOS = os.environ.get(VARIABLE_TOKEN_NODOS) or None # TOKEN_NODOS es el token que registrar_nodo debe presentar (--token-nodos); sin él solo se aceptan nodos locales.
+USAR_POOL_PERSISTENTE = True # Si es False, cada solicitud lanza un subprocess de servidor.py (comportamiento anterior).
+POOL_EXTRACCION = None # POOL_EXTRACCION es el pool de workers de extracción precalentado que se crea en main().
+PLANIFICADOR = None # PLANIFICADOR es la cola central de trabajos (presupuesto global y reparto justo entre clientes) que se crea en main().
+INCREMENTAL_POR_DEFECTO = False # Si es True, todas las solicitudes extraen solo los archivos nuevos o cambiados (ver manifiesto_incremental.py).
+VIGILAR_SUBIDAS = False # Si es True, main() arranca el vigilante de UPLOADS_DIR (también con el comando 'watch on').
+VIGILANTE = None # VIGILANTE extrae al manifiesto las subidas nuevas sin esperar una solicitud (requiere el pool persistente).
+GUARDAR_RESULTADOS = True # Si es True, las filas extraídas se guardan en la base SQLite de almacen_resultados.py (mensaje consultar_resultados).
+ALMACEN = None # ALMACEN es la base de resultados que se crea en main() si GUARDAR_RESULTADOS.
+INDEXAR_NOMBRES = True # Si es True, los nombres de personas de las filas extraídas se indexan para el mensaje buscar_nombre.
+INDICE_NOMBRES = None # INDICE_NOMBRES es el índice de trigramas de indice_nombres.py; main() lo crea con las filas del ALMACEN.
+MAX_LIMITE_BUSQUEDA_NOMBRES = 100 # Máximo de resultados que un cliente puede pedir en buscar_nombre.
+ANALIZAR_CORPUS = True # Si es True, las filas extraídas se suman a los agregados de analitica_corpus.py (mensajes suscribir_analitica y consultar_analitica).
+ANALITICA = None # ANALITICA son los agregados del corpus; main() los crea con las filas del ALMACEN.
+SUSCRIPTORES_ANALITICA = {} # SUSCRIPTORES_ANALITICA guarda, por websocket suscrito, cuántas etiquetas pide por agregado.
+MAX_ETIQUETAS_ANALITICA = 200 # Máximo de etiquetas por agregado que un cliente puede pedir.
+COMPRESION_TRANSPORTE = True # Si es True, se ofrece permessage-deflate en el handshake HTTP (ver protocolo_ws.py).
+PERFILAR_PATRONES = False # Si es True, todas las solicitudes miden el coste de cada columna de PATRONES (comando 'profile on').
+PERFIL_PATRONES = PerfilPatrones() # PERFIL_PATRONES acumula los perfiles de los trabajos perfilados (comando 'profile').
+METRICAS = MetricasServidor() # METRICAS registra las métricas operativas (comando 'stats' y http://localhost:8766/metrics).
+METRICAS.registrar_medidor("active_jobs", "Trabajos en ejecución.", lambda: len(PLANIFICADOR.en_ejecucion) if PLANIFICADOR else 0)
+METRICAS.registrar_medidor("queue_depth", "Trabajos esperando en la cola del planificador.", lambda: len(PLANIFICADOR.pendientes) if PLANIFICADOR else 0)
+METRICAS.registrar_medidor("workers_in_use", "Workers del presupuesto global ocupados.", lambda: PLANIFICADOR.workers_en_uso if PLANIFICADOR else 0)
+METRICAS.registrar_medidor("jobs_rejected", "Solicitudes rechazadas por la cola desde el arranque.", lambda: PLANIFICADOR.estadisticas["rechazados"] if PLANIFICADOR else 0)
+METRICAS.registrar_medidor("jobs_cancelled", "Trabajos cancelados (por el cliente o al desconectarse) desde el arranque.", lambda: PLANIFICADOR.estadisticas["cancelados"] if PLANIFICADOR else 0)
+METRICAS.registrar_medidor("jobs_failed", "Trabajos que terminaron con un error del planificador desde el arranque.", lambda: PLANIFICADOR.estadisticas["fallidos"] if PLANIFICADOR else 0)
+METRICAS.registrar_medidor("connected_clients", "Clientes WebSocket conectados.", lambda: len(CLIENTS))
+METRICAS.registrar_medidor("indexed_names", "Nombres distintos en el índice de búsqueda.", lambda: INDICE_NOMBRES.num_nombres() if INDICE_NOMBRES else 0)
+METRICAS.registrar_medidor("analytics_documents", "Documentos sumados a los agregados del corpus.", lambda: ANALITICA.num_documentos() if ANALITICA else 0)
+METRICAS.registrar_medidor("analytics_subscribers", "Clientes suscritos a las instantáneas de los agregados del corpus.", lambda: len(SUSCRIPTORES_ANALITICA))
+METRICAS.registrar_medidor("worker_nodes", "Nodos de extracción vivos (el local y los remotos registrados).", lambda: len(coordinador_nodos().nodos) if coordinador_nodos() else 0)
+METRICAS.registrar_medidor("cluster_capacity", "Workers de todos los nodos de extracción vivos.", lambda: coordinador_nodos().limite if coordinador_nodos() else 0)
+MAX_CARACTERES_CAMPO_LOG = 200 # Los campos más largos de un mensaje recibido se resumen en el log en lugar de volcarse.
+ENTREGA_POR_DEFECTO = {"modo": "filas", "max_filas": MAX_FILAS_LOTE, "intervalo_ms": INTERVALO_LOTE_MS} # Modo de entrega de filas si el cliente no pide otro.
+
+# resumen_para_log() retorna los campos de un mensaje recibido para el log sin convertir a texto los grandes (bloques
+# de enviar_archivo_*, listas de rutas, valores de resultado_tarea): solo se indica su tamaño.
+def resumen_para_log(data):
+    def corto(valor):
+        return not isinstance(valor, (str, bytes, list, tuple, dict)) or (
+            isinstance(valor, (str, bytes)) and len(valor) < MAX_CARACTERES_CAMPO_LOG
+        )
+    resumen = {}
+    for clave, valor in data.items():
+        if corto(valor) or (isinstance(valor, (list, tuple, dict)) and len(valor) <= 10
+                              and all(map(corto, valor.values() if isinstance(valor, dict) else valor))):
+            resumen[clave] = valor
+        else:
+            resumen[clave] = f"<{type(valor).__name__} de {len(valor)}>"
+    return resumen
 
 # get_client_id_from_websocket es una función auxiliar para obtener el ID del cliente desde el websocket.
 #Parametros: websocket que es el objeto websocket del cliente, devuelve el ID del cliente como una cadena.
@@ -32,17 +102,33 @@ async def enviar_mensaje(websocket, tipo_mensaje, data=None, mensaje_texto=None)
         payload["mensaje"] = mensaje_texto
     
     client_id_for_log = get_client_id_from_websocket(websocket)
+    mensaje = codificar_mensaje(payload, protocolo_de(websocket))
+    # Filas que lleva el mensaje, para las filas/s por cliente de METRICAS.
+    filas = 1 if tipo_mensaje == "csv_actualizacion_fila" else len(payload.get("filas", ())) if tipo_mensaje == "csv_lote_filas" else 0
 
     try:
-        await websocket.send(json.dumps(payload))
+        t0 = time.perf_counter()
+        await websocket.send(mensaje)
+        METRICAS.registrar_envio(client_id_for_log, filas, len(mensaje), time.perf_counter() - t0)
     except websockets.exceptions.ConnectionClosed:
+        METRICAS.registrar_envio_perdido("connection_closed")
         logging.warning(
             f"Intento de envío a conexión WS ya cerrada para cliente {client_id_for_log} ({websocket.remote_address}). Tipo: {tipo_mensaje}"
         )
     except Exception as e:
+        METRICAS.registrar_envio_perdido("error")
         logging.error(
             f"Error enviando mensaje por WS a {client_id_for_log} ({websocket.remote_address}): {e}. Tipo: {tipo_mensaje}"
         )
+#protocolo_de es una función auxiliar que retorna el protocolo negociado por el cliente (None si usa el de por defecto).
+#Parametros: websocket que es el objeto websocket del cliente.
+def protocolo_de(websocket):
+    return CLIENT_CONFIGS.get(get_client_id_from_websocket(websocket), {}).get("protocolo")
+
+#usa_permessage_deflate indica si la conexión negoció la extensión permessage-deflate en el handshake HTTP.
+def usa_permessage_deflate(websocket):
+    return any(getattr(extension, "name", None) == "permessage-deflate" for extension in getattr(websocket, "extensions", None) or ())
+
 #broadcast_mensaje es una función que envía un mensaje a todos los clientes conectados.
 #Parametros: tipo_mensaje que es el tipo de mensaje a enviar, data que es la información adicional a enviar y mensaje_texto que es el texto del mensaje.
 async def broadcast_mensaje(tipo_mensaje, data=None, mensaje_texto=None):
@@ -70,11 +156,36 @@ async def procesar_archivos_via_script(
     directorio_default_si_lista_vacia,
     num_workers,
     concurrency_mode,
+    entrega=None,
+    politica_despacho=POLITICA_POR_DEFECTO,
+    perfilar_patrones=False,
+    incremental=False,
+    cancelado=None,
+    patrones=None,
 ):
     python_executable = sys.executable  # Obtiene la ruta del intérprete de Python actual
     comando_python = [python_executable, "-u", SCRIPT_SERVIDOR_PY]
     comando_python.extend(["--client-id", id_cliente_ws_str])
     comando_python.extend(["--concurrency-mode", concurrency_mode])
+    comando_python.extend(["--dispatch-policy", politica_despacho])
+    if perfilar_patrones:
+        comando_python.append("--profile-patterns")
+    if incremental:
+        comando_python.extend(["--manifest", RUTA_MANIFIESTO])
+    if ALMACEN is not None:
+        comando_python.extend(["--store", ALMACEN.ruta])
+    if patrones is not None:
+        # La versión fijada al encolar el trabajo; con su huella, el script no la usa si el archivo cambió.
+        comando_python.extend(["--pattern-version", patrones[0], "--pattern-fingerprint", patrones[1]])
+
+    # emitir es el destino de los mensajes para el cliente; en modo "lotes" se envuelve con un LoteadorFilasWebsocket
+    # cuando el script envía su esquema (csv_schema).
+    emitir = functools.partial(enviar_mensaje, websocket_cliente)
+    entrega_por_lotes = bool(entrega) and entrega.get("modo") == "lotes"
+    if entrega_por_lotes:
+        comando_python.extend(["--output-format", "batch"])
+        comando_python.extend(["--batch-size", str(entrega.get("max_filas", MAX_FILAS_LOTE))])
+        comando_python.extend(["--batch-interval-ms", str(entrega.get("intervalo_ms", INTERVALO_LOTE_MS))])
 
     if num_workers is not None and num_workers > 0:
         comando_python.extend(["--workers", str(num_workers)])
@@ -102,13 +213,21 @@ async def procesar_archivos_via_script(
 
     logging.info(f"Ejecutando para cliente {id_cliente_ws_str}: {' '.join(comando_python)}")
     script_completed_gracefully = False
+    resumen_script = None  # Sumario de processing_complete; es el resultado del trabajo para el planificador.
+    proceso = None
+    vigilante_cancelacion = None
+    filas_entregadas = 0
     
     try:
         proceso = await asyncio.create_subprocess_exec(
             *comando_python,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            start_new_session=os.name == "posix",  # Grupo propio: al cancelar se terminan también sus workers.
         )
+        METRICAS.subprocesos_vivos += 1
+        if cancelado is not None:
+            vigilante_cancelacion = asyncio.ensure_future(terminar_al_cancelar(proceso, cancelado, id_cliente_ws_str))
 
         if proceso.stdout:
             async for linea_bytes in proceso.stdout:
@@ -128,23 +247,46 @@ async def procesar_archivos_via_script(
                         continue
 
                     if msg_type_from_script == "csv_data_row" and "data" in mensaje_stdout:
-                        await enviar_mensaje(
-                            websocket_cliente,
+                        if INDICE_NOMBRES is not None:
+                            INDICE_NOMBRES.agregar_fila(mensaje_stdout["data"], mensaje_stdout.get("path"))
+                        if ANALITICA is not None:
+                            ANALITICA.agregar_fila(mensaje_stdout["data"], mensaje_stdout.get("path"))
+                        filas_entregadas += 1
+                        await emitir(
                             "csv_actualizacion_fila",
                             {"fila_csv": mensaje_stdout["data"]},
                         )
+                    elif msg_type_from_script == "csv_schema" and entrega_por_lotes:
+                        columnas_lote = mensaje_stdout.get("columns", [])
+                        emitir = LoteadorFilasWebsocket(
+                            emitir,
+                            mensaje_stdout.get("columns", []),
+                            entrega.get("max_filas", MAX_FILAS_LOTE),
+                            entrega.get("intervalo_ms", INTERVALO_LOTE_MS),
+                        )
+                        await emitir.enviar_esquema()
+                    elif msg_type_from_script == "csv_rows_batch" and isinstance(emitir, LoteadorFilasWebsocket):
+                        # Las filas ya vienen compactas desde servidor.py: se reenvían sin expandirlas (solo el índice
+                        # de nombres y los agregados del corpus necesitan la fila completa).
+                        if INDICE_NOMBRES is not None or ANALITICA is not None:
+                            filas_lote = mensaje_stdout.get("rows", [])
+                            rutas_lote = mensaje_stdout.get("paths") or [None] * len(filas_lote)
+                            for fila_compacta, ruta_fila in zip(filas_lote, rutas_lote):
+                                fila_completa = expandir_fila(fila_compacta, columnas_lote)
+                                if INDICE_NOMBRES is not None:
+                                    INDICE_NOMBRES.agregar_fila(fila_completa, ruta_fila)
+                                if ANALITICA is not None:
+                                    ANALITICA.agregar_fila(fila_completa, ruta_fila)
+                        filas_entregadas += len(mensaje_stdout.get("rows", []))
+                        await emitir.agregar_compactas(mensaje_stdout.get("rows", []))
                     elif msg_type_from_script == "progress_message" and "message" in mensaje_stdout:
-                        await enviar_mensaje(
-                            websocket_cliente,
+                        await emitir(
                             "progreso_procesamiento_info",
                             mensaje_texto=mensaje_stdout["message"],
                         )
                     elif msg_type_from_script == "processing_complete":
-                        await enviar_mensaje(
-                            websocket_cliente,
-                            "procesamiento_csv_terminado",
-                            data=mensaje_stdout.get("summary", {"status": "completado desde script"}),
-                        )
+                        resumen_script = mensaje_stdout.get("summary", {"status": "completado desde script"})
+                        await emitir("procesamiento_csv_terminado", data=resumen_script)
                         logging.info(
                             f"Procesamiento de CSV (reportado por script) completado para cliente {id_cliente_ws_str}."
                         )
@@ -155,6 +297,8 @@ async def procesar_archivos_via_script(
                     logging.error(f"Error procesando stdout JSON de servidor.py: {e_json} - Linea: {linea}")
         
         await proceso.wait()
+        if isinstance(emitir, LoteadorFilasWebsocket):
+            await emitir.vaciar()
         
         stderr_final_bytes = b""
         if proceso.stderr:
@@ -169,7 +313,12 @@ async def procesar_archivos_via_script(
                 mensaje_texto=f"Mensajes del script (stderr): {stderr_decoded[:300]}...",
             )
 
-        if proceso.returncode != 0:
+        if cancelado is not None and cancelado.is_set() and not script_completed_gracefully:
+            # Las filas que el script ya había emitido se entregaron; el resto del trabajo no se extrae.
+            logging.info(f"Script servidor.py cancelado para {id_cliente_ws_str} tras {filas_entregadas} fila(s).")
+            resumen_script = {"status": "cancelled", "rows_delivered": filas_entregadas}
+            await enviar_mensaje(websocket_cliente, "procesamiento_csv_terminado", data=resumen_script)
+        elif proceso.returncode != 0:
             logging.error(f"Script servidor.py falló para {id_cliente_ws_str}. Código: {proceso.returncode}")
             if not script_completed_gracefully:
                 await enviar_mensaje(
@@ -177,21 +326,15 @@ async def procesar_archivos_via_script(
                     "error_servidor",
                     mensaje_texto=f"El script de procesamiento falló (código: {proceso.returncode}). Detalles en log del servidor.",
                 )
-                await enviar_mensaje(
-                    websocket_cliente,
-                    "procesamiento_csv_terminado",
-                    data={"status": "fallido_script", "error_code": proceso.returncode},
-                )
+                resumen_script = {"status": "fallido_script", "error_code": proceso.returncode}
+                await enviar_mensaje(websocket_cliente, "procesamiento_csv_terminado", data=resumen_script)
         elif not script_completed_gracefully:
             logging.warning(
                 f"Script servidor.py terminó con código 0 para {id_cliente_ws_str} "
                 f"pero no envió mensaje 'processing_complete'."
             )
-            await enviar_mensaje(
-                websocket_cliente,
-                "procesamiento_csv_terminado",
-                data={"status": "completado_inesperado"},
-            )
+            resumen_script = {"status": "completado_inesperado"}
+            await enviar_mensaje(websocket_cliente, "procesamiento_csv_terminado", data=resumen_script)
 
     except FileNotFoundError:
         msg = f"Error: El script '{SCRIPT_SERVIDOR_PY}' no fue encontrado en la ruta esperada."
@@ -204,22 +347,308 @@ async def procesar_archivos_via_script(
             "error_servidor",
             mensaje_texto=f"Error crítico al manejar el script de procesamiento: {str(e)}",
         )
+    finally:
+        if vigilante_cancelacion is not None:
+            vigilante_cancelacion.cancel()
+        if proceso is not None:
+            METRICAS.subprocesos_vivos -= 1
+    return resumen_script
+
+# terminar_al_cancelar() espera a que se cancele el trabajo y entonces termina su subprocess de servidor.py; en POSIX
+# a todo su grupo de procesos, para que los workers de su ProcessPoolExecutor no sigan ocupando núcleos.
+#Parametros: proceso que es el subprocess, cancelado que es el asyncio.Event del trabajo, id_cliente para el log.
+async def terminar_al_cancelar(proceso, cancelado, id_cliente):
+    await cancelado.wait()
+    if proceso.returncode is not None:
+        return
+    logging.info(f"Terminando el script servidor.py (pid {proceso.pid}) del cliente {id_cliente} por cancelación.")
+    try:
+        if os.name == "posix":
+            os.killpg(proceso.pid, signal.SIGTERM)
+        else:
+            proceso.terminate()
+    except ProcessLookupError:
+        pass  # Ya había terminado.
+# ejecutar_trabajo_medido() ejecuta un trabajo ya despachado por el planificador y registra en METRICAS su duración,
+# su espera en cola y su estado (y su perfil de patrones, si lo trae).
+#Parametros: ejecutar que es la corutina del backend, backend ("persistent_pool" o "subprocess") y el trabajo.
+async def ejecutar_trabajo_medido(ejecutar, backend, trabajo):
+    inicio = time.perf_counter()
+    resumen, status = None, "fallido_planificador"
+    try:
+        resumen = await ejecutar(trabajo)
+        status = resumen.get("status", "desconocido") if isinstance(resumen, dict) else "sin_resumen"
+        return resumen
+    except asyncio.CancelledError:
+        status = "cancelado"
+        raise
+    finally:
+        METRICAS.registrar_trabajo(
+            trabajo.id_cliente, backend, time.perf_counter() - inicio, inicio - trabajo.encolado_en, status, trabajo.costo_estimado
+        )
+        acumular_perfil_patrones(trabajo.id_cliente, resumen)
+
+# acumular_perfil_patrones() suma el pattern_profile del sumario de un trabajo al perfil global de la CLI.
+#Parametros: id_cliente para el log, resumen que es el sumario del trabajo (o None si falló antes de terminar).
+def acumular_perfil_patrones(id_cliente, resumen):
+    if not isinstance(resumen, dict) or not resumen.get("pattern_profile"):
+        return
+    PERFIL_PATRONES.fusionar_resumen(resumen["pattern_profile"])
+    columnas = resumen["pattern_profile"].get("columns", [])
+    if columnas:
+        logging.info(
+            f"Perfil de patrones del trabajo de {id_cliente}: columna más costosa '{columnas[0]['column']}' "
+            f"({columnas[0]['seconds']}s de {resumen['pattern_profile'].get('total_seconds')}s)."
+        )
+
+# atender_envio_archivo() maneja los mensajes enviar_archivo_inicio/bloque/fin de un cliente (ver envio_archivos.py):
+# los bytes se extraen mientras llegan y al terminar se encola un TrabajoEnvio en el planificador, que responde
+# resultado_envio_archivo con la fila (sin esperarlo aquí: el cliente puede seguir enviando mensajes, p.ej. cancelar).
+#Parametros: websocket y client_id_str del cliente, envios que es el dict id_envio -> EnvioArchivo de su conexión
+#(un envío sigue ahí hasta que se responde su resultado), tipo_mensaje y data que es el mensaje recibido.
+async def atender_envio_archivo(websocket, client_id_str, envios, tipo_mensaje, data):
+    id_envio = data.get("id_envio")
+    if not isinstance(id_envio, str) or not id_envio:
+        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="Envío inválido: 'id_envio' debe ser un texto no vacío.")
+        return
+    if tipo_mensaje == "enviar_archivo_inicio":
+        nombre = data.get("nombre")
+        if id_envio in envios:
+            await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío inválido: ya hay un envío '{id_envio}' en curso.")
+            return
+        if len(envios) >= MAX_ENVIOS_POR_CLIENTE:
+            await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío rechazado: máximo {MAX_ENVIOS_POR_CLIENTE} envíos simultáneos por cliente.")
+            return
+        if not isinstance(nombre, str) or not nombre.strip():
+            await enviar_mensaje(websocket, "error_servidor", mensaje_texto="Envío inválido: 'nombre' debe ser un texto no vacío.")
+            return
+        try:
+            patrones = patrones_pedidos(data)
+        except ErrorConjuntoPatrones as e_patrones:
+            await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío rechazado: {e_patrones}")
+            return
+        envios[id_envio] = EnvioArchivo(nombre, patrones=patrones, planificador=PLANIFICADOR)
+    elif id_envio not in envios:
+        await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío inválido: no hay ningún envío '{id_envio}' en curso.")
+        return
+    elif envios[id_envio].terminando:
+        await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío inválido: el envío '{id_envio}' ya terminó de llegar.")
+        return
+    envio = envios[id_envio]
+
+    datos = data.get("datos")
+    if datos is not None:
+        try:
+            if isinstance(datos, str):
+                datos = base64.b64decode(datos, validate=True)
+            elif not isinstance(datos, bytes):
+                raise ValueError("'datos' debe ser base64 (JSON) o bytes (MessagePack).")
+            await envio.agregar(datos)
+        except ValueError as e_datos:
+            envios.pop(id_envio).abortar()
+            await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío '{id_envio}' descartado: {e_datos}")
+            return
+
+    if tipo_mensaje == "enviar_archivo_fin" or data.get("fin") is True:
+        envio.terminando = True
+        trabajo = TrabajoEnvio(client_id_str, id_envio, envio, functools.partial(enviar_mensaje, websocket))
+        ejecutar = functools.partial(terminar_envio_archivo, websocket, client_id_str, envios)
+        if envio.en_streaming or PLANIFICADOR is None:
+            # Su thread ya ocupa un worker del presupuesto (ver EnvioArchivo): el final no espera turno en la cola.
+            asyncio.ensure_future(ejecutar(trabajo))
+            return
+        try:
+            await PLANIFICADOR.encolar(trabajo, functools.partial(ejecutar_trabajo_medido, ejecutar, "websocket_file"))
+        except AdmisionRechazada as e_admision:
+            envios.pop(id_envio, None)
+            envio.abortar()
+            await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Envío '{id_envio}' rechazado: {e_admision}")
+
+# terminar_envio_archivo() es la ejecución de un TrabajoEnvio: extrae lo que falte del envío (en el pool de threads),
+# guarda la fila y responde resultado_envio_archivo. Un envío abortado mientras tanto no responde nada.
+#Parametros: websocket, client_id_str y envios como en atender_envio_archivo(), trabajo que es el TrabajoEnvio.
+async def terminar_envio_archivo(websocket, client_id_str, envios, trabajo):
+    envio, id_envio = trabajo.envio, trabajo.id_envio
+    t0 = time.perf_counter()
+    try:
+        executor = POOL_EXTRACCION.executors.get("thread") if POOL_EXTRACCION is not None else None
+        resultado, mensaje_error = await envio.terminar(executor)
+    finally:
+        if envios.get(id_envio) is envio:
+            del envios[id_envio]
+    if mensaje_error == MENSAJE_EXTRACCION_CANCELADA:
+        logging.info(f"Envío '{envio.nombre}' del cliente {client_id_str} descartado durante la extracción.")
+        return {"status": "cancelled"}
+    fila = resultado.a_fila(COLUMNAS_ORDENADAS)
+    if not es_error_reportable(mensaje_error):
+        clave_archivo = envio.clave()  # Sin ruta: hash del contenido y nombre.
+        if ALMACEN is not None:
+            ALMACEN.agregar(fila, clave_archivo)
+        if INDICE_NOMBRES is not None:
+            INDICE_NOMBRES.agregar_fila(fila, clave_archivo)
+        if ANALITICA is not None:
+            ANALITICA.agregar_fila(fila, clave_archivo)
+    logging.info(f"Archivo enviado '{envio.nombre}' ({envio.bytes_recibidos} bytes) extraído para el cliente {client_id_str}.")
+    await enviar_mensaje(websocket, "resultado_envio_archivo", {
+        "id_envio": id_envio,
+        "fila_csv": fila,
+        "error": None if mensaje_error == "None" else mensaje_error,
+        "bytes": envio.bytes_recibidos,
+        "duracion_ms": round((time.perf_counter() - t0) * 1000, 2),
+    })
+    return {"status": "completed" if not es_error_reportable(mensaje_error) else "completed_with_errors"}
+
+# patrones_pedidos() retorna la clave (versión, huella) de la versión de patrones que fija un mensaje con
+# "version_patrones", o None (la versión activa) si no la fija. Lanza ErrorConjuntoPatrones si la versión no está
+# cargada (ver el comando 'patterns reload').
+def patrones_pedidos(data):
+    version = data.get("version_patrones")
+    if version is None:
+        return None
+    cargadas = REGISTRO_PATRONES.versiones_cargadas()
+    if version not in cargadas:
+        raise ErrorConjuntoPatrones(f"versión de patrones desconocida: {version!r} (cargadas: {', '.join(cargadas)}).")
+    return REGISTRO_PATRONES.obtener((version, None)).clave
+
+# activar_version_patrones() activa una versión de los patrones para los trabajos nuevos (los encolados o en curso
+# siguen con la suya), pasa el manifiesto del pool a ella y la compila en los workers del pool.
+#Parametros: version que es el nombre de la versión (patrones/<versión>.json). Retorna el ConjuntoPatrones activado.
+async def activar_version_patrones(version):
+    conjunto = await asyncio.get_running_loop().run_in_executor(None, REGISTRO_PATRONES.activar, version)
+    if POOL_EXTRACCION is not None:
+        if POOL_EXTRACCION.manifiesto is not None:
+            POOL_EXTRACCION.manifiesto.cambiar_huella(conjunto.huella)
+        workers = await POOL_EXTRACCION.precalentar_patrones(conjunto.clave)
+        logging.info(f"Patrones '{conjunto.version}' ({conjunto.huella}) activados y compilados en {workers} worker(s) del pool.")
+    return conjunto
+
+# max_etiquetas_pedidas() retorna el max_etiquetas válido de un mensaje de analítica (o el de por defecto), o None si no es válido.
+def max_etiquetas_pedidas(data):
+    max_etiquetas = data.get("max_etiquetas", MAX_ETIQUETAS_INSTANTANEA)
+    if not isinstance(max_etiquetas, int) or isinstance(max_etiquetas, bool) or not 1 <= max_etiquetas <= MAX_ETIQUETAS_ANALITICA:
+        return None
+    return max_etiquetas
+
+# emitir_analitica_periodicamente() envía cada INTERVALO_INSTANTANEAS_MS una instantánea de ANALITICA a los suscriptores
+# que aún no tienen la versión actual; se calcula una sola instantánea por cada max_etiquetas distinto.
+async def emitir_analitica_periodicamente():
+    while True:
+        await asyncio.sleep(INTERVALO_INSTANTANEAS_MS / 1000)
+        if ANALITICA is None or not SUSCRIPTORES_ANALITICA:
+            continue
+        instantaneas = {}
+        envios_pendientes = []
+        for ws_suscrito, suscripcion in list(SUSCRIPTORES_ANALITICA.items()):
+            if suscripcion["version"] == ANALITICA.version:
+                continue
+            max_etiquetas = suscripcion["max_etiquetas"]
+            if max_etiquetas not in instantaneas:
+                instantaneas[max_etiquetas] = ANALITICA.instantanea(max_etiquetas)
+            suscripcion["version"] = ANALITICA.version
+            envios_pendientes.append(enviar_mensaje(ws_suscrito, "analitica_corpus", instantaneas[max_etiquetas]))
+        if envios_pendientes:
+            await asyncio.gather(*envios_pendientes, return_exceptions=True)
+
+# descartar_mensaje() es el emitir de los trabajos del vigilante: no hay ningún cliente esperando sus filas.
+async def descartar_mensaje(tipo_mensaje, data=None, mensaje_texto=None):
+    pass
+
+# procesar_subidas_vigiladas() encola en el pool, como un trabajo incremental más, las subidas nuevas que detecta
+# VIGILANTE y espera a que termine; las filas quedan en el manifiesto para la próxima solicitud incremental.
+#Parametros: rutas que es la lista de archivos nuevos o cambiados.
+async def procesar_subidas_vigiladas(rutas):
+    trabajo = TrabajoExtraccion("vigilante", rutas, None, 1, "process", descartar_mensaje, incremental=True)
+    try:
+        await PLANIFICADOR.encolar(trabajo, functools.partial(ejecutar_trabajo_medido, POOL_EXTRACCION.ejecutar_trabajo, "persistent_pool"))
+    except AdmisionRechazada as e_admision:
+        logging.warning(f"Vigilante: trabajo rechazado por el planificador ({e_admision}); se reintentará en el próximo sondeo.")
+        return
+    try:
+        resumen = await trabajo.terminado
+    except asyncio.CancelledError:
+        if not trabajo.terminado.cancelled():
+            raise  # Se canceló el vigilante, no el trabajo.
+        return
+    logging.info(f"Vigilante: {len(rutas)} subida(s) extraída(s) al manifiesto: {resumen.get('incremental')}")
+
+# coordinador_nodos() retorna el CoordinadorNodos del pool persistente, o None si no hay pool o coordinador.
+def coordinador_nodos():
+    return POOL_EXTRACCION.coordinador if POOL_EXTRACCION is not None else None
+
+# es_conexion_local() indica si el websocket viene de la propia máquina (loopback).
+def es_conexion_local(websocket):
+    direccion = websocket.remote_address
+    try:
+        return ipaddress.ip_address((direccion[0] if isinstance(direccion, tuple) else direccion).split("%")[0]).is_loopback
+    except (TypeError, ValueError, IndexError):
+        return False
+
+# nodo_autorizado() comprueba el token de registrar_nodo: con TOKEN_NODOS configurado tiene que coincidir; sin él, solo
+# se aceptan nodos que se conectan desde la propia máquina.
+def nodo_autorizado(websocket, data):
+    if TOKEN_NODOS is None:
+        return es_conexion_local(websocket)
+    token = data.get("token")
+    return isinstance(token, str) and hmac.compare_digest(token.encode("utf-8"), TOKEN_NODOS.encode("utf-8"))
+
+# registrar_nodo_remoto() da de alta como nodo de extracción (ver nodo_extraccion.py) la conexión que envió registrar_nodo.
+async def registrar_nodo_remoto(websocket, client_id_str, data):
+    coordinador = coordinador_nodos()
+    capacidad = data.get("capacidad")
+    if coordinador is None:
+        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="El servidor no acepta nodos de extracción (requiere el pool persistente).")
+        return
+    if not nodo_autorizado(websocket, data):
+        # Un nodo recibe el contenido de los archivos y decide sus filas: sin el token no se le reparte nada.
+        logging.warning(f"registrar_nodo rechazado para {client_id_str} ({websocket.remote_address}): token de nodo ausente o incorrecto.")
+        await enviar_mensaje(
+            websocket, "error_servidor", {"status": "error_node_auth"},
+            mensaje_texto="registrar_nodo rechazado: token de nodo ausente o incorrecto." if TOKEN_NODOS is not None
+            else f"registrar_nodo rechazado: el servidor no tiene token de nodos ({VARIABLE_TOKEN_NODOS} o --token-nodos) y solo acepta nodos locales.",
+        )
+        return
+    if not isinstance(capacidad, int) or isinstance(capacidad, bool) or capacidad <= 0:
+        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="registrar_nodo inválido: capacidad debe ser un entero >0.")
+        return
+    nodo = NodoRemoto(
+        client_id_str,
+        capacidad,
+        functools.partial(enviar_mensaje, websocket),
+        # Con MessagePack el contenido de los archivos viaja en binario; con JSON, en base64.
+        acepta_bytes=lambda: (protocolo_de(websocket) or PROTOCOLO_POR_DEFECTO)["codificacion"] == "msgpack",
+        comparte_disco=data.get("comparte_disco") is True,
+        nombre=str(data.get("nombre") or client_id_str),
+    )
+    coordinador.registrar(nodo)
+    await enviar_mensaje(
+        websocket,
+        "confirmacion_registro_nodo",
+        {"id_nodo": client_id_str, "capacidad": capacidad, "capacidad_total": coordinador.limite},
+    )
+
 # manejar_cliente es una función que maneja la conexión de un cliente WebSocket.
 #Parametros: websocket que es el objeto websocket del cliente.
 async def manejar_cliente(websocket): 
     client_id_str = get_client_id_str(websocket)
     CLIENTS[websocket] = {"id": client_id_str, "ws": websocket} # Guardar también el objeto ws para referencia si es útil
-    CLIENT_CONFIGS[client_id_str] = {"threads": 1, "concurrency_mode": "thread"} 
+    CLIENT_CONFIGS[client_id_str] = {"threads": None, "concurrency_mode": MODO_AUTO, "entrega": dict(ENTREGA_POR_DEFECTO), "politica_despacho": POLITICA_POR_DEFECTO,
+                                     "protocolo": dict(PROTOCOLO_POR_DEFECTO)}
     logging.info(f"Cliente conectado: {client_id_str} ({websocket.remote_address})")
+    envios = {}  # Archivos que el cliente está enviando por el WebSocket: id_envio -> EnvioArchivo.
 
     try:
-        await enviar_mensaje(websocket, "conexion_establecida", mensaje_texto="Conexión WebSocket establecida con el servidor.")
+        await enviar_mensaje(
+            websocket,
+            "conexion_establecida",
+            {"protocolos": protocolos_ofrecidos(), "permessage_deflate": usa_permessage_deflate(websocket)},
+            mensaje_texto="Conexión WebSocket establecida con el servidor.",
+        )
         await enviar_mensaje(websocket, "lista_eventos_actualizada", {"eventos": EVENTS})
 
         async for message_str in websocket:
             try:
-                data = json.loads(message_str)
-                logging.info(f"Recibido de {client_id_str}: {data}")
+                data = decodificar_mensaje(message_str)
+                logging.info(f"Recibido de {client_id_str}: {resumen_para_log(data)}")
                 tipo_mensaje = data.get("tipo")
 
                 if tipo_mensaje == "listar_eventos":
@@ -262,31 +691,88 @@ async def manejar_cliente(websocket):
                 elif tipo_mensaje == "configurar_threads_cliente":
                     num_threads = data.get("threads")
                     # Usar el modo actual como default si no se provee uno nuevo
-                    concurrency_mode = data.get("concurrency_mode", CLIENT_CONFIGS[client_id_str].get("concurrency_mode", "thread"))
+                    concurrency_mode = data.get("concurrency_mode", CLIENT_CONFIGS[client_id_str].get("concurrency_mode", MODO_AUTO))
+                    politica_despacho = data.get("politica_despacho", CLIENT_CONFIGS[client_id_str].get("politica_despacho", POLITICA_POR_DEFECTO))
+                    # En modo auto threads es opcional: si se da, es el máximo de workers que el servidor puede elegir.
+                    # En modo distributed el cupo es la capacidad de los nodos de extracción y threads no se usa.
+                    threads_validos = (isinstance(num_threads, int) and num_threads > 0) or (num_threads is None and concurrency_mode in (MODO_AUTO, MODO_DISTRIBUIDO))
 
-                    if isinstance(num_threads, int) and num_threads > 0 and concurrency_mode in ["thread", "process"]:
-                        num_threads = 1 if num_threads > 0 else num_threads
+                    if threads_validos and concurrency_mode in ["thread", "process", MODO_AUTO, MODO_DISTRIBUIDO] and politica_despacho in POLITICAS_DESPACHO:
                         CLIENT_CONFIGS[client_id_str]["threads"] = num_threads
                         CLIENT_CONFIGS[client_id_str]["concurrency_mode"] = concurrency_mode
-                        logging.info(
-                            f"Cliente {client_id_str} configuró concurrencia a: {num_threads} {concurrency_mode}(s)"
-                        )
+                        CLIENT_CONFIGS[client_id_str]["politica_despacho"] = politica_despacho
+                        if concurrency_mode == MODO_AUTO:
+                            descripcion = f"auto, hasta {num_threads} worker(s)" if num_threads else "auto"
+                        elif concurrency_mode == MODO_DISTRIBUIDO:
+                            descripcion = "distribuido entre los nodos de extracción"
+                        else:
+                            descripcion = f"{num_threads} {concurrency_mode}s"
+                        logging.info(f"Cliente {client_id_str} configuró concurrencia a: {descripcion}")
                         await enviar_mensaje(
                             websocket,
                             "confirmacion_config_threads",
                             {
                                 "threads": num_threads,
                                 "concurrency_mode": concurrency_mode,
-                                "mensaje": f"Configuración ({num_threads} {concurrency_mode}s) confirmada.",
+                                "politica_despacho": politica_despacho,
+                                "mensaje": f"Configuración ({descripcion}, despacho {politica_despacho}) confirmada.",
                             },
                         )
                     else:
                         await enviar_mensaje(
                             websocket,
                             "error_servidor",
-                            mensaje_texto=f"Configuración inválida: Threads debe ser número >0, Modo debe ser 'thread' o 'process'.",
+                            mensaje_texto=f"Configuración inválida: Threads debe ser número >0 (opcional en modo 'auto'), Modo debe ser 'thread', 'process', 'auto' o 'distributed', politica_despacho una de {', '.join(POLITICAS_DESPACHO)}.",
                         )
                 
+                elif tipo_mensaje == "configurar_entrega_cliente":
+                    # Modo de entrega de filas: "filas" (un csv_actualizacion_fila por archivo, por defecto) o
+                    # "lotes" (csv_esquema una vez + csv_lote_filas con filas compactas).
+                    modo_entrega = data.get("modo", "filas")
+                    max_filas = data.get("max_filas", MAX_FILAS_LOTE)
+                    intervalo_ms = data.get("intervalo_ms", INTERVALO_LOTE_MS)
+                    if (
+                        modo_entrega in ["filas", "lotes"]
+                        and isinstance(max_filas, int) and max_filas > 0
+                        and isinstance(intervalo_ms, int) and intervalo_ms > 0
+                    ):
+                        CLIENT_CONFIGS[client_id_str]["entrega"] = {
+                            "modo": modo_entrega, "max_filas": max_filas, "intervalo_ms": intervalo_ms,
+                        }
+                        logging.info(f"Cliente {client_id_str} configuró entrega: {CLIENT_CONFIGS[client_id_str]['entrega']}")
+                        await enviar_mensaje(
+                            websocket,
+                            "confirmacion_config_entrega",
+                            dict(CLIENT_CONFIGS[client_id_str]["entrega"]),
+                            mensaje_texto=f"Entrega de filas en modo '{modo_entrega}' confirmada.",
+                        )
+                    else:
+                        await enviar_mensaje(
+                            websocket,
+                            "error_servidor",
+                            mensaje_texto="Configuración de entrega inválida: modo debe ser 'filas' o 'lotes' y max_filas/intervalo_ms enteros >0.",
+                        )
+
+                elif tipo_mensaje == "negociar_protocolo":
+                    # Codificación y compresión de los mensajes siguientes (ver protocolo_ws.py); la confirmación
+                    # todavía sale con el protocolo anterior.
+                    try:
+                        protocolo = validar_protocolo(
+                            data.get("codificacion", PROTOCOLO_POR_DEFECTO["codificacion"]),
+                            data.get("compresion", PROTOCOLO_POR_DEFECTO["compresion"]),
+                        )
+                    except ValueError as e_protocolo:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Protocolo inválido: {e_protocolo}")
+                    else:
+                        await enviar_mensaje(
+                            websocket,
+                            "confirmacion_protocolo",
+                            dict(protocolo),
+                            mensaje_texto=f"Protocolo {protocolo['codificacion']}/{protocolo['compresion']} confirmado.",
+                        )
+                        CLIENT_CONFIGS[client_id_str]["protocolo"] = protocolo
+                        logging.info(f"Cliente {client_id_str} negoció protocolo: {protocolo}")
+
                 elif tipo_mensaje == "notificar_parametros_simulacion_cliente": 
                     params_payload = data.get("payload", {})
                     if params_payload and client_id_str in CLIENT_CONFIGS:
@@ -318,33 +804,198 @@ async def manejar_cliente(websocket):
                 elif tipo_mensaje == "solicitar_procesamiento_csv":
                     lista_rutas_cliente = data.get("rutas_archivos_subidos", [])
                     
-                    client_specific_config = CLIENT_CONFIGS.get(client_id_str, {"threads": 1, "concurrency_mode": "thread"})
-                    num_workers_cliente = client_specific_config.get("threads", 1)
-                    concurrency_mode_cliente = client_specific_config.get("concurrency_mode", "thread")
+                    client_specific_config = CLIENT_CONFIGS.get(client_id_str, {"threads": None, "concurrency_mode": MODO_AUTO})
+                    num_workers_cliente = client_specific_config.get("threads")
+                    concurrency_mode_cliente = client_specific_config.get("concurrency_mode", MODO_AUTO)
+                    entrega_cliente = dict(client_specific_config.get("entrega", ENTREGA_POR_DEFECTO))
+                    if data.get("entrega") in ["filas", "lotes"]:
+                        entrega_cliente["modo"] = data["entrega"]  # Permite elegir el modo solo para esta solicitud.
+                    politica_cliente = client_specific_config.get("politica_despacho", POLITICA_POR_DEFECTO)
+                    if data.get("politica_despacho") in POLITICAS_DESPACHO:
+                        politica_cliente = data["politica_despacho"]  # También se puede elegir solo para esta solicitud.
+                    perfilar_patrones = PERFILAR_PATRONES or data.get("perfilar_patrones") is True
+                    incremental = INCREMENTAL_POR_DEFECTO or data.get("incremental") is True
+                    try:
+                        patrones = patrones_pedidos(data)  # {"version_patrones": "v3"} fija la versión; si no, la activa.
+                    except ErrorConjuntoPatrones as e_patrones:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Solicitud rechazada: {e_patrones}")
+                        await enviar_mensaje(websocket, "procesamiento_csv_terminado", data={"status": "error_pattern_version"})
+                        continue
 
                     logging.info(
                         f"Cliente {client_id_str} solicita procesamiento CSV. "
                         f"Archivos específicos: {len(lista_rutas_cliente) if lista_rutas_cliente else 'NO (usar default)'}. "
-                        f"Workers: {num_workers_cliente}, Modo: {concurrency_mode_cliente}"
+                        f"Workers: {num_workers_cliente}, Modo: {concurrency_mode_cliente}, Despacho: {politica_cliente}"
                     )
                     
+                    trabajo = TrabajoExtraccion(
+                        client_id_str,
+                        lista_rutas_cliente,
+                        TEXT_FILES_DIR if not lista_rutas_cliente else None,
+                        num_workers_cliente,
+                        concurrency_mode_cliente,
+                        functools.partial(enviar_mensaje, websocket),
+                        entrega=entrega_cliente,
+                        politica_despacho=politica_cliente,
+                        perfilar_patrones=perfilar_patrones,
+                        incremental=incremental,
+                        patrones=patrones,
+                    )
+                    usar_pool = USAR_POOL_PERSISTENTE and POOL_EXTRACCION is not None
+                    if usar_pool:
+                        ejecutar = POOL_EXTRACCION.ejecutar_trabajo
+                    else:
+                        # Camino anterior (un subprocess de servidor.py por solicitud), también sujeto al planificador
+                        # para que diez clientes no lancen diez subprocesses a la vez.
+                        async def ejecutar(trabajo, websocket=websocket):
+                            return await procesar_archivos_via_script(
+                                websocket,
+                                trabajo.id_cliente,
+                                trabajo.rutas_archivos,
+                                trabajo.directorio_default,
+                                trabajo.num_workers,
+                                trabajo.concurrency_mode,
+                                trabajo.entrega,
+                                trabajo.politica_despacho,
+                                trabajo.perfilar_patrones,
+                                trabajo.incremental,
+                                trabajo.cancelado,
+                                trabajo.patrones,
+                            )
+                    backend = "persistent_pool" if usar_pool else "subprocess"
+                    try:
+                        # Encolar no bloquea el manejador de mensajes; el planificador ejecuta el trabajo cuando le toca.
+                        await PLANIFICADOR.encolar(trabajo, functools.partial(ejecutar_trabajo_medido, ejecutar, backend))
+                    except AdmisionRechazada as e_admision:
+                        logging.warning(f"Solicitud de {client_id_str} rechazada por el planificador: {e_admision}")
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Solicitud rechazada: {e_admision}")
+                        await enviar_mensaje(websocket, "procesamiento_csv_terminado", data={"status": "rejected_queue_full"})
+                    else:
+                        await enviar_mensaje(
+                            websocket,
+                            "progreso_procesamiento_info",
+                            mensaje_texto=(
+                                "Solicitud de procesamiento CSV recibida. Encolada en el "
+                                + ("pool de extracción..." if usar_pool else "planificador (script servidor.py)...")
+                            ),
+                        )
+
+                elif tipo_mensaje in ("enviar_archivo_inicio", "enviar_archivo_bloque", "enviar_archivo_fin"):
+                    await atender_envio_archivo(websocket, client_id_str, envios, tipo_mensaje, data)
+
+                elif tipo_mensaje == "registrar_nodo":
+                    await registrar_nodo_remoto(websocket, client_id_str, data)
+
+                elif tipo_mensaje == "resultado_tarea":
+                    if coordinador_nodos() is not None:
+                        coordinador_nodos().recibir_resultado(client_id_str, data)
+
+                elif tipo_mensaje == "cancelar_procesamiento":
+                    # Cancela todas las solicitudes del cliente: las encoladas terminan ya y las que se ejecutan
+                    # entregan sus filas parciales y su procesamiento_csv_terminado con status "cancelled".
+                    # También descarta los archivos que estuviera enviando por el WebSocket.
+                    cancelados = await PLANIFICADOR.cancelar_trabajos_de(client_id_str)
+                    cancelados["envios_archivo"] = len(envios)
+                    for envio in envios.values():
+                        envio.abortar()
+                    envios.clear()
                     await enviar_mensaje(
                         websocket,
-                        "progreso_procesamiento_info",
-                        mensaje_texto="Solicitud de procesamiento CSV recibida. Iniciando script...",
+                        "confirmacion_cancelacion",
+                        cancelados,
+                        mensaje_texto=(
+                            f"Cancelación solicitada: {cancelados['en_cola']} solicitud(es) en cola y "
+                            f"{cancelados['en_ejecucion']} en ejecución."
+                        ),
                     )
 
-                    # Crear tarea para que el procesamiento del script no bloquee el manejador de mensajes
-                    asyncio.create_task(
-                        procesar_archivos_via_script(
-                            websocket,
-                            client_id_str,
-                            lista_rutas_cliente,
-                            TEXT_FILES_DIR if not lista_rutas_cliente else None,
-                            num_workers_cliente,
-                            concurrency_mode_cliente,
+                elif tipo_mensaje == "consultar_resultados":
+                    # Consulta paginada sobre las filas guardadas, p. ej. {"filtros": {"Country of Origin": "Sweden", "Occupation": "farmer"}}.
+                    t0 = time.perf_counter()
+                    resultado = None
+                    if ALMACEN is None:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="El almacén de resultados está desactivado en este servidor.")
+                    else:
+                        try:
+                            resultado = await asyncio.get_running_loop().run_in_executor(
+                                None, ALMACEN.consultar, data.get("filtros", {}), data.get("pagina", 1), data.get("tamano_pagina", TAMANO_PAGINA_POR_DEFECTO)
+                            )
+                        except ValueError as e_consulta:
+                            await enviar_mensaje(websocket, "error_servidor", mensaje_texto=f"Consulta inválida: {e_consulta}")
+                    if resultado is not None:
+                        resultado["duracion_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                        await enviar_mensaje(websocket, "resultado_consulta", resultado)
+
+                elif tipo_mensaje == "buscar_nombre":
+                    # Búsqueda aproximada de una persona en todas las filas extraídas, p. ej. {"consulta": "Erik Anderson"}.
+                    # Se resuelve en el bucle de eventos (el índice no es thread-safe) y tarda pocos milisegundos.
+                    t0 = time.perf_counter()
+                    consulta = data.get("consulta")
+                    limite = data.get("limite", MAX_RESULTADOS)
+                    similitud_minima = data.get("similitud_minima", SIMILITUD_MINIMA)
+                    if INDICE_NOMBRES is None:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="El índice de nombres está desactivado en este servidor.")
+                    elif not isinstance(consulta, str) or not consulta.strip():
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="Búsqueda inválida: 'consulta' debe ser un texto no vacío.")
+                    elif not isinstance(limite, int) or isinstance(limite, bool) or not 1 <= limite <= MAX_LIMITE_BUSQUEDA_NOMBRES:
+                        await enviar_mensaje(
+                            websocket, "error_servidor",
+                            mensaje_texto=f"Búsqueda inválida: 'limite' debe ser un entero entre 1 y {MAX_LIMITE_BUSQUEDA_NOMBRES}.",
                         )
-                    )
+                    elif not isinstance(similitud_minima, (int, float)) or isinstance(similitud_minima, bool) or not 0 < similitud_minima <= 1:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="Búsqueda inválida: 'similitud_minima' debe estar en (0, 1].")
+                    else:
+                        resultados = INDICE_NOMBRES.buscar(consulta, limite, similitud_minima)
+                        await enviar_mensaje(websocket, "resultado_busqueda_nombre", {
+                            "consulta": consulta,
+                            "resultados": resultados,
+                            "nombres_indexados": INDICE_NOMBRES.num_nombres(),
+                            "duracion_ms": round((time.perf_counter() - t0) * 1000, 2),
+                        })
+
+                elif tipo_mensaje in ("suscribir_analitica", "consultar_analitica"):
+                    # Agregados de todo el corpus (ver analitica_corpus.py), p. ej. {"tipo": "suscribir_analitica", "max_etiquetas": 10}.
+                    # Con suscripción, el servidor envía analitica_corpus cada INTERVALO_INSTANTANEAS_MS si hubo filas nuevas.
+                    max_etiquetas = max_etiquetas_pedidas(data)
+                    if ANALITICA is None:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="La analítica del corpus está desactivada en este servidor.")
+                    elif max_etiquetas is None:
+                        await enviar_mensaje(
+                            websocket, "error_servidor",
+                            mensaje_texto=f"Analítica inválida: 'max_etiquetas' debe ser un entero entre 1 y {MAX_ETIQUETAS_ANALITICA}.",
+                        )
+                    else:
+                        if tipo_mensaje == "suscribir_analitica":
+                            SUSCRIPTORES_ANALITICA[websocket] = {"max_etiquetas": max_etiquetas, "version": ANALITICA.version}
+                            await enviar_mensaje(
+                                websocket, "confirmacion_suscripcion_analitica",
+                                {"max_etiquetas": max_etiquetas, "intervalo_ms": INTERVALO_INSTANTANEAS_MS},
+                            )
+                        await enviar_mensaje(websocket, "analitica_corpus", ANALITICA.instantanea(max_etiquetas))
+
+                elif tipo_mensaje == "desuscribir_analitica":
+                    suscrito = SUSCRIPTORES_ANALITICA.pop(websocket, None) is not None
+                    await enviar_mensaje(websocket, "confirmacion_desuscripcion_analitica", {"estaba_suscrito": suscrito})
+
+                elif tipo_mensaje == "consultar_patrones":
+                    # Versiones de los patrones cargadas, para fijar una con "version_patrones" en una solicitud.
+                    await enviar_mensaje(websocket, "versiones_patrones", {
+                        "activa": REGISTRO_PATRONES.activo.version,
+                        "versiones": REGISTRO_PATRONES.describir(),
+                    })
+
+                elif tipo_mensaje == "configurar_prioridad_cliente":
+                    # Peso del cliente en el reparto justo del planificador (2 = el doble de capacidad que un cliente con peso 1).
+                    peso = data.get("peso")
+                    if isinstance(peso, (int, float)) and not isinstance(peso, bool) and 0 < peso <= 100:
+                        PLANIFICADOR.fijar_peso(client_id_str, float(peso))
+                        CLIENT_CONFIGS[client_id_str]["peso"] = float(peso)
+                        await enviar_mensaje(
+                            websocket, "confirmacion_config_prioridad", {"peso": float(peso)},
+                            mensaje_texto=f"Peso {peso} en la cola de trabajos confirmado.",
+                        )
+                    else:
+                        await enviar_mensaje(websocket, "error_servidor", mensaje_texto="Prioridad inválida: peso debe ser un número >0 y <=100.")
                 
                 else:
                     logging.warning(f"Tipo de mensaje desconocido de {client_id_str}: {tipo_mensaje}")
@@ -354,12 +1005,12 @@ async def manejar_cliente(websocket):
                         mensaje_texto=f"Tipo de mensaje '{tipo_mensaje}' no reconocido por el servidor.",
                     )
 
-            except json.JSONDecodeError:
-                logging.error(f"Error decodificando JSON de {client_id_str}: {message_str}")
+            except MensajeInvalido as e_formato:
+                logging.error(f"Error decodificando mensaje de {client_id_str} ({e_formato}): {message_str[:200]!r}")
                 await enviar_mensaje(
                     websocket,
                     "error_servidor",
-                    mensaje_texto="Error en el formato del mensaje (JSON inválido).",
+                    mensaje_texto=f"Error en el formato del mensaje ({e_formato}).",
                 )
             except Exception as e:
                 logging.exception(f"Error manejando mensaje de {client_id_str}: {e}")
@@ -384,6 +1035,17 @@ async def manejar_cliente(websocket):
         )
     finally:
         logging.info(f"Limpiando recursos para cliente {client_id_str}.")
+        for envio in envios.values():
+            envio.abortar()
+        if coordinador_nodos() is not None:
+            coordinador_nodos().quitar(client_id_str)  # Si era un nodo de extracción, sus archivos pasan a otros nodos.
+        if PLANIFICADOR is not None:
+            # Nadie va a recibir sus filas: sus trabajos dejan de ocupar workers y su lugar en la cola.
+            try:
+                await PLANIFICADOR.cancelar_trabajos_de(client_id_str)
+            except Exception as e_cancelar:
+                logging.error(f"Error cancelando los trabajos del cliente {client_id_str}: {e_cancelar}")
+        SUSCRIPTORES_ANALITICA.pop(websocket, None)
         if websocket in CLIENTS:
             del CLIENTS[websocket]
         if client_id_str in CLIENT_CONFIGS:
@@ -400,6 +1062,7 @@ async def manejar_cliente(websocket):
 # servidor_cli es una función que maneja la interfaz de línea de comandos del servidor.
 #Parametros: ninguno.
 async def servidor_cli():
+    global PERFILAR_PATRONES, PERFIL_PATRONES
     loop = asyncio.get_running_loop()
     logging.info("CLI del servidor WS (CSV Stream) iniciada. Escribe 'help' para ver los comandos.")
     while True:
@@ -417,6 +1080,13 @@ async def servidor_cli():
                 print("  add_event <nombre> [desc]       - Añade un nuevo evento.")
                 print("  remove_event <nombre>           - Elimina un evento.")
                 print("  trigger <nombre_evento>         - Dispara un evento a suscriptores.")
+                print("  queue                             - Muestra el estado de la cola de trabajos.")
+                print("  stats                             - Muestra las métricas operativas (también en http://localhost:%d/metrics)." % PUERTO_METRICAS)
+                print("  profile [on|off|reset|N]          - Perfilado por columna de PATRONES: activar, desactivar, borrar o ver las N más costosas.")
+                print("  watch [on|off]                    - Extrae al manifiesto las subidas nuevas en cuanto llegan (modo incremental).")
+                print("  nodes                             - Muestra los nodos de extracción (local y remotos) y su carga.")
+                print("  analytics [N]                     - Muestra los N valores más frecuentes de cada agregado del corpus.")
+                print("  patterns [reload|use <versión>]   - Versiones de los patrones: listar, cargar las nuevas de patrones/ o activar una (en caliente).")
                 print("  exit                              - Cierra el servidor WebSocket.")
             elif cmd == "list_clients":
                 if not CLIENTS:
@@ -476,6 +1146,93 @@ async def servidor_cli():
                         print(f"Nadie suscrito al evento '{event_name}'.")
                 else:
                     print(f"Error: Evento '{event_name}' no encontrado para disparar.")
+            elif cmd == "queue":
+                print(f"Planificador: {PLANIFICADOR.estado()}")
+                for posicion, (trabajo, _) in enumerate(PLANIFICADOR.orden_proyectado(), start=1):
+                    print(f"  {posicion}. Cliente {trabajo.id_cliente}: {len(trabajo.rutas_archivos) or 'directorio por defecto'} archivo(s), {trabajo.costo_estimado} bytes")
+            elif cmd == "stats":
+                resumen = METRICAS.resumen()
+                clientes = resumen.pop("clients")
+                for clave, valor in resumen.items():
+                    print(f"  {clave}: {valor}")
+                print(f"  Clientes con actividad reciente ({len(clientes)}):")
+                for id_cliente, datos in clientes.items():
+                    print(
+                        f"    - {id_cliente}: {datos['rows_per_second']} filas/s, {datos['bytes_per_second']} bytes/s, "
+                        f"{datos['rows_total']} filas en total, {datos['input_bytes_total']} bytes de texto procesados"
+                    )
+            elif cmd == "profile":
+                opcion = args[0].lower() if args else ""
+                if opcion in ("on", "off"):
+                    PERFILAR_PATRONES = opcion == "on"
+                    print(f"Perfilado de patrones {'activado' if PERFILAR_PATRONES else 'desactivado'} para las próximas solicitudes.")
+                elif opcion == "reset":
+                    PERFIL_PATRONES = PerfilPatrones()
+                    print("Perfil de patrones borrado.")
+                elif not PERFIL_PATRONES.columnas:
+                    print(f"No hay datos de perfilado (perfilado {'activado' if PERFILAR_PATRONES else 'desactivado'}; usa 'profile on').")
+                else:
+                    for linea in PERFIL_PATRONES.lineas_texto(int(opcion) if opcion.isdigit() else 10):
+                        print(f"  {linea}")
+            elif cmd == "watch":
+                opcion = args[0].lower() if args else ""
+                if POOL_EXTRACCION is None or POOL_EXTRACCION.manifiesto is None:
+                    print("El vigilante requiere el pool persistente con manifiesto (USAR_POOL_PERSISTENTE).")
+                elif opcion == "on":
+                    VIGILANTE.iniciar()
+                elif opcion == "off":
+                    await VIGILANTE.detener()
+                else:
+                    print(
+                        f"Vigilante {'activo' if VIGILANTE.activo else 'inactivo'} sobre '{UPLOADS_DIR}': {VIGILANTE.estadisticas}. "
+                        f"Manifiesto: {POOL_EXTRACCION.manifiesto.num_archivos()} archivo(s), {POOL_EXTRACCION.manifiesto.estadisticas}."
+                    )
+            elif cmd == "nodes":
+                if coordinador_nodos() is None:
+                    print("Sin coordinador de nodos (requiere el pool persistente).")
+                else:
+                    resumen = coordinador_nodos().resumen()
+                    print(f"Capacidad total: {resumen['capacity']} worker(s). Redespachados: {resumen['redispatched']}, respaldos ganadores: {resumen['winning_backups']}.")
+                    for nodo in resumen["nodes"]:
+                        print(
+                            f"  - {nodo['node']} ({nodo['name']}{', remoto' if nodo['remote'] else ''}): {nodo['capacity']} worker(s), "
+                            f"{nodo['running']} en curso, {nodo['queued']} en cola, {nodo['files']} archivo(s) / {nodo['bytes']} bytes en "
+                            f"{nodo['busy_seconds']}s, {nodo['stolen']} robado(s), {nodo['backups']} respaldo(s), {nodo['failed']} fallido(s)"
+                        )
+            elif cmd == "analytics":
+                if ANALITICA is None:
+                    print("La analítica del corpus está desactivada (ANALIZAR_CORPUS).")
+                else:
+                    instantanea = ANALITICA.instantanea(int(args[0]) if args and args[0].isdigit() else 5)
+                    print(f"Agregados de {instantanea['documentos']} documento(s) ({len(SUSCRIPTORES_ANALITICA)} suscriptor(es)):")
+                    for nombre, agregado in instantanea["agregados"].items():
+                        if "etiquetas" in agregado:
+                            print(f"  {nombre}: " + ", ".join(f"{e} {n}" for e, n in zip(agregado["etiquetas"], agregado["conteos"])))
+                        else:
+                            print(f"  {nombre} ({agregado['columna_filas']} x {agregado['columna_columnas']}): {', '.join(agregado['etiquetas_columnas'])}")
+                            for etiqueta, conteos in zip(agregado["etiquetas_filas"], agregado["conteos"]):
+                                print(f"    {etiqueta}: {conteos}")
+            elif cmd == "patterns":
+                opcion = args[0].lower() if args else ""
+                if opcion == "reload":
+                    informe = await loop.run_in_executor(None, REGISTRO_PATRONES.recargar)
+                    print(f"Versiones nuevas: {', '.join(informe['nuevas']) or 'ninguna'}; sin cambios: {', '.join(informe['sin_cambios']) or 'ninguna'}.")
+                    for version, error in informe["errores"].items():
+                        print(f"  Error en '{version}': {error}")
+                elif opcion == "use" and len(args) > 1:
+                    try:
+                        conjunto = await activar_version_patrones(args[1])
+                    except ErrorConjuntoPatrones as e_patrones:
+                        print(f"Error: {e_patrones}")
+                    else:
+                        print(f"Versión activa: {conjunto.version} ({conjunto.huella}). Los trabajos ya encolados o en curso siguen con la suya.")
+                else:
+                    for descripcion in REGISTRO_PATRONES.describir():
+                        print(
+                            f"  {'*' if descripcion['active'] else ' '} {descripcion['version']} ({descripcion['fingerprint']}): "
+                            f"{descripcion['columns']} columnas, {sum(descripcion['vocabularies'].values())} términos en "
+                            f"{len(descripcion['vocabularies'])} vocabularios. {descripcion['description']}"
+                        )
             elif cmd == "exit":
                 logging.info("Comando 'exit' recibido. Cerrando servidor...")
                 return True 
@@ -487,8 +1244,28 @@ async def servidor_cli():
         except Exception as e:
             logging.exception(f"Error en CLI del servidor: {e}")
             
+# cargar_filas_guardadas() añade al índice de nombres y a los agregados del corpus todas las filas guardadas en el
+# almacén, en una sola pasada (bloqueante).
+#Parametros: almacen que es el AlmacenResultados, indice que es el IndiceNombres y analitica que es la AnaliticaCorpus (o None).
+def cargar_filas_guardadas(almacen, indice, analitica):
+    t0 = time.perf_counter()
+    filas = 0
+    for clave, fila in almacen.iterar_filas():
+        if indice is not None:
+            indice.agregar_fila(fila, clave)
+        if analitica is not None:
+            analitica.agregar_fila(fila, clave)
+        filas += 1
+    if indice is not None:
+        logging.info(f"Índice de nombres: {indice.num_nombres()} nombre(s) de {filas} fila(s) guardadas.")
+    if analitica is not None:
+        analitica.instantanea()  # Aplica ya los conteos cargados: la primera instantánea de un cliente no paga por ellos.
+        logging.info(f"Analítica del corpus: {analitica.num_documentos()} documento(s).")
+    logging.info(f"Filas guardadas cargadas ({filas}) en {time.perf_counter() - t0:.2f}s.")
+
 # main es la función principal que inicia el servidor WebSocket y maneja la configuración inicial.
 async def main():
+    global POOL_EXTRACCION, PLANIFICADOR, VIGILANTE, ALMACEN, INDICE_NOMBRES, ANALITICA
     if not os.path.isdir(TEXT_FILES_DIR):
         logging.warning(f"El directorio por defecto de archivos de texto '{TEXT_FILES_DIR}' no existe. Creándolo...")
         try:
@@ -499,14 +1276,48 @@ async def main():
                 f"El procesamiento por defecto podría fallar."
             )
 
+    # Todas las versiones de patrones/ quedan cargadas para que las solicitudes puedan fijar cualquiera; la activa es
+    # la más reciente (ver servidor.py).
+    informe_patrones = await asyncio.get_running_loop().run_in_executor(None, REGISTRO_PATRONES.recargar)
+    for version, error in informe_patrones["errores"].items():
+        logging.error(f"No se cargó la versión de patrones '{version}': {error}")
+    logging.info(f"Patrones: activa '{REGISTRO_PATRONES.activo.version}'; cargadas: {', '.join(REGISTRO_PATRONES.versiones_cargadas())}.")
+
+    # El pool se crea (y sus procesos arrancan) antes de aceptar clientes y antes del hilo de la CLI.
+    if GUARDAR_RESULTADOS:
+        ALMACEN = AlmacenResultados()
+        ALMACEN.iniciar()
+    if INDEXAR_NOMBRES:
+        INDICE_NOMBRES = IndiceNombres()
+    if ANALIZAR_CORPUS:
+        ANALITICA = AnaliticaCorpus()
+    if ALMACEN is not None and (INDICE_NOMBRES is not None or ANALITICA is not None):
+        # Se reconstruyen desde las filas guardadas (no se persisten): aún no hay clientes que los consulten.
+        await asyncio.get_running_loop().run_in_executor(None, cargar_filas_guardadas, ALMACEN, INDICE_NOMBRES, ANALITICA)
+    PLANIFICADOR = PlanificadorTrabajos()
+    await PLANIFICADOR.iniciar()
+    if USAR_POOL_PERSISTENTE:
+        POOL_EXTRACCION = PoolExtraccion(planificador=PLANIFICADOR, almacen=ALMACEN, indice_nombres=INDICE_NOMBRES, analitica=ANALITICA)
+        await POOL_EXTRACCION.iniciar()
+        if POOL_EXTRACCION.manifiesto is not None:
+            VIGILANTE = VigilanteDirectorio(UPLOADS_DIR, POOL_EXTRACCION.manifiesto, procesar_subidas_vigiladas)
+            if VIGILAR_SUBIDAS:
+                VIGILANTE.iniciar()
+    await METRICAS.iniciar_http("localhost", PUERTO_METRICAS)
+
     # La función de manejo de cliente `manejar_cliente` es la correcta.
-    server = await websockets.serve(manejar_cliente, "localhost", 8765)
+    # max_size: los bloques de enviar_archivo_bloque pueden superar el 1 MiB por defecto de websockets.
+    server = await websockets.serve(manejar_cliente, HOST_SERVIDOR, PUERTO_SERVIDOR, compression="deflate" if COMPRESION_TRANSPORTE else None,
+                                    max_size=MAX_BYTES_DESCOMPRIMIDOS)
     logging.info(
-        f"Servidor WebSocket (CSV Stream) iniciado en ws://localhost:8765. "
+        f"Servidor WebSocket (CSV Stream) iniciado en ws://{HOST_SERVIDOR}:{PUERTO_SERVIDOR}. "
         f"Directorio TXT por defecto: {TEXT_FILES_DIR}"
     )
+    if TOKEN_NODOS is None:
+        logging.info(f"Sin token de nodos ({VARIABLE_TOKEN_NODOS} o --token-nodos): solo se aceptan nodos de extracción locales.")
     
     cli_task = asyncio.create_task(servidor_cli())
+    analitica_task = asyncio.create_task(emitir_analitica_periodicamente())
 
     try:
         # Esperar a que la tarea del CLI termine (por ejemplo, si devuelve True tras 'exit')
@@ -520,13 +1331,12 @@ async def main():
         clients_a_notificar = list(CLIENTS.keys()) # Copia para iteración segura
         if clients_a_notificar:
             payload_cierre = {"tipo": "servidor_desconectado", "mensaje": "El servidor se está cerrando."}
-            msg_cierre_str = json.dumps(payload_cierre)
             
             cierre_tasks = []
             for client_ws in clients_a_notificar:
                 try:
                     # Usamos un timeout para no esperar indefinidamente a un cliente que no responde
-                    task = asyncio.wait_for(client_ws.send(msg_cierre_str), timeout=2.0)
+                    task = asyncio.wait_for(client_ws.send(codificar_mensaje(payload_cierre, protocolo_de(client_ws))), timeout=2.0)
                     cierre_tasks.append(task)
                 except websockets.exceptions.ConnectionClosed:
                      logging.warning(f"Al intentar notificar cierre, cliente {get_client_id_from_websocket(client_ws)} ({client_ws.remote_address}) ya estaba cerrado.")
@@ -540,11 +1350,34 @@ async def main():
                     if isinstance(result, Exception):
                         logging.warning(f"Error enviando mensaje de cierre a un cliente: {result}")
         
+        analitica_task.cancel()
         server.close()
         await server.wait_closed()
+        await METRICAS.cerrar_http()
+        if VIGILANTE is not None:
+            await VIGILANTE.detener()
+        if PLANIFICADOR is not None:
+            await PLANIFICADOR.cerrar()
+        if POOL_EXTRACCION is not None:
+            await POOL_EXTRACCION.cerrar()
+        if ALMACEN is not None:
+            ALMACEN.cerrar()  # Inserta las filas que aún estuvieran en cola.
         logging.info("Servidor WebSocket completamente detenido.")
 
+# leer_argumentos() aplica las opciones de línea de comandos (dirección de escucha y token de nodos).
+def leer_argumentos(argv=None):
+    global HOST_SERVIDOR, PUERTO_SERVIDOR, TOKEN_NODOS
+    parser = argparse.ArgumentParser(description="Servidor WebSocket de extracción de archivos .txt a CSV.")
+    parser.add_argument("--host", default=HOST_SERVIDOR,
+                        help=f"Dirección en la que escuchar (por defecto {HOST_SERVIDOR}; 0.0.0.0 para aceptar nodos de otras máquinas).")
+    parser.add_argument("--puerto", type=int, default=PUERTO_SERVIDOR, help=f"Puerto del WebSocket (por defecto {PUERTO_SERVIDOR}).")
+    parser.add_argument("--token-nodos", default=TOKEN_NODOS,
+                        help=f"Token compartido que deben presentar los nodos de extracción (por defecto, la variable {VARIABLE_TOKEN_NODOS}).")
+    args = parser.parse_args(argv)
+    HOST_SERVIDOR, PUERTO_SERVIDOR, TOKEN_NODOS = args.host, args.puerto, args.token_nodos or None
+
 if __name__ == "__main__":
+    leer_argumentos()
     print(f"--- Iniciando script servidor_websockets.py (PID: {os.getpid()}) ---")
     try:
         asyncio.run(main())